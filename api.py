@@ -115,7 +115,8 @@ async def load_models():
         hybrid_captioner = HybridCaptioner(
             local_generator=local_generator,
             local_feature_extractor=local_extractor,
-            use_external_by_default=True  # Use BLIP by default for better captions
+            use_external_by_default=True,  # Use BLIP by default for better captions
+            eager_load=config.get('model_store.warmup', True)  # No cold start on first request
         )
         
         # Keep references for backward compatibility
@@ -1,8 +1,6 @@
 """Enterprise-Grade AI Image Caption Generator with Advanced Features."""
-import os
-os.environ['HF_HOME'] = 'D:/huggingface_cache'
-os.environ['TRANSFORMERS_CACHE'] = 'D:/huggingface_cache/transformers'
-os.environ['HF_DATASETS_CACHE'] = 'D:/huggingface_cache/datasets'
+from utils.model_store import configure_cache
+configure_cache()
 
 import streamlit as st
 from PIL import Image
@@ -318,7 +316,8 @@ def load_models():
         hybrid_captioner = HybridCaptioner(
             local_generator=local_generator,
             local_feature_extractor=local_extractor,
-            use_external_by_default=True
+            use_external_by_default=True,
+            eager_load=config.get('model_store.warmup', True)
         )
         
         return hybrid_captioner
@@ -1,13 +1,12 @@
 """Professional AI Image Caption Generator - Production Ready"""
-import os
-os.environ['HF_HOME'] = 'D:/huggingface_cache'
-os.environ['TRANSFORMERS_CACHE'] = 'D:/huggingface_cache/transformers'
-os.environ['HF_DATASETS_CACHE'] = 'D:/huggingface_cache/datasets'
+from utils.model_store import configure_cache
+configure_cache()
 
 import streamlit as st
 from PIL import Image
 import time
 from pathlib import Path
+from utils.config import config
 from utils.external_captioner import HybridCaptioner
 
 st.set_page_config(page_title="AI Caption Generator", page_icon="🎨", layout="wide")
@@ -201,7 +200,8 @@ def load_caption_model():
     return HybridCaptioner(
         local_generator=None,
         local_feature_extractor=None,
-        use_external_by_default=True
+        use_external_by_default=True,
+        eager_load=config.get('model_store.warmup', True)
     )
 
 def main():
@@ -6,6 +6,7 @@ from tensorflow.keras.layers import Input, Dense, LSTM, Embedding, Dropout, Add
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.utils import to_categorical
+from utils.feature_store import load_features
 
 print("Creating fresh model...")
 
@@ -53,7 +54,7 @@ with open('descriptions.txt', 'r') as f:
                 descriptions[img_id] = []
             descriptions[img_id].append(caption)
 
-features = load(open('features.pkl', 'rb'))
+features = load_features()
 
 # Prepare training data
 X1, X2, y = [], [], []
@@ -4,6 +4,8 @@ from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from numpy import argmax
 from tqdm import tqdm
+from utils.dedup import apply_aliases
+from utils.feature_store import load_features
 
 def load_doc(filename):
     file = open(filename, 'r')
@@ -35,7 +37,7 @@ def load_clean_descriptions(filename, dataset):
     return descriptions
 
 def load_photo_features(filename, dataset):
-    all_features = load(open(filename, 'rb'))
+    all_features = apply_aliases(load_features(filename))  # duplicates share a row
     features = {k: all_features[k] for k in dataset}
     return features
 
@@ -93,6 +95,6 @@ if __name__ == "__main__":
     max_length = 34
     test = load_set('data/test.txt')  # Assuming test.txt exists
     test_descriptions = load_clean_descriptions('descriptions.txt', test)
-    test_features = load_photo_features('features.pkl', test)
+    test_features = load_photo_features(None, test)  # feature store, else features.pkl
     model = load_model('model.h5')
     evaluate_model(model, test_descriptions, test_features, tokenizer, max_length)
@@ -1,20 +1,39 @@
-import numpy as np
+"""Caption images with the trained CNN-LSTM model.
+
+The CNN backbone and the caption model are loaded once. Images are decoded and
+passed through the backbone in batches (utils/feature_pipeline.py), and captions for a whole
+batch are decoded together.
+
+Usage:
+    python inference.py data/Images/1000268201_693b08cb0e.jpg
+    python inference.py data/Images --batch-size 32 --output captions.json
+
+Library:
+    from inference import Captioner
+    captions = Captioner().caption_paths(['a.jpg', 'b.jpg'])
+"""
+import json
+import os
 from pickle import load
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
 from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
-from tensorflow.keras.models import Model
+
+from utils.config import config
+from utils.feature_pipeline import FeaturePipeline
+from utils.image_utils import FeatureExtractor
+from utils.logger import logger
+from utils.model_utils import CaptionGenerator
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
 
 def extract_features(filename):
-    model = VGG16()
-    model = Model(inputs=model.inputs, outputs=model.layers[-2].output)
-    image = load_img(filename, target_size=(224, 224))
-    image = img_to_array(image)
-    image = image.reshape((1, image.shape[0], image.shape[1], image.shape[2]))
-    image = preprocess_input(image)
-    feature = model.predict(image, verbose=0)
-    return feature
+    """CNN features for one image, using the shared FeatureExtractor."""
+    return FeatureExtractor().extract_from_path(filename)
+
 
 def word_for_id(integer, tokenizer):
     for word, index in tokenizer.word_index.items():
@@ -22,6 +41,7 @@ def word_for_id(integer, tokenizer):
             return word
     return None
 
+
 def generate_desc(model, tokenizer, photo, max_length):
     in_text = 'startseq'
     for i in range(max_length):
@@ -37,10 +57,122 @@ def generate_desc(model, tokenizer, photo, max_length):
             break
     return in_text
 
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """Expand directories into the image files they contain."""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            expanded.append(path)
+    return expanded
+
+
+class Captioner:
+    """Batch captioner that loads the CNN, the caption model and tokenizer once."""
+
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        tokenizer_path: Optional[str] = None,
+        max_length: Optional[int] = None,
+        beam_width: Optional[int] = None,
+        use_beam_search: Optional[bool] = None,
+        batch_size: int = 32
+    ):
+        """Initialize captioner.
+
+        Args:
+            model_path: Caption model (defaults to paths.model_file)
+            tokenizer_path: Tokenizer pickle (defaults to paths.tokenizer_file)
+            max_length: Maximum caption length (defaults to the model's input length)
+            beam_width: Beam width (defaults to inference.beam_width)
+            use_beam_search: Beam search instead of greedy decoding
+                (defaults to inference.use_beam_search)
+            batch_size: Images per CNN forward pass and per decode batch
+        """
+        model_path = model_path or config.get('paths.model_file', 'model.h5')
+        tokenizer_path = tokenizer_path or config.get('paths.tokenizer_file', 'tokenizer.pkl')
+
+        logger.info(f"Loading caption model {model_path}...")
+        self.model = load_model(model_path)
+        with open(tokenizer_path, 'rb') as f:
+            self.tokenizer = load(f)
+
+        if max_length is None:
+            max_length = self.model.inputs[1].shape[1] or config.get('model.max_length', 34)
+
+        self.generator = CaptionGenerator(
+            self.model,
+            self.tokenizer,
+            max_length,
+            beam_width=beam_width or config.get('inference.beam_width', 3),
+            use_beam_search=(
+                config.get('inference.use_beam_search', True) if use_beam_search is None else use_beam_search
+            )
+        )
+        self.pipeline = FeaturePipeline(
+            model=FeatureExtractor()._model,
+            batch_size=batch_size,
+            target_size=tuple(config.get('preprocessing.image_size', [224, 224])),
+            fast_decode=config.get('preprocessing.fast_decode', False)
+        )
+
+    def caption_paths(self, paths: Iterable[str], progress: bool = False) -> Dict[str, str]:
+        """Caption image files.
+
+        Args:
+            paths: Image files and/or directories of images
+            progress: Show a progress bar during feature extraction
+
+        Returns:
+            Mapping of image path to caption; unreadable images map to an
+            ``"Error: ..."`` string
+        """
+        paths = expand_paths(paths)
+        features = self.pipeline.extract([(path, path) for path in paths], progress=progress)
+
+        captions = {}
+        loaded = [path for path in paths if path in features]
+        for start in range(0, len(loaded), self.pipeline.batch_size):
+            batch = loaded[start:start + self.pipeline.batch_size]
+            photos = np.concatenate([features[path] for path in batch])
+            captions.update(zip(batch, self.generator.generate_batch(photos)))
+
+        return {path: captions.get(path, "Error: could not read image") for path in paths}
+
+
 if __name__ == "__main__":
-    tokenizer = load(open('tokenizer.pkl', 'rb'))
-    max_length = 34
-    model = load_model('model.h5')
-    photo = extract_features('data/Images/1000268201_693b08cb0e.jpg')  # Example image
-    description = generate_desc(model, tokenizer, photo, max_length)
-    print(description)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Caption images with the trained model')
+    parser.add_argument('paths', nargs='+', help='Image files or directories')
+    parser.add_argument('--model', default=None, help='Caption model (default: paths.model_file)')
+    parser.add_argument('--tokenizer', default=None, help='Tokenizer pickle (default: paths.tokenizer_file)')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per batch')
+    parser.add_argument('--beam-width', type=int, default=None, help='Beam width (default: inference.beam_width)')
+    parser.add_argument('--greedy', action='store_true', help='Greedy decoding instead of beam search')
+    parser.add_argument('--output', default=None, help='Write captions to a JSON file')
+
+    args = parser.parse_args()
+
+    captioner = Captioner(
+        model_path=args.model,
+        tokenizer_path=args.tokenizer,
+        beam_width=args.beam_width,
+        use_beam_search=False if args.greedy else None,
+        batch_size=args.batch_size
+    )
+    captions = captioner.caption_paths(args.paths, progress=True)
+
+    for path, caption in captions.items():
+        print(f"{path}: {caption}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(captions, f, indent=2)
+        print(f"Captions written to {args.output}")
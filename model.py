@@ -2,25 +2,100 @@
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import (
     Input, Dense, LSTM, Embedding, Dropout, add,
-    Bidirectional, BatchNormalization, Attention
+    Bidirectional, BatchNormalization, Attention, Reshape
 )
 from tensorflow.keras.optimizers import Adam
+from tensorflow.keras import mixed_precision
 from tensorflow.keras.callbacks import (
     ModelCheckpoint, EarlyStopping, ReduceLROnPlateau, TensorBoard
 )
 from pickle import load
 from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from utils.backbones import get_backbone
 from utils.config import config
 from utils.logger import logger
 
 
+# Targets are int32 word indices, not one-hot vocab_size vectors
+SPARSE_LOSS = 'sparse_categorical_crossentropy'
+
+SEQUENCE_MODEL_NAME = 'sequence_caption_model'
+
+# Keras dtype policies selectable with model.precision. Under the mixed
+# policies layers compute in 16 bits and keep float32 variables; the output
+# softmax always runs in float32
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+
+
+def backbone_feature_dim() -> int:
+    """Image feature dimension: ``model.feature_dim`` or the backbone's own."""
+    return config.get('model.feature_dim') or get_backbone().feature_dim
+
+
+def set_precision_policy(precision: Optional[str] = None) -> str:
+    """Set the Keras global dtype policy for models built from now on.
+    
+    ``mixed_bfloat16`` uses the bfloat16 matmuls of CPUs with AVX512-BF16 or
+    AMX. ``mixed_float16`` also works, with dynamic loss scaling, which
+    Keras adds when the model is compiled.
+    
+    Args:
+        precision: One of ``PRECISIONS`` (default: model.precision)
+        
+    Returns:
+        The policy name
+    """
+    precision = precision or config.get('model.precision', 'float32')
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    mixed_precision.set_global_policy(precision)
+    logger.info(f"Precision policy: {precision}")
+    return precision
+
+
+def with_precision(model: Model, precision: Optional[str] = None) -> Model:
+    """The same trained model computing under another dtype policy.
+    
+    Rebuilds the model from its config with every layer but the output
+    softmax under ``precision`` and copies the weights over, so a float32
+    model can decode in bfloat16 (or back). Returns ``model`` itself when it
+    already uses that policy.
+    
+    Args:
+        model: Caption model
+        precision: One of ``PRECISIONS`` (default: model.precision)
+        
+    Returns:
+        Uncompiled model for inference, or ``model`` unchanged
+    """
+    precision = precision or config.get('model.precision', 'float32')
+    if model.layers[-1].dtype_policy.name == 'float32' and all(
+        layer.dtype_policy.name == precision for layer in model.layers[:-1] if layer.weights
+    ):
+        return model
+    
+    model_config = model.get_config()
+    for layer in model_config['layers']:
+        # Inputs and traced ops (e.g. the embedding mask) have no dtype policy
+        if 'dtype' in layer['config'] and layer['class_name'] != 'InputLayer' \
+                and layer['config']['name'] != model.layers[-1].name:
+            layer['config']['dtype'] = precision
+    converted = Model.from_config(model_config)
+    converted.set_weights(model.get_weights())
+    return converted
+
+
 def define_model(
     vocab_size: int,
     max_length: int,
     embedding_dim: int = 256,
     lstm_units: int = 256,
     dropout_rate: float = 0.5,
-    feature_dim: int = 4096,
+    feature_dim: Optional[int] = None,
     learning_rate: float = 0.001
 ) -> Model:
     """Define CNN-LSTM encoder-decoder model.
@@ -31,20 +106,22 @@ def define_model(
         embedding_dim: Embedding dimension
         lstm_units: Number of LSTM units
         dropout_rate: Dropout rate
-        feature_dim: Image feature dimension
+        feature_dim: Image feature dimension (defaults to the configured backbone's)
         learning_rate: Learning rate for optimizer
         
     Returns:
         Compiled Keras model
     """
     # Image feature encoder
+    feature_dim = feature_dim or backbone_feature_dim()
     inputs1 = Input(shape=(feature_dim,), name='image_features')
     fe1 = Dropout(dropout_rate)(inputs1)
     fe2 = Dense(embedding_dim, activation='relu', name='image_encoder')(fe1)
     fe3 = BatchNormalization()(fe2)
 
-    # Sequence encoder
-    inputs2 = Input(shape=(max_length,), name='text_input')
+    # Sequence encoder; any prefix length up to max_length, so batches and
+    # decoding steps are padded only as far as they need
+    inputs2 = Input(shape=(None,), name='text_input')
     se1 = Embedding(vocab_size, embedding_dim, mask_zero=True, name='embedding')(inputs2)
     se2 = Dropout(dropout_rate)(se1)
     se3 = LSTM(lstm_units, return_sequences=False, name='lstm')(se2)
@@ -54,14 +131,14 @@ def define_model(
     decoder1 = add([fe3, se4])
     decoder2 = Dense(lstm_units, activation='relu', name='decoder_dense')(decoder1)
     decoder3 = Dropout(dropout_rate)(decoder2)
-    outputs = Dense(vocab_size, activation='softmax', name='output')(decoder3)
+    outputs = Dense(vocab_size, activation='softmax', dtype='float32', name='output')(decoder3)
 
     # Create and compile model
     model = Model(inputs=[inputs1, inputs2], outputs=outputs, name='image_caption_model')
     
     optimizer = Adam(learning_rate=learning_rate)
     model.compile(
-        loss='categorical_crossentropy',
+        loss=SPARSE_LOSS,
         optimizer=optimizer,
         metrics=['accuracy']
     )
@@ -72,13 +149,275 @@ def define_model(
     return model
 
 
+def use_sparse_targets(model: Model) -> Model:
+    """Recompile a loaded model for int32 word-index targets.
+
+    Models saved before the switch were compiled with categorical
+    crossentropy on one-hot targets. Their weights and architecture are
+    unchanged, so only the loss needs replacing; the optimizer (and its
+    state) is kept.
+
+    Args:
+        model: Model returned by ``load_model``
+
+    Returns:
+        The same model, compiled with sparse categorical crossentropy
+    """
+    if model.loss != SPARSE_LOSS:
+        logger.info(f"Recompiling {model.name} with {SPARSE_LOSS} (was {model.loss})")
+        if model.name == SEQUENCE_MODEL_NAME:
+            model.compile(loss=SPARSE_LOSS, optimizer=model.optimizer, weighted_metrics=['accuracy'])
+        else:
+            model.compile(loss=SPARSE_LOSS, optimizer=model.optimizer, metrics=['accuracy'])
+    return model
+
+
+def define_sequence_model(
+    vocab_size: int,
+    max_length: int,
+    embedding_dim: int = 256,
+    lstm_units: int = 256,
+    dropout_rate: float = 0.5,
+    feature_dim: Optional[int] = None,
+    learning_rate: float = 0.001
+) -> Model:
+    """Define the teacher-forcing variant of the CNN-LSTM model.
+    
+    ``define_model`` predicts one next word from one left-padded prefix, so
+    a caption of L tokens is L - 1 samples that each re-run the LSTM. Here
+    the LSTM returns its output at every step and the softmax is applied
+    per timestep: a whole right-padded caption trains in one forward pass,
+    input token t predicting token t + 1. Padding is excluded through the
+    embedding mask and per-token sample weights (``build_sequence_dataset``).
+    
+    The layers match ``define_model``'s names and are step-wise, so the
+    trained weights convert into an ``IncrementalDecoder``.
+    
+    Args:
+        vocab_size: Size of vocabulary
+        max_length: Maximum sequence length (inputs may be shorter)
+        embedding_dim: Embedding dimension
+        lstm_units: Number of LSTM units
+        dropout_rate: Dropout rate
+        feature_dim: Image feature dimension (defaults to the configured backbone's)
+        learning_rate: Learning rate for optimizer
+        
+    Returns:
+        Compiled Keras model with (batch, length, vocab_size) outputs
+    """
+    # Image feature encoder, broadcast across timesteps
+    feature_dim = feature_dim or backbone_feature_dim()
+    inputs1 = Input(shape=(feature_dim,), name='image_features')
+    fe1 = Dropout(dropout_rate)(inputs1)
+    fe2 = Dense(embedding_dim, activation='relu', name='image_encoder')(fe1)
+    fe3 = BatchNormalization(name='image_norm')(fe2)
+    fe4 = Reshape((1, embedding_dim))(fe3)
+
+    # Sequence encoder, one output per input token (captions of any length
+    # up to max_length)
+    inputs2 = Input(shape=(None,), name='text_input')
+    se1 = Embedding(vocab_size, embedding_dim, mask_zero=True, name='embedding')(inputs2)
+    se2 = Dropout(dropout_rate)(se1)
+    se3 = LSTM(lstm_units, return_sequences=True, name='lstm')(se2)
+    se4 = BatchNormalization(name='lstm_norm')(se3)
+
+    # Time-distributed decoder (Dense applies to the last axis)
+    decoder1 = add([fe4, se4])
+    decoder2 = Dense(lstm_units, activation='relu', name='decoder_dense')(decoder1)
+    decoder3 = Dropout(dropout_rate)(decoder2)
+    outputs = Dense(vocab_size, activation='softmax', dtype='float32', name='output')(decoder3)
+
+    model = Model(inputs=[inputs1, inputs2], outputs=outputs, name=SEQUENCE_MODEL_NAME)
+    
+    optimizer = Adam(learning_rate=learning_rate)
+    model.compile(
+        loss=SPARSE_LOSS,
+        optimizer=optimizer,
+        weighted_metrics=['accuracy']
+    )
+
+    logger.info("Sequence model architecture:")
+    model.summary(print_fn=logger.info)
+    
+    return model
+
+
+class SampledSoftmaxTrainer(Model):
+    """Trains a caption model with a sampled softmax loss.
+    
+    The output ``Dense(vocab_size)`` dominates a training step once the
+    vocabulary reaches 10k words. This model shares every layer of the
+    caption model but stops at the output layer's input. Its loss scores the
+    target word against ``num_sampled`` negatives drawn from a log-uniform
+    (Zipfian) distribution (``tf.nn.sampled_softmax_loss``), using the
+    output layer's kernel and bias. Keras tokenizer ids are ordered by word
+    frequency, which is the order this sampler assumes.
+    
+    Validation steps use the exact full-softmax loss. ``save`` (also used by
+    ``ModelCheckpoint``) writes the wrapped full-softmax caption model, so
+    checkpoints decode as usual.
+    """
+    
+    def __init__(self, model: Model, num_sampled: int):
+        """Wrap a caption model and compile with its optimizer.
+        
+        Args:
+            model: Model from ``define_model`` or ``define_sequence_model``
+            num_sampled: Negative words sampled per training step
+        """
+        output = model.get_layer('output')
+        if not 0 < num_sampled < output.units:
+            raise ValueError(f"num_sampled must be between 1 and {output.units - 1}, got {num_sampled}")
+        super().__init__(model.inputs, output.input, name=f'{model.name}_sampled')
+        # Not part of the graph above; tracked so its weights are trained
+        self.output_layer = output
+        self.caption_model = model
+        self.num_sampled = num_sampled
+        self.compile(optimizer=model.optimizer)
+    
+    def compute_loss(self, x=None, y=None, y_pred=None, sample_weight=None, training=False):
+        """Sampled softmax loss in training, full softmax loss otherwise.
+        
+        Keras 3 passes ``training`` from ``train_step`` and ``test_step``;
+        other callers get the exact loss. ``y_pred`` is the output layer's
+        input, (batch, units) or, for the sequence model, (batch, length,
+        units). With sample weights the loss is the weighted mean over tokens.
+        """
+        hidden = tf.reshape(tf.cast(y_pred, tf.float32), [-1, y_pred.shape[-1]])
+        labels = tf.reshape(tf.cast(y, tf.int64), [-1, 1])
+        kernel = tf.convert_to_tensor(self.output_layer.kernel)
+        bias = tf.convert_to_tensor(self.output_layer.bias)
+        if training:
+            loss = tf.nn.sampled_softmax_loss(
+                tf.transpose(kernel), bias, labels, hidden, self.num_sampled, self.output_layer.units
+            )
+        else:
+            loss = tf.nn.sparse_softmax_cross_entropy_with_logits(labels[:, 0], tf.matmul(hidden, kernel) + bias)
+        
+        if sample_weight is None:
+            return tf.reduce_mean(loss)
+        weights = tf.reshape(tf.cast(sample_weight, tf.float32), [-1])
+        return tf.reduce_sum(loss * weights) / tf.maximum(tf.reduce_sum(weights), 1.0)
+    
+    def save(self, filepath, *args, **kwargs):
+        """Save the full-softmax caption model."""
+        return self.caption_model.save(filepath, *args, **kwargs)
+
+
+class IncrementalDecoder:
+    """Single-step inference graph built from a trained sequence model.
+    
+    The image is encoded once; each step then feeds one token and the LSTM
+    state, instead of re-running the LSTM over the whole padded prefix.
+    Layers are shared with the sequence model, except the LSTM, which is
+    rebuilt with ``return_state`` and given the trained weights.
+    """
+    
+    def __init__(self, model: Model, precision: Optional[str] = None):
+        """Build the encoder and step models.
+        
+        Args:
+            model: Model from ``define_sequence_model`` (trained or loaded)
+            precision: Dtype policy to decode in (default: the model's own)
+        """
+        if precision:
+            model = with_precision(model, precision)
+        lstm = model.get_layer('lstm')
+        self.units = lstm.units
+        self.encoder = Model(
+            model.get_layer('image_features').output,
+            model.get_layer('image_norm').output,
+            name='caption_image_encoder'
+        )
+        
+        # Length-1 sequences, so the shared sequence layers apply unchanged
+        image_in = Input(shape=(1, self.encoder.output.shape[-1]), name='encoded_image')
+        token_in = Input(shape=(1,), name='token')
+        h_in = Input(shape=(self.units,), name='state_h')
+        c_in = Input(shape=(self.units,), name='state_c')
+        
+        step_lstm = LSTM(
+            self.units, return_sequences=True, return_state=True, dtype=lstm.dtype_policy, name='lstm_step'
+        )
+        embedded = model.get_layer('embedding')(token_in)
+        out, h, c = step_lstm(embedded, initial_state=[h_in, c_in])
+        step_lstm.set_weights(lstm.get_weights())
+        
+        decoded = add([image_in, model.get_layer('lstm_norm')(out)], dtype=lstm.dtype_policy)
+        hidden = model.get_layer('decoder_dense')(decoded)
+        output = model.get_layer('output')
+        self.step_model = Model([image_in, token_in, h_in, c_in], [output(hidden), h, c], name='caption_step')
+        # Stops before the output layer, for decoding over a word shortlist
+        self.hidden_step_model = Model([image_in, token_in, h_in, c_in], [hidden, h, c], name='caption_hidden_step')
+        self.output_weights = tuple(np.asarray(w, dtype=np.float32) for w in output.get_weights())
+    
+    def encode(self, photos: np.ndarray) -> np.ndarray:
+        """Encoded image features, shape (n, embedding_dim)."""
+        return np.asarray(self.encoder(np.asarray(photos, dtype=np.float32), training=False)).astype(np.float32)
+    
+    def initial_state(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero LSTM state (h, c) for n sequences."""
+        zeros = np.zeros((n, self.units), dtype=np.float32)
+        return zeros, zeros.copy()
+    
+    def step(
+        self,
+        image: np.ndarray,
+        tokens: np.ndarray,
+        h: np.ndarray,
+        c: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Advance every sequence by one token.
+        
+        Args:
+            image: Encoded images, shape (n, embedding_dim)
+            tokens: Current token per sequence, shape (n,)
+            h: LSTM hidden state, shape (n, lstm_units)
+            c: LSTM cell state, shape (n, lstm_units)
+            
+        Returns:
+            Tuple of (next-word probabilities (n, vocab_size), h, c)
+        """
+        return self._run(self.step_model, image, tokens, h, c)
+    
+    def step_hidden(
+        self,
+        image: np.ndarray,
+        tokens: np.ndarray,
+        h: np.ndarray,
+        c: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Like ``step``, but returns the output layer's input instead of probabilities.
+        
+        Projecting it onto a few candidate words (``output_weights``) skips
+        most of the vocabulary-sized output layer.
+        
+        Returns:
+            Tuple of (hidden (n, lstm_units), h, c)
+        """
+        return self._run(self.hidden_step_model, image, tokens, h, c)
+    
+    @staticmethod
+    def _run(step_model: Model, image, tokens, h, c) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """One step of a step model on length-1 sequences, as float32 arrays."""
+        out, h, c = step_model(
+            [image[:, np.newaxis], np.asarray(tokens, dtype=np.int32).reshape(-1, 1), h, c],
+            training=False
+        )
+        return (
+            np.asarray(out)[:, 0].astype(np.float32),
+            np.asarray(h).astype(np.float32),
+            np.asarray(c).astype(np.float32)
+        )
+
+
 def define_model_with_attention(
     vocab_size: int,
     max_length: int,
     embedding_dim: int = 256,
     lstm_units: int = 256,
     dropout_rate: float = 0.5,
-    feature_dim: int = 4096,
+    feature_dim: Optional[int] = None,
     learning_rate: float = 0.001
 ) -> Model:
     """Define CNN-LSTM model with attention mechanism.
@@ -89,20 +428,21 @@ def define_model_with_attention(
         embedding_dim: Embedding dimension
         lstm_units: Number of LSTM units
         dropout_rate: Dropout rate
-        feature_dim: Image feature dimension
+        feature_dim: Image feature dimension (defaults to the configured backbone's)
         learning_rate: Learning rate for optimizer
         
     Returns:
         Compiled Keras model with attention
     """
     # Image feature encoder
+    feature_dim = feature_dim or backbone_feature_dim()
     inputs1 = Input(shape=(feature_dim,), name='image_features')
     fe1 = Dropout(dropout_rate)(inputs1)
     fe2 = Dense(embedding_dim, activation='relu')(fe1)
     fe3 = BatchNormalization()(fe2)
 
     # Sequence encoder with bidirectional LSTM
-    inputs2 = Input(shape=(max_length,), name='text_input')
+    inputs2 = Input(shape=(None,), name='text_input')
     se1 = Embedding(vocab_size, embedding_dim, mask_zero=True)(inputs2)
     se2 = Dropout(dropout_rate)(se1)
     se3 = Bidirectional(LSTM(lstm_units // 2, return_sequences=True))(se2)
@@ -113,13 +453,13 @@ def define_model_with_attention(
     decoder1 = add([fe3, se5])
     decoder2 = Dense(lstm_units, activation='relu')(decoder1)
     decoder3 = Dropout(dropout_rate)(decoder2)
-    outputs = Dense(vocab_size, activation='softmax')(decoder3)
+    outputs = Dense(vocab_size, activation='softmax', dtype='float32')(decoder3)
 
     model = Model(inputs=[inputs1, inputs2], outputs=outputs, name='attention_caption_model')
     
     optimizer = Adam(learning_rate=learning_rate)
     model.compile(
-        loss='categorical_crossentropy',
+        loss=SPARSE_LOSS,
         optimizer=optimizer,
         metrics=['accuracy']
     )
@@ -165,11 +505,20 @@ def get_callbacks(checkpoint_dir: str = 'checkpoints') -> list:
         ),
         TensorBoard(
             log_dir='logs',
-            histogram_freq=1,
+            # Weight histograms cost a pass over every layer each time
+            histogram_freq=config.get('training.histogram_freq', 0),
             write_graph=True
         )
     ]
     
+    if config.get('training.profile', False):
+        from utils.training_profiler import ThroughputProfiler
+        callbacks.append(ThroughputProfiler(
+            f'{checkpoint_dir}/throughput.json',
+            profile_steps=config.get('training.profile_steps'),
+            profile_dir='logs/profile'
+        ))
+    
     return callbacks
 
 
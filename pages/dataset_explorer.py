@@ -10,9 +10,22 @@ from collections import Counter
 import random
 
 from utils.config import config
+from utils.feature_store import FeatureStore, load_features
 from utils.logger import logger
 
 
+@st.cache_resource
+def load_image_features():
+    """Open image features (memory-mapped store, or legacy pickle)."""
+    try:
+        return load_features()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading features: {e}")
+        return None
+
+
 def load_descriptions():
     """Load descriptions from file."""
     descriptions = {}
@@ -98,6 +111,22 @@ def show_overview(descriptions):
     with col4:
         st.metric("📊 Avg Words/Caption", f"{avg_words_per_caption:.1f}")
     
+    features = load_image_features()
+    if features is not None:
+        covered = sum(1 for image_id in descriptions if image_id in features)
+        feature_dim = next(iter(features.values())).shape[-1] if len(features) else 0
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("🧠 Images with Features", f"{covered:,} / {total_images:,}")
+        with col2:
+            st.metric("📐 Feature Dimension", f"{feature_dim:,}")
+        with col3:
+            if isinstance(features, FeatureStore):
+                st.metric("💾 Feature Store", f"{features.matrix.nbytes / 1024 ** 2:,.0f} MB")
+            else:
+                st.metric("💾 Feature Format", "Legacy pickle")
+    
     st.divider()
     
     # Caption length distribution
@@ -290,6 +319,15 @@ def show_caption_browser(descriptions):
         
         for i, caption in enumerate(captions, 1):
             st.markdown(f"{i}. *{caption}*")
+        
+        features = load_image_features()
+        if features is not None and selected_id in features:
+            vector = np.asarray(features[selected_id]).reshape(-1)
+            st.markdown(
+                f"**Features**: {vector.shape[0]} dims, "
+                f"mean {vector.mean():.3f}, max {vector.max():.3f}, "
+                f"{(vector > 0).mean():.0%} active"
+            )
     
     st.divider()
     
@@ -1,30 +1,155 @@
+"""Extract CNN features for every image in a directory.
+
+The CNN is the backbone selected by model.backbone in config.yaml (VGG16 fc2
+by default, see utils/backbones.py).
+
+Images are decoded on a thread pool and fed to the CNN in batches through a
+bounded prefetch queue (see utils/feature_pipeline.py). Features are written to
+the memory-mapped feature store (utils/feature_store.py); --pickle also
+writes the legacy features.pkl layout {image_id: (1, feature_dim) float32}.
+--codec stores the features compressed (utils/feature_codecs.py).
+
+Runs are incremental: an extraction manifest in the store records every
+file's size, mtime and hash, so only new or changed images are extracted,
+deleted images are dropped, and progress is checkpointed in chunks
+(utils/extraction_manifest.py). Use --full to rebuild from scratch.
+
+Duplicate images (byte-identical or near-identical by perceptual hash) are
+extracted once; the duplicate -> canonical id mapping is written to
+paths.dedup_file and resolved when features are loaded (utils/dedup.py).
+Hashes are kept in the same file, so re-runs only hash new or changed images.
+
+--directory may also be a .zip or .tar(.gz) archive: images are streamed out
+of it without unpacking (utils/image_archive.py).
+
+--processes N shards the images across N worker processes, each with its own
+model and a pinned thread budget (utils/sharded_extraction.py).
+"""
 import os
-import pickle
-from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
-from tensorflow.keras.models import Model
-from tqdm import tqdm
-
-def extract_features(directory):
-    model = VGG16()
-    model = Model(inputs=model.inputs, outputs=model.layers[-2].output)
-    print(model.summary())
-
-    features = dict()
-    for name in tqdm(os.listdir(directory)):
-        filename = os.path.join(directory, name)
-        image = load_img(filename, target_size=(224, 224))
-        image = img_to_array(image)
-        image = image.reshape((1, image.shape[0], image.shape[1], image.shape[2]))
-        image = preprocess_input(image)
-        feature = model.predict(image, verbose=0)
+
+from utils.backbones import BACKBONES, get_backbone
+from utils.config import config
+from utils.dedup import find_duplicates, load_file_hashes, save_aliases
+from utils.extraction_manifest import update_feature_store
+from utils.feature_codecs import CODECS
+from utils.feature_pipeline import FeaturePipeline, verify_parity
+from utils.feature_store import FeatureStore, convert_store_to_pickle
+from utils.image_archive import is_archive, list_archive_images
+from utils.sharded_extraction import ShardedExtractor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_images(directory):
+    """List (image_id, path) pairs for the images in a directory or archive."""
+    if is_archive(directory):
+        return list_archive_images(directory)
+    items = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
         image_id = name.split('.')[0]
-        features[image_id] = feature
-        print('>%s' % name)
-    return features
+        items.append((image_id, os.path.join(directory, name)))
+    return items
+
+
+def make_pipeline(batch_size=32, num_workers=4, prefetch_batches=2, fast_decode=None):
+    """Build the feature pipeline for the configured backbone and image size."""
+    if fast_decode is None:
+        fast_decode = config.get('preprocessing.fast_decode', False)
+    return FeaturePipeline(
+        batch_size=batch_size,
+        num_workers=num_workers,
+        prefetch_batches=prefetch_batches,
+        target_size=tuple(config.get('preprocessing.image_size', [224, 224])),
+        fast_decode=fast_decode
+    )
+
 
 if __name__ == "__main__":
-    directory = 'data/Images/'
-    features = extract_features(directory)
-    print('Extracted Features: %d' % len(features))
-    pickle.dump(features, open('features.pkl', 'wb'))
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Extract CNN image features')
+    parser.add_argument('--directory', default=config.get('data.images_dir', 'data/Images'), help='Image directory, or a .zip/.tar archive of images')
+    parser.add_argument('--output', default=config.get('paths.feature_store', 'features_store'), help='Output feature store')
+    parser.add_argument('--pickle', default=None, nargs='?', const=config.get('paths.features_file', 'features.pkl'), help='Also write a legacy pickle')
+    parser.add_argument('--backbone', choices=list(BACKBONES), default=None, help='CNN backbone (default: model.backbone)')
+    parser.add_argument('--codec', choices=list(CODECS), default=None, help='Storage codec for a new store (default: preprocessing.feature_codec)')
+    parser.add_argument('--pca-dim', type=int, default=None, help='Output dimension for --codec pca')
+    parser.add_argument('--full', action='store_true', help='Ignore the extraction manifest, re-extract everything and refit the codec')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help='Images per checkpoint chunk')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass (1 = bit-identical to the old script)')
+    parser.add_argument('--workers', type=int, default=4, help='Decode threads')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes for sharded extraction')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads per process (default: cores / processes)')
+    parser.add_argument('--prefetch', type=int, default=2, help='Batches decoded ahead of the model')
+    parser.add_argument('--fast-decode', action='store_true', default=None, help='JPEG draft-mode decode into reused buffers')
+    parser.add_argument('--dedup', dest='dedup', action='store_true', default=None, help='Extract one copy of duplicate images (default: preprocessing.dedup)')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false', help='Extract every image, duplicates included')
+    parser.add_argument('--dedup-distance', type=int, default=None, help='Also merge near duplicates whose dHashes differ by at most this many bits (default: preprocessing.dedup_max_distance)')
+    parser.add_argument('--verify', type=int, default=0, help='Compare N images with per-image extraction')
+
+    args = parser.parse_args()
+    if args.backbone:
+        config.set('model.backbone', args.backbone)
+
+    items = list_images(args.directory)
+    print(f"Found {len(items)} images in {args.directory}")
+
+    dedup = None
+    if args.dedup if args.dedup is not None else config.get('preprocessing.dedup', True):
+        dedup = find_duplicates(items, args.dedup_distance, known=None if args.full else load_file_hashes())
+        save_aliases(dedup)
+        items = [(image_id, path) for image_id, path in items if image_id not in dedup.aliases]
+        print(f"Deduplicated: {dedup.exact} exact and {dedup.near} near duplicates, {len(items)} images to extract")
+
+    if args.processes > 1:
+        extractor = ShardedExtractor(
+            num_processes=args.processes,
+            threads_per_process=args.threads,
+            batch_size=args.batch_size,
+            decode_workers=args.workers,
+            target_size=tuple(config.get('preprocessing.image_size', [224, 224])),
+            fast_decode=args.fast_decode or config.get('preprocessing.fast_decode', False),
+            backbone=get_backbone().name
+        )
+    else:
+        extractor = make_pipeline(args.batch_size, args.workers, args.prefetch, args.fast_decode)
+    stats = update_feature_store(
+        items,
+        args.output,
+        extractor,
+        checkpoint_every=args.checkpoint_every,
+        full=args.full,
+        codec_name=args.codec,
+        pca_dim=args.pca_dim,
+        backbone=get_backbone().name
+    )
+    print('Extracted Features: %d (%d unchanged, %d removed)' % (stats['extracted'], stats['unchanged'], stats['removed']))
+
+    if dedup is not None and dedup.aliases:
+        store = FeatureStore(args.output)
+        throughput = extractor.stats.get('images_per_second')
+        report = dedup.report(
+            store.feature_dim,
+            bytes_per_value=store.matrix.dtype.itemsize,
+            seconds_per_image=1.0 / throughput if throughput else None
+        )
+        saved_time = report['extraction_seconds_saved']
+        print(
+            f"Dedup saved {report['bytes_saved'] / 1024 ** 2:.1f} MB of features"
+            + (f" and ~{saved_time:.0f}s of extraction" if saved_time else "")
+            + f" (hashing took {report['hash_seconds']:.1f}s)"
+        )
+
+    if args.verify:
+        # Fresh in-memory features: the store may hold them lossily encoded
+        pipeline = extractor if isinstance(extractor, FeaturePipeline) else make_pipeline(
+            args.batch_size, args.workers, args.prefetch, args.fast_decode
+        )
+        sample = items[:args.verify]
+        max_diff = verify_parity(pipeline, sample, pipeline.extract(sample, progress=False))
+        print(f"Parity vs per-image extraction on {len(sample)} images: max |diff| = {max_diff:.3g}")
+
+    if args.pickle:
+        convert_store_to_pickle(args.output, args.pickle)
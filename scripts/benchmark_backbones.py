@@ -0,0 +1,161 @@
+"""Compare the CNN backbones for feature extraction.
+
+Each backbone runs in its own subprocess so model load time and peak memory
+are measured from a clean interpreter. The report gives load time, per-image
+latency, batched throughput and peak RSS. With --retrain every backbone also
+gets its own feature store (features_store_<backbone>) and caption model
+(model_<backbone>.h5), and test-set BLEU is reported.
+
+Usage:
+    python scripts/benchmark_backbones.py --runs 20
+    python scripts/benchmark_backbones.py --backbones vgg16 mobilenet_v2 --retrain --epochs 5
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.backbones import BACKBONES  # noqa: E402
+from utils.config import config  # noqa: E402
+
+
+def retrain(name: str, epochs: int, limit: int) -> dict:
+    """Extract a store for one backbone, train a caption model on it and score it."""
+    from preprocess_images import list_images, make_pipeline
+    from scripts.feature_codec_report import bleu
+    from tensorflow.keras.models import load_model
+    from train_improved import train_model
+    from utils.data_utils import load_clean_descriptions, load_set
+    from utils.extraction_manifest import update_feature_store
+    from utils.feature_store import FeatureStore
+
+    store_path = str(ROOT / f"features_store_{name}")
+    model_path = str(ROOT / f"model_{name}.h5")
+    config.set('paths.feature_store', store_path)
+    config.set('paths.model_file', model_path)
+    config.set('training.epochs', epochs)
+
+    items = list_images(config.get('data.images_dir', 'data/Images'))
+    update_feature_store(items, store_path, make_pipeline(), backbone=name)
+    train_model()
+
+    test_ids = load_set(config.get('data.test_split', 'data/test.txt'))
+    descriptions = load_clean_descriptions(config.get('paths.descriptions_file', 'descriptions.txt'), test_ids)
+    return bleu(load_model(model_path), FeatureStore(store_path), descriptions, limit)
+
+
+def run_worker(name: str, images: list, runs: int, batch_size: int, epochs: int, limit: int) -> dict:
+    """Measure one backbone in the current process."""
+    config.set('model.backbone', name)
+
+    from utils.feature_pipeline import FeaturePipeline
+    from utils.image_utils import FeatureExtractor
+    from utils.training_profiler import peak_rss_mb
+
+    start = time.perf_counter()
+    extractor = FeatureExtractor()
+    load_seconds = time.perf_counter() - start
+
+    # First call includes graph tracing and lazy allocations
+    extractor.extract_from_path(images[0])
+
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        extractor.extract_from_path(images[i % len(images)])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+
+    pipeline = FeaturePipeline(model=extractor._model, batch_size=batch_size)
+    batch_items = [(str(i), images[i % len(images)]) for i in range(max(batch_size * 4, len(images)))]
+    pipeline.extract(batch_items, progress=False)
+
+    peak_rss = peak_rss_mb()
+    result = {
+        "backbone": name,
+        "feature_dim": int(extractor._model.outputs[0].shape[-1]),
+        "params_m": round(extractor._model.count_params() / 1e6, 1),
+        "load_s": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "images_per_second": round(pipeline.stats["images_per_second"], 1),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+    }
+    if epochs:
+        result.update(retrain(name, epochs, limit))
+    return result
+
+
+def run_benchmark(backbones: list, images: list, runs: int, batch_size: int, epochs: int, limit: int) -> list:
+    """Run every backbone in a fresh subprocess."""
+    results = []
+    for name in backbones:
+        print(f"Benchmarking {name}...")
+        proc = subprocess.run(
+            [
+                sys.executable, __file__, "--worker", name, "--runs", str(runs),
+                "--batch-size", str(batch_size), "--epochs", str(epochs), "--limit", str(limit),
+                "--images", *images
+            ],
+            capture_output=True,
+            text=True,
+            cwd=str(ROOT)
+        )
+        if proc.returncode != 0:
+            print(f"  ✗ failed: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def print_report(results: list) -> None:
+    """Print a side-by-side table of the benchmark results."""
+    header = (
+        f"{'backbone':<20}{'dim':>6}{'params M':>10}{'load s':>8}{'p50 ms':>8}{'p95 ms':>8}"
+        f"{'img/s':>8}{'peak MB':>9}{'BLEU-1':>8}{'BLEU-4':>8}"
+    )
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['backbone']:<20}{r['feature_dim']:>6}{r['params_m']:>10}{r['load_s']:>8}{r['p50_ms']:>8}"
+            f"{r['p95_ms']:>8}{r['images_per_second']:>8}{r['peak_rss_mb'] or '-':>9}"
+            f"{r.get('BLEU-1', float('nan')):>8.4f}{r.get('BLEU-4', float('nan')):>8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark CNN backbones for feature extraction')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--backbones', nargs='+', choices=list(BACKBONES), default=list(BACKBONES))
+    parser.add_argument('--images', nargs='+', default=[str(p) for p in sorted((ROOT / 'samples').glob('*.jpg'))])
+    parser.add_argument('--runs', type=int, default=10, help='Timed single-image runs per backbone')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass for throughput')
+    parser.add_argument('--retrain', action='store_true', help='Extract, train and score BLEU for every backbone')
+    parser.add_argument('--epochs', type=int, default=5, help='Training epochs with --retrain')
+    parser.add_argument('--limit', type=int, default=500, help='Test images used for BLEU')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.images, args.runs, args.batch_size, args.epochs, args.limit)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    epochs = args.epochs if args.retrain else 0
+    results = run_benchmark(args.backbones, args.images, args.runs, args.batch_size, epochs, args.limit)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
@@ -0,0 +1,121 @@
+"""Speed-up of multi-worker CPU training against the worker count.
+
+For each worker count the benchmark starts a local cluster
+(``utils/distributed.py``). Every worker trains on its shard of a synthetic
+Flickr8k-shaped dataset at a fixed per-worker batch size, and the report
+gives the global samples/s and the speed-up over one worker. Each worker
+also records a checksum of its final trainable weights, which must agree
+across workers because every replica applies the same all-reduced
+gradients. (BatchNormalization moving statistics are not trainable and
+stay per-worker.)
+
+Usage:
+    python scripts/benchmark_distributed.py --workers 1 2 4 --steps 50
+    python scripts/benchmark_distributed.py --workers 1 2 --synthetic 200 --architecture sequence
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.config import config  # noqa: E402
+from utils.distributed import launch_local_workers, shard_ids, worker_info  # noqa: E402
+
+
+def run_worker(args) -> None:
+    """One worker: train on its shard and write its throughput and weight checksum."""
+    import tensorflow as tf
+
+    from model import define_model, define_sequence_model
+    from scripts.benchmark_input_pipeline import synthetic_data
+    from utils.distributed import DistributedTrainer
+    from utils.input_pipeline import build_dataset, build_sequence_dataset
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    index, num_workers = worker_info()
+    sequence = args.architecture == 'sequence'
+    max_length = config.get('model.max_length', 34)
+
+    descriptions, photos, tokenizer = synthetic_data(args.synthetic, feature_dim=args.feature_dim)
+    own = {image_id: descriptions[image_id] for image_id in shard_ids(descriptions, index, num_workers)}
+
+    with strategy.scope():
+        tf.keras.utils.set_random_seed(0)
+        define = define_sequence_model if sequence else define_model
+        model = define(
+            len(tokenizer.word_index) + 1, max_length,
+            embedding_dim=args.units, lstm_units=args.units, feature_dim=args.feature_dim
+        )
+    trainer = DistributedTrainer(strategy, model, args.batch_size * num_workers, sequence=sequence)
+    build = build_sequence_dataset if sequence else build_dataset
+    data = trainer.distribute(lambda: build(
+        own, photos, tokenizer, max_length, args.batch_size, bucket_boundaries=[], repeat=True
+    ))
+
+    # The first epoch traces the step function and warms up the collectives
+    history = trainer.fit(data, epochs=args.epochs + 1, steps_per_epoch=args.steps)
+    result = {
+        "worker": index,
+        "workers": num_workers,
+        "samples_per_second": float(np.mean(history['samples_per_second'][1:])),
+        "loss": history['loss'][-1],
+        "weights_checksum": float(sum(np.asarray(w, dtype=np.float64).sum() for w in model.trainable_weights)),
+    }
+    with open(Path(args.output_dir) / f"worker_{index}.json", 'w') as f:
+        json.dump(result, f)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark multi-worker training speed-up')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to compare')
+    parser.add_argument('--synthetic', type=int, default=400, help='Synthetic images')
+    parser.add_argument('--architecture', choices=['merge', 'sequence'], default='merge')
+    parser.add_argument('--batch-size', type=int, default=32, help='Per-worker batch size')
+    parser.add_argument('--steps', type=int, default=50, help='Steps per timed epoch')
+    parser.add_argument('--epochs', type=int, default=1, help='Timed epochs (after one warm-up epoch)')
+    parser.add_argument('--feature-dim', type=int, default=4096)
+    parser.add_argument('--units', type=int, default=256, help='Embedding and LSTM units')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+    parser.add_argument('--output-dir', default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.output_dir:
+        run_worker(args)
+        raise SystemExit(0)
+
+    report = []
+    for num_workers in args.workers:
+        with tempfile.TemporaryDirectory() as output_dir:
+            worker_argv = [str(Path(__file__).resolve())] + sys.argv[1:] + ['--output-dir', output_dir]
+            if launch_local_workers(num_workers, worker_argv):
+                raise SystemExit(f"Benchmark with {num_workers} workers failed")
+            results = [json.load(open(path)) for path in sorted(Path(output_dir).glob('worker_*.json'))]
+
+        report.append({
+            "workers": num_workers,
+            "samples_per_second": results[0]["samples_per_second"],
+            "loss": results[0]["loss"],
+            "weights_in_sync": len({round(r["weights_checksum"], 4) for r in results}) == 1,
+        })
+
+    baseline = report[0]["samples_per_second"] / report[0]["workers"]
+    print(f"\n{'workers':>7} {'samples/s':>10} {'speed-up':>9} {'efficiency':>11} {'in sync':>8}")
+    for row in report:
+        row["speedup"] = row["samples_per_second"] / baseline
+        print(
+            f"{row['workers']:>7} {row['samples_per_second']:>10.0f} {row['speedup']:>8.2f}x "
+            f"{row['speedup'] / row['workers']:>11.0%} {str(row['weights_in_sync']):>8}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
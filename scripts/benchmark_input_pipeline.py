@@ -0,0 +1,126 @@
+"""Step-time breakdown of the training input pipelines.
+
+For the Python generator and the tf.data pipeline the benchmark times
+``model.fit`` over the same number of steps. It then times the model alone
+on a batch already in memory (``train_on_batch``). The difference is the
+time each step spends waiting for input.
+
+Usage:
+    python scripts/benchmark_input_pipeline.py --steps 200
+    python scripts/benchmark_input_pipeline.py --synthetic 2000 --steps 200
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from pickle import load
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from model import define_model  # noqa: E402
+from train_improved import data_generator, load_photo_features  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.data_utils import load_clean_descriptions, load_set  # noqa: E402
+from utils.input_pipeline import build_dataset  # noqa: E402
+
+
+def synthetic_data(images: int, feature_dim: int = 4096, vocab: int = 3000):
+    """Random captions and features shaped like Flickr8k."""
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(vocab)]
+    descriptions = {
+        f"img{i}": [
+            'startseq ' + ' '.join(rng.choice(words, rng.integers(5, 20))) + ' endseq' for _ in range(5)
+        ]
+        for i in range(images)
+    }
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([c for captions in descriptions.values() for c in captions])
+    photos = {image_id: rng.random((1, feature_dim), dtype=np.float32) for image_id in descriptions}
+    return descriptions, photos, tokenizer
+
+
+def training_data():
+    """The configured training split."""
+    tokenizer = load(open(config.get('paths.tokenizer_file', 'tokenizer.pkl'), 'rb'))
+    train_ids = load_set(config.get('data.train_split', 'data/train.txt'))
+    descriptions = load_clean_descriptions(config.get('paths.descriptions_file', 'descriptions.txt'), train_ids)
+    return descriptions, load_photo_features(None, train_ids), tokenizer
+
+
+def time_fit(model, data, steps: int) -> float:
+    """Seconds per step of ``model.fit`` (after a few warm-up steps)."""
+    model.fit(data, epochs=1, steps_per_epoch=5, verbose=0)
+    start = time.perf_counter()
+    model.fit(data, epochs=1, steps_per_epoch=steps, verbose=0)
+    return (time.perf_counter() - start) / steps
+
+
+def time_compute(model, batch, steps: int) -> float:
+    """Seconds per training step on a batch already in memory."""
+    inputs, targets = batch
+    model.train_on_batch(inputs, targets)
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch(inputs, targets)
+    return (time.perf_counter() - start) / steps
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark training input pipelines')
+    parser.add_argument('--steps', type=int, default=200, help='Timed training steps per pipeline')
+    parser.add_argument('--batch-size', type=int, default=None, help='Batch size (default: training.batch_size)')
+    parser.add_argument('--synthetic', type=int, default=0, help='Use N synthetic images instead of the train split')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+    batch_size = args.batch_size or config.get('training.batch_size', 32)
+    max_length = config.get('model.max_length', 34)
+
+    descriptions, photos, tokenizer = synthetic_data(args.synthetic) if args.synthetic else training_data()
+    vocab_size = len(tokenizer.word_index) + 1
+    feature_dim = next(iter(photos.values())).shape[-1]
+
+    # The generator batches images and tf.data batches triples, so time the
+    # generator at the triples-per-batch it actually yields
+    generator = data_generator(descriptions, photos, tokenizer, max_length, vocab_size, batch_size)
+    triples_per_batch = int(np.mean([len(next(generator)[1]) for _ in range(20)]))
+    pipelines = {
+        "generator": (generator, triples_per_batch),
+        "tf.data": (build_dataset(descriptions, photos, tokenizer, max_length, triples_per_batch).repeat(), triples_per_batch),
+    }
+
+    report = []
+    for name, (data, samples) in pipelines.items():
+        model = define_model(vocab_size, max_length, feature_dim=feature_dim)
+        step = time_fit(model, data, args.steps)
+        batch = next(iter(data)) if name == "tf.data" else next(data)
+        compute = time_compute(model, batch, args.steps)
+        report.append({
+            "pipeline": name,
+            "samples_per_step": samples,
+            "step_ms": step * 1000,
+            "compute_ms": compute * 1000,
+            "input_wait_ms": max(step - compute, 0.0) * 1000,
+            "input_wait_fraction": max(step - compute, 0.0) / step,
+            "samples_per_second": samples / step,
+        })
+
+    print(f"\n{'pipeline':<10} {'step ms':>8} {'compute ms':>11} {'input wait ms':>14} {'wait %':>7} {'samples/s':>10}")
+    for row in report:
+        print(
+            f"{row['pipeline']:<10} {row['step_ms']:>8.1f} {row['compute_ms']:>11.1f} "
+            f"{row['input_wait_ms']:>14.1f} {row['input_wait_fraction']:>7.0%} {row['samples_per_second']:>10.0f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
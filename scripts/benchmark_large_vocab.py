@@ -0,0 +1,205 @@
+"""Speed and quality of sampled softmax training and shortlist decoding.
+
+The benchmark builds a synthetic dataset with a large vocabulary (10k words
+by default) in which images fall into topics: an image's features sit near
+its topic's centre and its captions mix common words with the topic's own
+words. That is the structure the decoding shortlist exploits.
+
+Training: the configured architecture is trained once with the full
+softmax loss and once with ``SampledSoftmaxTrainer``. The report gives
+training samples/s, timed on one in-memory batch so that input loading
+does not blur the loss's cost, and the held-out full-softmax loss and
+accuracy of each.
+
+Decoding (sequence architecture): the full-softmax model decodes the
+held-out images over the whole vocabulary and over a shortlist fitted on
+the training images. The report gives images/s, the share of identical
+captions and the shortlist's coverage of the held-out reference tokens.
+With --model, a trained sequence model is also decoded on the test split
+with and without ``paths.shortlist_file`` and scored with BLEU.
+
+Usage:
+    python scripts/benchmark_large_vocab.py --vocab 10000 --num-sampled 256
+    python scripts/benchmark_large_vocab.py --model model.keras --limit 500
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from model import SampledSoftmaxTrainer, define_model, define_sequence_model  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.input_pipeline import build_dataset, build_sequence_dataset  # noqa: E402
+from utils.model_utils import CaptionGenerator  # noqa: E402
+from utils.shortlist import Shortlist  # noqa: E402
+
+
+def topic_data(images: int, vocab: int, topics: int = 20, common: int = 50, feature_dim: int = 512):
+    """Synthetic captions and features with per-topic vocabularies."""
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    rng = np.random.default_rng(0)
+    common_words = [f"c{i}" for i in range(common)]
+    topic_words = np.array_split([f"w{i}" for i in range(vocab - common)], topics)
+    centres = rng.normal(size=(topics, feature_dim)).astype(np.float32)
+
+    descriptions, photos = {}, {}
+    for i in range(images):
+        topic = i % topics
+        captions = []
+        for _ in range(5):
+            length = rng.integers(5, 16)
+            # Skewed ranks within the topic, so some topic words are frequent
+            ranks = (len(topic_words[topic]) * rng.random(length) ** 2).astype(int)
+            words = [
+                rng.choice(common_words) if rng.random() < 0.4 else topic_words[topic][rank] for rank in ranks
+            ]
+            captions.append('startseq ' + ' '.join(words) + ' endseq')
+        descriptions[f"img{i}"] = captions
+        photos[f"img{i}"] = (centres[topic] + 0.5 * rng.normal(size=feature_dim)).astype(np.float32)[np.newaxis]
+
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([c for captions in descriptions.values() for c in captions])
+    return descriptions, photos, tokenizer
+
+
+def time_step(trainer, batch, steps: int) -> float:
+    """Seconds per training step on a batch already in memory (after warm-up)."""
+    inputs, targets, *weights = batch
+    sample_weight = weights[0] if weights else None
+    for _ in range(3):
+        trainer.train_on_batch(inputs, targets, sample_weight=sample_weight)
+    start = time.perf_counter()
+    for _ in range(steps):
+        trainer.train_on_batch(inputs, targets, sample_weight=sample_weight)
+    return (time.perf_counter() - start) / steps
+
+
+def decode(generator: CaptionGenerator, photos: np.ndarray):
+    """Captions for a batch of images and images/s."""
+    generator.generate_batch(photos[:2])
+    start = time.perf_counter()
+    captions = generator.generate_batch(photos)
+    return captions, len(photos) / (time.perf_counter() - start)
+
+
+def test_split_bleu(model_path: str, shortlist: bool, limit: int) -> dict:
+    """BLEU of a trained sequence model on the test split, with or without the shortlist."""
+    from tensorflow.keras.models import load_model
+
+    from scripts.feature_codec_report import bleu
+    from utils.data_utils import load_clean_descriptions, load_set
+    from utils.feature_store import FeatureStore
+
+    config.set('inference.shortlist', shortlist)
+    test_ids = load_set(config.get('data.test_split', 'data/test.txt'))
+    descriptions = load_clean_descriptions(config.get('paths.descriptions_file', 'descriptions.txt'), test_ids)
+    store = FeatureStore(config.get('paths.feature_store', 'features_store'))
+    return bleu(load_model(model_path), store, descriptions, limit)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark sampled softmax training and shortlist decoding')
+    parser.add_argument('--architecture', choices=['merge', 'sequence'], default='sequence')
+    parser.add_argument('--vocab', type=int, default=10000, help='Synthetic vocabulary size')
+    parser.add_argument('--synthetic', type=int, default=2000, help='Synthetic images (80%% train, 20%% held out)')
+    parser.add_argument('--num-sampled', type=int, default=256, help='Negative words per sampled softmax step')
+    parser.add_argument('--epochs', type=int, default=3, help='Training epochs per loss')
+    parser.add_argument('--steps', type=int, default=50, help='Timed training steps')
+    parser.add_argument('--batch-size', type=int, default=None, help='Batch size (default: training.batch_size)')
+    parser.add_argument('--size', type=int, default=config.get('inference.shortlist_size', 500), help='Shortlist words per image')
+    parser.add_argument('--clusters', type=int, default=config.get('inference.shortlist_clusters', 64))
+    parser.add_argument('--beam-width', type=int, default=1, help='Beam width for decoding (1 = greedy)')
+    parser.add_argument('--model', default=None, help='Trained sequence model for test-split BLEU')
+    parser.add_argument('--limit', type=int, default=500, help='Test images used for BLEU')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+    batch_size = args.batch_size or config.get('training.batch_size', 32)
+    max_length = config.get('model.max_length', 34)
+    sequence = args.architecture == 'sequence'
+    define = define_sequence_model if sequence else define_model
+    build = build_sequence_dataset if sequence else build_dataset
+
+    descriptions, photos, tokenizer = topic_data(args.synthetic, args.vocab)
+    vocab_size = len(tokenizer.word_index) + 1
+    feature_dim = next(iter(photos.values())).shape[-1]
+    ids = sorted(descriptions)
+    held_out = set(ids[::5])
+    train = {i: descriptions[i] for i in ids if i not in held_out}
+    val = {i: descriptions[i] for i in ids if i in held_out}
+
+    # Full-length captions, so the timed step is the worst case for the output layer
+    timing_batch = next(iter(build(train, photos, tokenizer, max_length, batch_size, bucket_boundaries=[])))
+    train_data = build(train, photos, tokenizer, max_length, batch_size)
+    val_data = build(val, photos, tokenizer, max_length, batch_size, shuffle=False)
+
+    report = {"vocab_size": vocab_size, "training": [], "decoding": []}
+    models = {}
+    for loss in ('full', 'sampled'):
+        model = define(vocab_size, max_length, feature_dim=feature_dim)
+        trainer = SampledSoftmaxTrainer(model, args.num_sampled) if loss == 'sampled' else model
+        step = time_step(trainer, timing_batch, args.steps)
+        trainer.fit(train_data, epochs=args.epochs, verbose=0)
+        val_loss, val_accuracy = model.evaluate(val_data, verbose=0)
+        report["training"].append({
+            "loss": loss if loss == 'full' else f"sampled ({args.num_sampled})",
+            "train_samples_per_second": batch_size / step,
+            "val_loss": float(val_loss),
+            "val_accuracy": float(val_accuracy),
+        })
+        models[loss] = model
+
+    if sequence:
+        shortlist = Shortlist.fit(train, photos, tokenizer, size=args.size, clusters=args.clusters)
+        coverage = shortlist.coverage(val, photos, tokenizer)
+        val_photos = np.concatenate([photos[i] for i in sorted(val)])
+        reference_captions = None
+        for name, words in (('full vocabulary', None), (f'shortlist ({shortlist.size})', shortlist)):
+            generator = CaptionGenerator(
+                models['full'], tokenizer, max_length, beam_width=args.beam_width,
+                use_beam_search=args.beam_width > 1, shortlist=words
+            )
+            captions, images_per_second = decode(generator, val_photos)
+            reference_captions = reference_captions or captions
+            report["decoding"].append({
+                "decoding": name,
+                "decode_images_per_second": images_per_second,
+                "caption_match": float(np.mean([a == b for a, b in zip(captions, reference_captions)])),
+                "reference_coverage": 1.0 if words is None else coverage,
+            })
+
+    if args.model:
+        report["test_bleu"] = {
+            "full vocabulary": test_split_bleu(args.model, False, args.limit),
+            "shortlist": test_split_bleu(args.model, True, args.limit),
+        }
+
+    print(f"\nVocabulary: {vocab_size} words")
+    print(f"\n{'loss':<15} {'train samples/s':>16} {'val loss':>9} {'val acc':>8}")
+    for row in report["training"]:
+        print(
+            f"{row['loss']:<15} {row['train_samples_per_second']:>16.0f} "
+            f"{row['val_loss']:>9.3f} {row['val_accuracy']:>8.1%}"
+        )
+    if report["decoding"]:
+        print(f"\n{'decoding':<18} {'img/s':>8} {'same caption':>13} {'ref. coverage':>14}")
+        for row in report["decoding"]:
+            print(
+                f"{row['decoding']:<18} {row['decode_images_per_second']:>8.1f} "
+                f"{row['caption_match']:>13.0%} {row['reference_coverage']:>14.1%}"
+            )
+    for name, scores in report.get("test_bleu", {}).items():
+        print(f"test split, {name}: " + ', '.join(f"{k} {v:.4f}" for k, v in scores.items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
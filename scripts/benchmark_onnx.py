@@ -0,0 +1,172 @@
+"""Benchmark ONNX Runtime against eager PyTorch for the caption models.
+
+Each (backend, model) pair runs in its own subprocess so startup time and
+peak memory are measured from a clean interpreter.
+
+Usage:
+    python scripts/export_onnx.py --output models/onnx
+    python scripts/benchmark_onnx.py --onnx-dir models/onnx --runs 20
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MODELS = ("blip", "vit-gpt2")
+BACKENDS = ("torch", "onnx")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None if unavailable.
+
+    ``resource`` is Unix-only (Linux reports KB); elsewhere psutil is used
+    when installed (peak working set on Windows, else the current RSS).
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_captioner(backend: str, model: str, onnx_dir: str):
+    """Build a caption function for one backend/model pair."""
+    if backend == "onnx":
+        from utils.external_captioner import ExternalCaptioner
+
+        captioner = ExternalCaptioner(backend="onnx", onnx_dir=str(Path(onnx_dir) / model))
+        captioner._lazy_load()
+        return lambda image, beams: captioner.generate_caption(image, num_beams=beams)[0]
+
+    if model == "blip":
+        from utils.external_captioner import ExternalCaptioner
+
+        captioner = ExternalCaptioner(backend="torch")
+        captioner._lazy_load()
+        return lambda image, beams: captioner.generate_caption(image, num_beams=beams)[0]
+
+    from utils.pretrained_caption import PretrainedCaptioner
+
+    captioner = PretrainedCaptioner()
+    return lambda image, beams: captioner.generate_caption(image, num_beams=beams)
+
+
+def run_worker(backend: str, model: str, onnx_dir: str, images: list, runs: int, beams: int) -> dict:
+    """Measure one backend/model pair in the current process."""
+    from PIL import Image
+
+    start = time.perf_counter()
+    caption_fn = _load_captioner(backend, model, onnx_dir)
+    startup = time.perf_counter() - start
+
+    loaded = [Image.open(path).convert('RGB') for path in images]
+
+    # First call includes lazy allocations and graph warmup
+    start = time.perf_counter()
+    caption_fn(loaded[0], beams)
+    first_call = time.perf_counter() - start
+
+    latencies = []
+    captions = {}
+    for i in range(runs):
+        image = loaded[i % len(loaded)]
+        start = time.perf_counter()
+        caption = caption_fn(image, beams)
+        latencies.append(time.perf_counter() - start)
+        captions[images[i % len(images)]] = caption
+
+    latencies = np.array(latencies) * 1000
+    peak_rss = _peak_rss_mb()
+    return {
+        "backend": backend,
+        "model": model,
+        "startup_s": round(startup, 3),
+        "first_call_ms": round(first_call * 1000, 1),
+        "mean_ms": round(float(latencies.mean()), 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "captions": captions,
+    }
+
+
+def run_benchmark(onnx_dir: str, images: list, runs: int, beams: int) -> list:
+    """Run every backend/model pair in a fresh subprocess."""
+    results = []
+    for model in MODELS:
+        for backend in BACKENDS:
+            print(f"Benchmarking {model} on {backend}...")
+            proc = subprocess.run(
+                [
+                    sys.executable, __file__, "--worker", backend, model,
+                    "--onnx-dir", onnx_dir, "--runs", str(runs), "--beams", str(beams),
+                    "--images", *images
+                ],
+                capture_output=True,
+                text=True,
+                cwd=str(ROOT)
+            )
+            if proc.returncode != 0:
+                print(f"  ✗ failed: {proc.stderr.strip().splitlines()[-1:]}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def print_report(results: list) -> None:
+    """Print a side-by-side table of the benchmark results."""
+    header = f"{'model':<10}{'backend':<8}{'startup s':>11}{'first ms':>10}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'peak MB':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['model']:<10}{r['backend']:<8}{r['startup_s']:>11}{r['first_call_ms']:>10}"
+            f"{r['mean_ms']:>10}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['peak_rss_mb'] or '-':>10}"
+        )
+
+    for model in MODELS:
+        pair = {r['backend']: r for r in results if r['model'] == model}
+        if len(pair) == 2:
+            speedup = pair['torch']['mean_ms'] / pair['onnx']['mean_ms']
+            print(f"\n{model}: onnx is {speedup:.2f}x torch mean latency")
+            for image, caption in pair['torch']['captions'].items():
+                print(f"  {Path(image).name}: torch='{caption}' onnx='{pair['onnx']['captions'].get(image)}'")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark ONNX Runtime vs PyTorch captioners')
+    parser.add_argument('--worker', nargs=2, metavar=('BACKEND', 'MODEL'), help=argparse.SUPPRESS)
+    parser.add_argument('--onnx-dir', default='models/onnx', help='ONNX export root')
+    parser.add_argument('--images', nargs='+', default=[str(p) for p in sorted((ROOT / 'samples').glob('*.jpg'))])
+    parser.add_argument('--runs', type=int, default=10, help='Timed runs per backend')
+    parser.add_argument('--beams', type=int, default=3, help='Beam width for all backends')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker[0], args.worker[1], args.onnx_dir, args.images, args.runs, args.beams)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    results = run_benchmark(args.onnx_dir, args.images, args.runs, args.beams)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
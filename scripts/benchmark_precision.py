@@ -0,0 +1,135 @@
+"""Throughput and BLEU parity of float32 versus mixed-precision caption models.
+
+For each precision policy the benchmark builds the configured architecture
+under that policy. It reports training samples/s on synthetic data and
+greedy-decoding images/s. Parity is measured on one set of weights (the
+first policy's model) run under each policy: next-word top-1 agreement and
+the largest probability difference on a batch of training inputs, and the
+share of identical greedy captions. With --model, a trained model is also
+decoded under each policy on the test split and scored with BLEU against
+the reference captions.
+
+Usage:
+    python scripts/benchmark_precision.py --steps 50
+    python scripts/benchmark_precision.py --architecture sequence --model model.keras --limit 500
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from model import PRECISIONS, define_model, define_sequence_model, set_precision_policy, with_precision  # noqa: E402
+from scripts.benchmark_input_pipeline import synthetic_data, time_fit  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.input_pipeline import build_dataset, build_sequence_dataset  # noqa: E402
+from utils.model_utils import CaptionGenerator  # noqa: E402
+
+
+def decode(model, tokenizer, photos: np.ndarray, max_length: int, precision: str):
+    """Greedy captions for a batch of images under a precision, and images/s."""
+    generator = CaptionGenerator(model, tokenizer, max_length, use_beam_search=False, precision=precision)
+    generator.generate_batch(photos[:2])
+    start = time.perf_counter()
+    captions = generator.generate_batch(photos)
+    return captions, len(photos) / (time.perf_counter() - start)
+
+
+def prediction_parity(reference, precision: str, batch) -> dict:
+    """Top-1 agreement and max probability difference of the reference model under a precision."""
+    inputs, targets, *weights = batch
+    expected = reference.predict(inputs, verbose=0)
+    actual = with_precision(reference, precision).predict(inputs, verbose=0)
+    valid = np.asarray(weights[0]) > 0 if weights else np.ones(expected.shape[:-1], dtype=bool)
+    return {
+        "top1_agreement": float((expected.argmax(-1) == actual.argmax(-1))[valid].mean()),
+        "max_prob_diff": float(np.abs(expected - actual)[valid].max()),
+    }
+
+
+def test_split_bleu(model_path: str, precision: str, limit: int) -> dict:
+    """BLEU of a trained model decoded under a precision on the test split."""
+    from tensorflow.keras.models import load_model
+
+    from scripts.feature_codec_report import bleu
+    from utils.data_utils import load_clean_descriptions, load_set
+    from utils.feature_store import FeatureStore
+
+    config.set('model.precision', precision)
+    test_ids = load_set(config.get('data.test_split', 'data/test.txt'))
+    descriptions = load_clean_descriptions(config.get('paths.descriptions_file', 'descriptions.txt'), test_ids)
+    store = FeatureStore(config.get('paths.feature_store', 'features_store'))
+    return bleu(load_model(model_path), store, descriptions, limit)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark mixed-precision training and decoding')
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=['float32', 'mixed_bfloat16'])
+    parser.add_argument('--architecture', choices=['merge', 'sequence'], default=config.get('model.architecture', 'merge'))
+    parser.add_argument('--synthetic', type=int, default=400, help='Synthetic images for the throughput runs')
+    parser.add_argument('--steps', type=int, default=50, help='Timed training steps')
+    parser.add_argument('--batch-size', type=int, default=None, help='Batch size (default: training.batch_size)')
+    parser.add_argument('--decode-images', type=int, default=64, help='Images greedily decoded per run')
+    parser.add_argument('--model', default=None, help='Trained model for test-split BLEU per precision')
+    parser.add_argument('--limit', type=int, default=500, help='Test images used for BLEU')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+    batch_size = args.batch_size or config.get('training.batch_size', 32)
+    max_length = config.get('model.max_length', 34)
+    sequence = args.architecture == 'sequence'
+    define = define_sequence_model if sequence else define_model
+    build = build_sequence_dataset if sequence else build_dataset
+
+    descriptions, photos, tokenizer = synthetic_data(args.synthetic)
+    vocab_size = len(tokenizer.word_index) + 1
+    dataset = build(descriptions, photos, tokenizer, max_length, batch_size, bucket_boundaries=[], repeat=True)
+    decode_photos = np.concatenate([photos[image_id] for image_id in list(photos)[:args.decode_images]])
+
+    batch = next(iter(dataset))
+    report, reference_model, reference_captions = [], None, None
+    for precision in args.precisions:
+        set_precision_policy(precision)
+        model = define(vocab_size, max_length)
+        step = time_fit(model, dataset, args.steps)
+        if reference_model is None:
+            # Decoding parity is judged on one set of (float32-built) weights
+            reference_model = model
+        captions, images_per_second = decode(reference_model, tokenizer, decode_photos, max_length, precision)
+        if reference_captions is None:
+            reference_captions = captions
+
+        row = {
+            "precision": precision,
+            "train_samples_per_second": batch_size / step,
+            "decode_images_per_second": images_per_second,
+            "caption_match": float(np.mean([a == b for a, b in zip(captions, reference_captions)])),
+            **prediction_parity(reference_model, precision, batch),
+        }
+        if args.model:
+            row["test_bleu"] = test_split_bleu(args.model, precision, args.limit)
+        report.append(row)
+    set_precision_policy('float32')
+
+    print(
+        f"\n{'precision':<15} {'train samples/s':>16} {'decode img/s':>13} "
+        f"{'top-1 agree':>12} {'max dp':>8} {'same caption':>13}"
+    )
+    for row in report:
+        print(
+            f"{row['precision']:<15} {row['train_samples_per_second']:>16.0f} {row['decode_images_per_second']:>13.1f} "
+            f"{row['top1_agreement']:>12.1%} {row['max_prob_diff']:>8.4f} {row['caption_match']:>13.0%}"
+        )
+        if 'test_bleu' in row:
+            print(f"{'':<15} test split: " + ', '.join(f"{k} {v:.4f}" for k, v in row['test_bleu'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,74 @@
+"""Measure how feature extraction scales with the number of worker processes.
+
+Every worker count runs on the same image sample. The report shows
+throughput, speedup and parallel efficiency (speedup / processes, relative to
+the smallest count), both wall-clock and for extraction alone (excluding
+process spawn and model loading).
+
+Usage:
+    python scripts/benchmark_sharded_extraction.py --processes 1 2 4 8 --limit 512
+"""
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from preprocess_images import list_images  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.sharded_extraction import ShardedExtractor, scaling_report  # noqa: E402
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark sharded feature extraction')
+    parser.add_argument('--directory', default=config.get('data.images_dir', 'data/Images'), help='Image directory')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to compare')
+    parser.add_argument('--threads', type=int, default=None, help='Threads per worker (default: cores / processes)')
+    parser.add_argument('--limit', type=int, default=512, help='Images per run')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+
+    items = list_images(args.directory)[:args.limit]
+    print(f"Benchmarking on {len(items)} images from {args.directory}")
+
+    results = []
+    for processes in args.processes:
+        extractor = ShardedExtractor(
+            num_processes=processes,
+            threads_per_process=args.threads,
+            batch_size=args.batch_size,
+            target_size=tuple(config.get('preprocessing.image_size', [224, 224]))
+        )
+        extractor.extract(items)
+        results.append({
+            "processes": extractor.stats["processes"],
+            "threads_per_process": extractor.stats["threads_per_process"],
+            "seconds": extractor.stats["seconds"],
+            "images_per_second": extractor.stats["images_per_second"],
+            "model_load_seconds": extractor.stats["model_load_seconds"],
+            "extraction_images_per_second": extractor.stats["extraction_images_per_second"],
+        })
+
+    report = scaling_report(results)
+    print(f"\n{'':>13} {'wall clock':^29} {'extraction only':^29}")
+    print(
+        f"{'procs':>5} {'threads':>7} {'img/s':>8} {'speedup':>8} {'efficiency':>11} "
+        f"{'img/s':>8} {'speedup':>8} {'efficiency':>11} {'load s':>7}"
+    )
+    for row in report:
+        print(
+            f"{row['processes']:>5} {row['threads_per_process']:>7} {row['images_per_second']:>8.1f} "
+            f"{row['speedup']:>7.2f}x {row['efficiency']:>11.0%} "
+            f"{row['extraction_images_per_second']:>8.1f} {row['extraction_speedup']:>7.2f}x "
+            f"{row['extraction_efficiency']:>11.0%} {row['model_load_seconds']:>7.1f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
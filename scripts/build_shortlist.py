@@ -0,0 +1,53 @@
+"""Fit the per-image decoding shortlist on the training split.
+
+Clusters the training image features and ranks each cluster's caption
+words (``utils/shortlist.py``), saves the result to ``paths.shortlist_file``
+and reports the shortlist's coverage of the reference captions: the share
+of reference tokens of each split that are in their image's shortlist.
+Set ``inference.shortlist: true`` to decode sequence models with it.
+
+Usage:
+    python scripts/build_shortlist.py
+    python scripts/build_shortlist.py --size 1000 --clusters 128
+"""
+import sys
+from pathlib import Path
+from pickle import load
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from train_improved import load_photo_features  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.data_utils import load_clean_descriptions, load_set  # noqa: E402
+from utils.shortlist import Shortlist  # noqa: E402
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the decoding shortlist')
+    parser.add_argument('--size', type=int, default=config.get('inference.shortlist_size', 500), help='Candidate words per image')
+    parser.add_argument('--clusters', type=int, default=config.get('inference.shortlist_clusters', 64), help='k-means clusters')
+    parser.add_argument('--output', default=config.get('paths.shortlist_file', 'shortlist.npz'), help='Shortlist file')
+
+    args = parser.parse_args()
+    tokenizer = load(open(config.get('paths.tokenizer_file', 'tokenizer.pkl'), 'rb'))
+    descriptions_file = config.get('paths.descriptions_file', 'descriptions.txt')
+
+    splits = {}
+    for split in ('train', 'val', 'test'):
+        split_file = config.get(f'data.{split}_split', f'data/{split}.txt')
+        if Path(split_file).exists():
+            ids = load_set(split_file)
+            splits[split] = (load_clean_descriptions(descriptions_file, ids), load_photo_features(None, ids))
+    if 'train' not in splits:
+        raise SystemExit("Training split not found; create the train/test split files first")
+
+    shortlist = Shortlist.fit(*splits['train'], tokenizer, size=args.size, clusters=args.clusters)
+    shortlist.save(args.output)
+
+    vocab_size = len(tokenizer.word_index) + 1
+    print(f"\n{shortlist.size} of {vocab_size} words per image ({shortlist.size / vocab_size:.1%})")
+    for split, (descriptions, photos) in splits.items():
+        print(f"{split:<6} reference tokens in shortlist: {shortlist.coverage(descriptions, photos, tokenizer):.1%}")
@@ -0,0 +1,40 @@
+"""Convert between the legacy features.pkl and the memory-mapped feature store."""
+import pickle
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.config import config  # noqa: E402
+from utils.feature_codecs import CODECS, codec_from_config  # noqa: E402
+from utils.feature_store import FeatureStore, convert_store_to_pickle  # noqa: E402
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert image feature formats')
+    parser.add_argument(
+        'direction',
+        choices=['to-store', 'to-pickle'],
+        help='to-store: features.pkl -> store, to-pickle: store -> features.pkl'
+    )
+    parser.add_argument('--pickle', default=config.get('paths.features_file', 'features.pkl'), help='Legacy pickle path')
+    parser.add_argument('--store', default=config.get('paths.feature_store', 'features_store'), help='Feature store directory')
+    parser.add_argument('--codec', choices=list(CODECS), default=None, help='Storage codec (default: preprocessing.feature_codec)')
+    parser.add_argument('--pca-dim', type=int, default=None, help='Output dimension for --codec pca')
+
+    args = parser.parse_args()
+
+    if args.direction == 'to-store':
+        with open(args.pickle, 'rb') as f:
+            features = pickle.load(f)
+        codec = codec_from_config(features, name=args.codec, pca_dim=args.pca_dim)
+        store = FeatureStore.create(args.store, features, metadata={"source": args.pickle}, codec=codec)
+        print(
+            f"✅ {args.pickle} -> {args.store} ({len(store)} x {store.feature_dim} {codec.name}, "
+            f"{store.nbytes / 1024 ** 2:.1f} MB)"
+        )
+    else:
+        convert_store_to_pickle(args.store, args.pickle)
+        print(f"✅ {args.store} -> {args.pickle} ({len(FeatureStore(args.store))} images)")
@@ -1,4 +1,9 @@
-"""Script to download and prepare Flickr8k dataset."""
+"""Script to download and prepare Flickr8k dataset.
+
+With --no-extract the image zip is left packed: preprocess_images.py streams
+images straight out of it (utils/image_archive.py), which avoids a second
+copy of the dataset on disk and the unpack step.
+"""
 import os
 import zipfile
 import requests
@@ -31,8 +36,13 @@ def extract_zip(zip_path: str, extract_to: str):
     print("Extraction complete!")
 
 
-def setup_dataset():
-    """Setup Flickr8k dataset."""
+def setup_dataset(extract_images: bool = True):
+    """Setup Flickr8k dataset.
+
+    Args:
+        extract_images: Unpack the image zip (False leaves it packed for
+            streaming extraction)
+    """
     # Create data directory
     data_dir = Path('data')
     data_dir.mkdir(exist_ok=True)
@@ -55,8 +65,10 @@ def setup_dataset():
     dataset_zip = data_dir / 'Flickr8k_Dataset.zip'
     text_zip = data_dir / 'Flickr8k_text.zip'
     
-    if dataset_zip.exists():
+    if dataset_zip.exists() and extract_images:
         extract_zip(str(dataset_zip), str(data_dir))
+    elif dataset_zip.exists():
+        print(f"\nLeaving {dataset_zip} packed; images are read from it directly")
     else:
         print(f"\n❌ {dataset_zip} not found")
     
@@ -68,9 +80,18 @@ def setup_dataset():
     print("\n✅ Setup complete!")
     print("\nNext steps:")
     print("1. Run: python preprocess_captions.py")
-    print("2. Run: python preprocess_images.py")
+    if extract_images:
+        print("2. Run: python preprocess_images.py")
+    else:
+        print(f"2. Run: python preprocess_images.py --directory {dataset_zip}")
     print("3. Run: python train_improved.py")
 
 
 if __name__ == "__main__":
-    setup_dataset()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Prepare the Flickr8k dataset')
+    parser.add_argument('--no-extract', action='store_true', help='Keep the image zip packed and stream from it')
+
+    args = parser.parse_args()
+    setup_dataset(extract_images=not args.no_extract)
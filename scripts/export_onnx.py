@@ -0,0 +1,212 @@
+"""Export BLIP and ViT-GPT2 caption models to ONNX.
+
+Each model is split into three graphs so the decoder can reuse its
+key/value cache at inference time:
+
+- encoder_model.onnx:            pixel_values -> encoder_hidden_states
+- decoder_model.onnx:            first step, no past
+- decoder_with_past_model.onnx:  later steps, consumes past_key_values.*
+
+The graphs are loaded by ``utils.onnx_captioner.OnnxCaptionModel``.
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.onnx_captioner import (  # noqa: E402
+    CONFIG_FILE, DECODER_FILE, DECODER_WITH_PAST_FILE, ENCODER_FILE
+)
+
+MODELS = {
+    "blip": "Salesforce/blip-image-captioning-base",
+    "vit-gpt2": "nlpconnect/vit-gpt2-image-captioning",
+}
+
+
+def _load_model(model_name: str):
+    """Load a caption model and its preprocessing objects.
+
+    Returns:
+        Tuple of (architecture, model, encoder, decoder, savers, token_ids)
+    """
+    if "blip" in model_name.lower():
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+
+        model = BlipForConditionalGeneration.from_pretrained(model_name)
+        processor = BlipProcessor.from_pretrained(model_name)
+        text_config = model.config.text_config
+        token_ids = {
+            "decoder_start_token_id": text_config.bos_token_id,
+            "eos_token_id": text_config.sep_token_id,
+            "pad_token_id": text_config.pad_token_id,
+        }
+        return "blip", model, model.vision_model, model.text_decoder, [processor], token_ids
+
+    from transformers import AutoTokenizer, ViTImageProcessor, VisionEncoderDecoderModel
+
+    model = VisionEncoderDecoderModel.from_pretrained(model_name)
+    processor = ViTImageProcessor.from_pretrained(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    decoder_config = model.decoder.config
+    eos = model.config.eos_token_id or decoder_config.eos_token_id
+    token_ids = {
+        "decoder_start_token_id": model.config.decoder_start_token_id or decoder_config.bos_token_id,
+        "eos_token_id": eos,
+        "pad_token_id": model.config.pad_token_id or eos,
+    }
+    return "vision-encoder-decoder", model, model.encoder, model.decoder, [processor, tokenizer], token_ids
+
+
+def export_model(model_name: str, output_dir: str, opset: int = 14) -> Path:
+    """Export a caption model to encoder / decoder / decoder-with-past graphs.
+
+    Args:
+        model_name: Hugging Face model name
+        output_dir: Directory to write the ONNX graphs to
+        opset: ONNX opset version
+
+    Returns:
+        Path to the export directory
+    """
+    import torch
+
+    architecture, model, encoder, decoder, savers, token_ids = _load_model(model_name)
+    model.eval()
+
+    # ViT-GPT2 style models project encoder states when hidden sizes differ
+    projection = getattr(model, "enc_to_dec_proj", None)
+
+    class EncoderWrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = encoder
+            self.projection = projection
+
+        def forward(self, pixel_values):
+            hidden = self.encoder(pixel_values=pixel_values, return_dict=False)[0]
+            if self.projection is not None:
+                hidden = self.projection(hidden)
+            return hidden
+
+    class DecoderWrapper(torch.nn.Module):
+        def __init__(self, num_layers):
+            super().__init__()
+            self.decoder = decoder
+            self.num_layers = num_layers
+
+        def forward(self, input_ids, encoder_hidden_states, *past):
+            past_key_values = None
+            if past:
+                past_key_values = tuple(
+                    (past[2 * i], past[2 * i + 1]) for i in range(self.num_layers)
+                )
+            outputs = self.decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True
+            )
+            presents = [t for layer in outputs.past_key_values for t in layer[:2]]
+            return (outputs.logits, *presents)
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    image_size = encoder.config.image_size
+    pixel_values = torch.randn(1, 3, image_size, image_size)
+    input_ids = torch.tensor([[token_ids["decoder_start_token_id"]]], dtype=torch.long)
+
+    with torch.no_grad():
+        encoder_wrapper = EncoderWrapper()
+        encoder_states = encoder_wrapper(pixel_values)
+
+        num_layers = decoder.config.num_hidden_layers if architecture == "blip" else decoder.config.n_layer
+        decoder_wrapper = DecoderWrapper(num_layers)
+        first = decoder_wrapper(input_ids, encoder_states)
+        past = list(first[1:])
+
+    past_names = [f"past_key_values.{i}.{k}" for i in range(num_layers) for k in ("key", "value")]
+    present_names = [f"present.{i}.{k}" for i in range(num_layers) for k in ("key", "value")]
+    cache_axes = {0: "batch", 2: "past_sequence"}
+
+    print(f"Exporting {model_name} encoder...")
+    torch.onnx.export(
+        encoder_wrapper,
+        (pixel_values,),
+        str(output_path / ENCODER_FILE),
+        input_names=["pixel_values"],
+        output_names=["encoder_hidden_states"],
+        dynamic_axes={
+            "pixel_values": {0: "batch"},
+            "encoder_hidden_states": {0: "batch", 1: "encoder_sequence"},
+        },
+        opset_version=opset
+    )
+
+    common_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "encoder_hidden_states": {0: "batch", 1: "encoder_sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+        **{name: {0: "batch", 2: "total_sequence"} for name in present_names},
+    }
+
+    print(f"Exporting {model_name} decoder...")
+    torch.onnx.export(
+        decoder_wrapper,
+        (input_ids, encoder_states),
+        str(output_path / DECODER_FILE),
+        input_names=["input_ids", "encoder_hidden_states"],
+        output_names=["logits", *present_names],
+        dynamic_axes=common_axes,
+        opset_version=opset
+    )
+
+    print(f"Exporting {model_name} decoder with past...")
+    torch.onnx.export(
+        decoder_wrapper,
+        (input_ids, encoder_states, *past),
+        str(output_path / DECODER_WITH_PAST_FILE),
+        input_names=["input_ids", "encoder_hidden_states", *past_names],
+        output_names=["logits", *present_names],
+        dynamic_axes={**common_axes, **{name: cache_axes for name in past_names}},
+        opset_version=opset
+    )
+
+    for saver in savers:
+        saver.save_pretrained(output_path)
+
+    export_config = {
+        "model_name": model_name,
+        "architecture": architecture,
+        "num_layers": num_layers,
+        "opset": opset,
+        **token_ids,
+    }
+    with open(output_path / CONFIG_FILE, 'w') as f:
+        json.dump(export_config, f, indent=2)
+
+    print(f"✅ Exported {model_name} to {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export caption models to ONNX')
+    parser.add_argument(
+        '--model',
+        choices=list(MODELS) + ['all'],
+        default='all',
+        help='Model to export'
+    )
+    parser.add_argument('--output', default='models/onnx', help='Output directory')
+    parser.add_argument('--opset', type=int, default=14, help='ONNX opset version')
+
+    args = parser.parse_args()
+
+    selected = MODELS if args.model == 'all' else {args.model: MODELS[args.model]}
+    for key, name in selected.items():
+        export_model(name, str(Path(args.output) / key), opset=args.opset)
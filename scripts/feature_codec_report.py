@@ -0,0 +1,125 @@
+"""Report the size / accuracy trade-off of the feature storage codecs.
+
+For every codec the report gives the stored size, the compression ratio, the
+reconstruction error against the raw features and, when a trained caption
+model is supplied, test-set BLEU with features read back through the codec.
+
+PCA changes the model's input dimension, so its BLEU needs a model trained
+on a PCA store (``--pca-model``); float16 and int8 are scored with the model
+trained on raw features.
+
+Usage:
+    python scripts/feature_codec_report.py --model model.h5
+    python scripts/feature_codec_report.py --model model.h5 --pca-model model_pca256.h5 --pca-dim 256
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+from pickle import load
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.config import config  # noqa: E402
+from utils.data_utils import load_clean_descriptions, load_set  # noqa: E402
+from utils.feature_codecs import CODECS, codec_from_config  # noqa: E402
+from utils.feature_store import FeatureStore, load_features  # noqa: E402
+
+
+def reconstruction_error(codec, store: FeatureStore, raw: np.ndarray, ids) -> float:
+    """Mean relative L2 error of stored features against raw features."""
+    decoded = store.rows(ids)
+    if codec.name == "pca":
+        decoded = decoded @ codec.components + codec.mean
+    errors = np.linalg.norm(decoded - raw, axis=1) / np.maximum(np.linalg.norm(raw, axis=1), 1e-12)
+    return float(errors.mean())
+
+
+def bleu(model, store: FeatureStore, descriptions, limit: int) -> dict:
+    """Greedy-decode the test split from the store and score it."""
+    from utils.evaluation import calculate_bleu_scores
+    from utils.model_utils import CaptionGenerator
+
+    tokenizer = load(open(config.get('paths.tokenizer_file', 'tokenizer.pkl'), 'rb'))
+    generator = CaptionGenerator(
+        model, tokenizer, config.get('model.max_length', 34), use_beam_search=False
+    )
+
+    references, hypotheses = [], []
+    for image_id in [i for i in descriptions if i in store][:limit]:
+        caption = generator.generate(np.array(store[image_id]))
+        hypotheses.append(caption.split())
+        references.append([
+            d.replace('startseq', '').replace('endseq', '').split() for d in descriptions[image_id]
+        ])
+    return calculate_bleu_scores(references, hypotheses)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare feature storage codecs')
+    parser.add_argument('--features', default=None, help='Raw float32 store or features.pkl (default: from config)')
+    parser.add_argument('--codecs', nargs='+', choices=list(CODECS), default=list(CODECS), help='Codecs to compare')
+    parser.add_argument('--pca-dim', type=int, default=None, help='PCA output dimension')
+    parser.add_argument('--model', default=None, help='Caption model trained on raw features')
+    parser.add_argument('--pca-model', default=None, help='Caption model trained on PCA features')
+    parser.add_argument('--limit', type=int, default=500, help='Test images used for BLEU')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+
+    features = load_features(args.features)
+    if isinstance(features, FeatureStore) and features.codec.name != "float32":
+        parser.error(f"{args.features} is stored as {features.codec.name}; the report needs raw float32 features")
+
+    ids = list(features)
+    sample_ids = ids[:2000]
+    raw = np.concatenate([np.asarray(features[i], dtype=np.float32).reshape(1, -1) for i in sample_ids])
+
+    descriptions = {}
+    models = {}
+    if args.model or args.pca_model:
+        from tensorflow.keras.models import load_model
+
+        test_ids = load_set(config.get('data.test_split', 'data/test.txt'))
+        descriptions = load_clean_descriptions(config.get('paths.descriptions_file', 'descriptions.txt'), test_ids)
+        models = {
+            "raw": load_model(args.model) if args.model else None,
+            "pca": load_model(args.pca_model) if args.pca_model else None,
+        }
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.codecs:
+            codec = codec_from_config(features, name=name, pca_dim=args.pca_dim)
+            store = FeatureStore.create(str(Path(tmp) / name), features, codec=codec)
+
+            row = {
+                "codec": name,
+                "feature_dim": store.feature_dim,
+                "size_mb": store.nbytes / 1024 ** 2,
+                "bytes_per_image": store.nbytes / len(store),
+                "reconstruction_error": reconstruction_error(codec, store, raw, sample_ids),
+            }
+            model = models.get("pca" if name == "pca" else "raw")
+            if model is not None:
+                row.update(bleu(model, store, descriptions, args.limit))
+            report.append(row)
+
+    base = report[0]["size_mb"] if report else 1.0
+    print(f"{'codec':<8} {'dim':>5} {'size MB':>9} {'ratio':>6} {'rel err':>8} {'BLEU-1':>7} {'BLEU-4':>7}")
+    for row in report:
+        print(
+            f"{row['codec']:<8} {row['feature_dim']:>5} {row['size_mb']:>9.1f} "
+            f"{base / row['size_mb']:>5.1f}x {row['reconstruction_error']:>8.4f} "
+            f"{row.get('BLEU-1', float('nan')):>7.4f} {row.get('BLEU-4', float('nan')):>7.4f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,112 @@
+"""Padding waste of full-width versus length-bucketed batches.
+
+For both model architectures the report counts the text-input positions the
+LSTM runs over in one epoch, and how many of them are padding, with every
+sample padded to ``max_length`` and with ``training.bucket_boundaries``
+buckets. It also counts decoding positions for the reference captions:
+padded to ``max_length`` at every step versus padded to the current prefix
+length. ``--time`` additionally times one training epoch of each.
+
+Usage:
+    python scripts/measure_padding.py
+    python scripts/measure_padding.py --synthetic 2000 --buckets 4 8 12 --time
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from model import define_model, define_sequence_model  # noqa: E402
+from scripts.benchmark_input_pipeline import synthetic_data, training_data  # noqa: E402
+from utils.caption_sequences import CaptionSequences  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.input_pipeline import build_dataset, build_sequence_dataset, padding_waste  # noqa: E402
+
+
+def decode_positions(descriptions, tokenizer, max_length: int):
+    """LSTM positions to greedily decode the reference captions, full-width and at prefix length."""
+    lengths = CaptionSequences(tokenizer, descriptions, max_length).lengths
+    steps = np.maximum(lengths - 1, 0)
+    full = int((steps * max_length).sum())
+    trimmed = int(sum(np.minimum(np.arange(1, n + 1), max_length).sum() for n in steps))
+    return full, trimmed
+
+
+def time_epoch(model, dataset) -> float:
+    """Seconds for one training epoch (after a warm-up epoch that traces every bucket)."""
+    model.fit(dataset, epochs=1, verbose=0)
+    start = time.perf_counter()
+    model.fit(dataset, epochs=1, verbose=0)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure padding waste with and without length buckets')
+    parser.add_argument('--buckets', type=int, nargs='+', default=None, help='Bucket widths (default: training.bucket_boundaries)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Batch size (default: training.batch_size)')
+    parser.add_argument('--synthetic', type=int, default=0, help='Use N synthetic images instead of the train split')
+    parser.add_argument('--time', action='store_true', help='Also time one training epoch per configuration')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+
+    args = parser.parse_args()
+    batch_size = args.batch_size or config.get('training.batch_size', 32)
+    max_length = config.get('model.max_length', 34)
+    buckets = args.buckets if args.buckets is not None else config.get('training.bucket_boundaries') or []
+
+    descriptions, photos, tokenizer = synthetic_data(args.synthetic) if args.synthetic else training_data()
+    vocab_size = len(tokenizer.word_index) + 1
+    feature_dim = next(iter(photos.values())).shape[-1]
+
+    report = []
+    for architecture, build, define in (
+        ("merge", build_dataset, define_model),
+        ("sequence", build_sequence_dataset, define_sequence_model),
+    ):
+        for name, boundaries in (("max_length", []), ("bucketed", buckets)):
+            dataset = build(descriptions, photos, tokenizer, max_length, batch_size, bucket_boundaries=boundaries)
+            padded, total = padding_waste(dataset)
+            row = {
+                "architecture": architecture,
+                "batching": name,
+                "positions": total,
+                "padding": padded,
+                "padding_fraction": padded / max(total, 1),
+            }
+            if args.time:
+                model = define(vocab_size, max_length, feature_dim=feature_dim)
+                row["epoch_seconds"] = time_epoch(model, dataset)
+            report.append(row)
+
+    full, trimmed = decode_positions(descriptions, tokenizer, max_length)
+    report.append({
+        "architecture": "merge",
+        "batching": "decode",
+        "positions": trimmed,
+        "padding": 0,
+        "padding_fraction": 0.0,
+        "positions_at_max_length": full,
+    })
+
+    print(f"\n{'architecture':<12} {'batching':<11} {'positions':>12} {'padding %':>10} {'epoch s':>9}")
+    for row in report:
+        epoch = f"{row['epoch_seconds']:>9.1f}" if 'epoch_seconds' in row else f"{'-':>9}"
+        print(
+            f"{row['architecture']:<12} {row['batching']:<11} {row['positions']:>12,} "
+            f"{row['padding_fraction']:>10.1%} {epoch}"
+        )
+    print(
+        f"\nGreedy decoding of the reference captions: {full:,} positions at max_length, "
+        f"{trimmed:,} at the current prefix length ({1 - trimmed / max(full, 1):.0%} fewer)"
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
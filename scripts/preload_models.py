@@ -0,0 +1,72 @@
+"""Preload, verify and bundle caption models for offline hosts.
+
+Typical flow:
+    # On a host with network access
+    python scripts/preload_models.py --bundles blip vit-gpt2 --export models.tar.gz
+
+    # On the offline host (model_store.offline: true in config.yaml)
+    python scripts/preload_models.py --install models.tar.gz --verify
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.config import config  # noqa: E402
+from utils.model_store import BUNDLES, ModelStore, is_offline  # noqa: E402
+from utils.onnx_captioner import CONFIG_FILE  # noqa: E402
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage the local model store')
+    parser.add_argument(
+        '--bundles',
+        nargs='+',
+        default=config.get('model_store.preload', ['blip']),
+        help=f"Bundle names ({', '.join(BUNDLES)}) or Hugging Face repository ids"
+    )
+    parser.add_argument('--cache-dir', default=None, help='Override the resolved cache directory')
+    parser.add_argument('--export', default=None, help='Write the bundles to this tar archive')
+    parser.add_argument('--install', default=None, help='Install bundles from this tar archive')
+    parser.add_argument('--verify', action='store_true', help='Only verify, never download')
+
+    args = parser.parse_args()
+    store = ModelStore(args.cache_dir)
+    print(f"Model cache: {store.cache_dir}")
+
+    if args.install:
+        store.install_bundle(args.install)
+
+    if not args.verify and not args.install:
+        if is_offline():
+            print("❌ Offline mode is enabled; use --install or --verify")
+            sys.exit(1)
+        store.preload(args.bundles)
+
+    failed = False
+    for name in args.bundles:
+        result = store.verify(name)
+        if result["ok"]:
+            print(f"✅ {name}: {result['path']}")
+        else:
+            failed = True
+            print(f"❌ {name}: missing {', '.join(result['missing'])}")
+
+    if config.get('external.backend', 'torch') == 'onnx':
+        onnx_dir = Path(config.get('external.onnx_dir', 'models/onnx/blip'))
+        if (onnx_dir / CONFIG_FILE).exists():
+            print(f"✅ onnx export: {onnx_dir}")
+        else:
+            failed = True
+            print(f"❌ onnx export missing in {onnx_dir}; run scripts/export_onnx.py")
+
+    if args.export:
+        store.export_bundle(args.bundles, args.export)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from tensorflow.keras.models import Model, load_model
 from tensorflow.keras.layers import Input, Dense, LSTM, Embedding, Dropout, Add
 from tensorflow.keras.optimizers import Adam
 import os
+from utils.feature_store import load_features
 
 print("=" * 60)
 print("SETTING UP DEMO MODEL FOR INTERNSHIP")
@@ -80,7 +81,7 @@ with open('descriptions.txt', 'r') as f:
                 descriptions[img_id] = []
             descriptions[img_id].append(caption)
 
-features = load(open('features.pkl', 'rb'))
+features = load_features()
 
 # Quick training for demo (just to initialize weights properly)
 print("\n5. Quick training (10 epochs for demo)...")
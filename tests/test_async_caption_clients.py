@@ -0,0 +1,211 @@
+"""Tests for the async vision API clients against a local mock server."""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from utils.async_caption_clients import (
+    AsyncGeminiClient, AsyncOpenAIClient, CaptionAPIError, ClientSettings, TokenBucket, parse_retry_after
+)
+from utils.image_payload import prepare_image
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """Serves OpenAI- and Gemini-shaped responses driven by server state."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        state = self.server.state
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with state['lock']:
+            state['calls'] += 1
+            call = state['calls']
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+
+        time.sleep(state['delays'].get(call, state['delay']))
+        with state['lock']:
+            state['in_flight'] -= 1
+
+        status = state['statuses'].get(call, 200)
+        if status != 200:
+            self.send_response(status)
+            self.end_headers()
+            self.wfile.write(b'{"error": "mock"}')
+            return
+
+        if self.path.startswith('/models/'):
+            text = body['contents'][0]['parts'][0]['text']
+            payload = {"candidates": [{"content": {"parts": [{"text": f"gemini: {text}"}]}}]}
+        else:
+            text = body['messages'][0]['content'][0]['text']
+            payload = {"choices": [{"message": {"content": f"openai: {text}"}}]}
+
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def mock_server():
+    """Start a threaded mock HTTP server on a free local port."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockAPIHandler)
+    server.state = {
+        'lock': threading.Lock(), 'calls': 0, 'in_flight': 0, 'max_in_flight': 0,
+        'delay': 0.05, 'delays': {}, 'statuses': {}
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fast_settings(**overrides):
+    settings = dict(max_concurrency=4, requests_per_second=1000, max_retries=2, backoff_base=0.01, backoff_max=0.05)
+    settings.update(overrides)
+    return ClientSettings(**settings)
+
+
+def images(n):
+    return [Image.new('RGB', (16, 16), color=(i, i, i)) for i in range(n)]
+
+
+def test_openai_batch_runs_concurrently(mock_server):
+    """Test N images are captioned concurrently within the concurrency bound."""
+    async def run():
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=fast_settings()) as client:
+            return await client.caption_batch(images(8), 'describe')
+    
+    start = time.perf_counter()
+    captions = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    
+    assert captions == ['openai: describe'] * 8
+    assert mock_server.state['max_in_flight'] <= 4
+    assert elapsed < 8 * 0.05
+
+
+def test_gemini_caption(mock_server):
+    """Test Gemini responses are parsed from candidates."""
+    async def run():
+        async with AsyncGeminiClient('key', base_url=base_url(mock_server), settings=fast_settings()) as client:
+            return await client.caption(images(1)[0], 'hello')
+    
+    assert asyncio.run(run()) == 'gemini: hello'
+
+
+def test_images_are_encoded_off_the_event_loop(mock_server, monkeypatch):
+    """Test image preparation runs on worker threads, not the event loop's thread."""
+    import utils.async_caption_clients as clients
+    
+    threads = []
+    
+    def recording_prepare(image, provider):
+        threads.append(threading.get_ident())
+        return prepare_image(image, provider=provider)
+    
+    monkeypatch.setattr(clients, 'prepare_image', recording_prepare)
+    
+    async def run():
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=fast_settings()) as client:
+            return await client.caption_batch(images(4), 'describe')
+    
+    assert asyncio.run(run()) == ['openai: describe'] * 4
+    assert len(threads) == 4 and threading.get_ident() not in threads
+
+
+def test_retries_transient_errors(mock_server):
+    """Test 503 and 429 responses are retried until success."""
+    mock_server.state['statuses'] = {1: 503, 2: 429}
+    
+    async def run():
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=fast_settings()) as client:
+            caption = await client.caption(images(1)[0], 'retry')
+            return caption, client.stats
+    
+    caption, stats = asyncio.run(run())
+    assert caption == 'openai: retry'
+    assert stats['retries'] == 2
+
+
+@pytest.mark.parametrize("status", [401, 409])
+def test_permanent_error_is_not_retried(mock_server, status):
+    """Test a client error fails immediately without a retry."""
+    mock_server.state['statuses'] = {1: status}
+    
+    async def run():
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=fast_settings(max_concurrency=1)) as client:
+            with pytest.raises(CaptionAPIError):
+                await client.caption(images(1)[0], 'x')
+            return client.stats
+    
+    assert asyncio.run(run())['retries'] == 0
+    assert mock_server.state['calls'] == 1
+
+
+def test_hedging_returns_faster_duplicate(mock_server):
+    """Test a slow request is raced by a hedged duplicate."""
+    mock_server.state['delays'] = {1: 1.0}
+    
+    async def run():
+        settings = fast_settings(hedge_after=0.1)
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=settings) as client:
+            start = time.perf_counter()
+            caption = await client.caption(images(1)[0], 'hedge')
+            return caption, time.perf_counter() - start, client.stats
+    
+    caption, elapsed, stats = asyncio.run(run())
+    assert caption == 'openai: hedge'
+    assert stats['hedges'] == 1
+    assert elapsed < 0.8
+
+
+def test_cancelled_caller_cancels_hedged_requests(mock_server):
+    """Test cancelling a caption mid-request leaves no request task running."""
+    mock_server.state['delay'] = 1.0
+    
+    async def run():
+        settings = fast_settings(hedge_after=0.5)
+        async with AsyncOpenAIClient('key', base_url=base_url(mock_server), settings=settings) as client:
+            caption = asyncio.ensure_future(client.caption(images(1)[0], 'cancel'))
+            await asyncio.sleep(0.2)
+            caption.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caption
+            await asyncio.sleep(0.1)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    
+    assert asyncio.run(run()) == []
+
+
+def test_token_bucket_paces_requests():
+    """Test the token bucket limits throughput after the burst."""
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.perf_counter()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.perf_counter() - start
+    
+    assert asyncio.run(run()) >= 4 / 20 * 0.9
+
+
+def test_parse_retry_after():
+    """Test fractional Retry-After seconds are honoured and HTTP dates ignored."""
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("Wed, 21 Oct 2026 07:28:00 GMT") is None
+    assert parse_retry_after(None) is None
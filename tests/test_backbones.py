@@ -0,0 +1,45 @@
+"""Tests for the CNN backbone registry."""
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("tensorflow")
+
+from utils.backbones import BACKBONES, get_backbone  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.feature_pipeline import decode_image_into, load_image_array  # noqa: E402
+
+
+def test_get_backbone_defaults_to_config():
+    """Test the configured backbone is returned and unknown names are rejected."""
+    assert get_backbone().name == config.get('model.backbone', 'vgg16')
+    assert get_backbone('mobilenet_v2').feature_dim == 1280
+    
+    with pytest.raises(ValueError, match="Unknown backbone"):
+        get_backbone('resnet9000')
+
+
+@pytest.mark.parametrize("name", sorted(BACKBONES))
+def test_fast_decode_matches_backbone_preprocessing(tmp_path, name):
+    """Test the in-place decode path matches each backbone's preprocess_input."""
+    backbone = get_backbone(name)
+    rng = np.random.default_rng(2)
+    path = tmp_path / "image.png"
+    Image.fromarray(rng.integers(0, 255, (60, 80, 3), dtype=np.uint8)).save(path)
+    
+    out = np.empty((32, 32, 3), dtype=np.float32)
+    decode_image_into(str(path), out, draft=False, mode=backbone.preprocess_mode)
+    reference = load_image_array(str(path), (32, 32), preprocess=backbone.preprocess_input)
+    
+    np.testing.assert_allclose(out, reference, rtol=1e-6, atol=1e-5)
+
+
+def test_define_model_uses_backbone_feature_dim(monkeypatch):
+    """Test the caption model's image input follows model.backbone."""
+    from model import define_model
+    
+    monkeypatch.setitem(config._config['model'], 'backbone', 'mobilenet_v3_small')
+    monkeypatch.setitem(config._config['model'], 'feature_dim', None)
+    model = define_model(vocab_size=20, max_length=5, embedding_dim=8, lstm_units=8)
+    
+    assert model.inputs[0].shape[-1] == 576
@@ -0,0 +1,169 @@
+"""Tests for vectorised training triple generation."""
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from tensorflow.keras.preprocessing.sequence import pad_sequences  # noqa: E402
+from tensorflow.keras.preprocessing.text import Tokenizer  # noqa: E402
+
+from utils.caption_sequences import CaptionSequences  # noqa: E402
+
+
+@pytest.fixture
+def caption_data():
+    """Captions of varying length (one longer than max_length) and features."""
+    descriptions = {
+        "a": ['startseq a dog runs on grass endseq', 'startseq dog endseq'],
+        "b": ['startseq a cat sits on a mat near the big red door endseq'],
+        "c": ['startseq two children play in the water endseq', 'startseq kids swim endseq'],
+    }
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([c for captions in descriptions.values() for c in captions])
+    photos = {image_id: np.full((1, 3), i, dtype=np.float32) for i, image_id in enumerate(descriptions)}
+    return tokenizer, descriptions, photos
+
+
+def loop_triples(tokenizer, descriptions, photos, max_length):
+    """The original per-prefix loop."""
+    X1, X2, y = [], [], []
+    for key, captions in descriptions.items():
+        for caption in captions:
+            seq = tokenizer.texts_to_sequences([caption])[0]
+            for i in range(1, len(seq)):
+                X1.append(photos[key][0])
+                X2.append(pad_sequences([seq[:i]], maxlen=max_length)[0])
+                y.append(seq[i])
+    return np.array(X1), np.array(X2), np.array(y)
+
+
+@pytest.mark.parametrize("max_length", [6, 16])
+def test_triples_match_per_prefix_loop(caption_data, max_length):
+    """Test vectorised triples equal pad_sequences output, truncation included."""
+    tokenizer, descriptions, photos = caption_data
+    
+    X1, X2, y = CaptionSequences(tokenizer, descriptions, max_length).arrays(photos)
+    ref1, ref2, ref_y = loop_triples(tokenizer, descriptions, photos, max_length)
+    
+    np.testing.assert_array_equal(X1, ref1)
+    np.testing.assert_array_equal(X2, ref2)
+    np.testing.assert_array_equal(y, ref_y)
+    assert X2.dtype == y.dtype == np.int32
+
+
+def test_batches_cover_each_image_once(caption_data):
+    """Test an epoch of shuffled batches yields every triple with its own photo."""
+    tokenizer, descriptions, photos = caption_data
+    sequences = CaptionSequences(tokenizer, descriptions, 16)
+    del photos["b"]
+    
+    batches = list(sequences.batches(photos, batch_size=2))
+    features = np.concatenate([inputs[0] for inputs, _ in batches])
+    targets = np.concatenate([t for _, t in batches])
+    
+    assert len(batches) == 1
+    assert sorted(features[:, 0].tolist()) == [0.0] * 8 + [2.0] * 10
+    assert len(targets) == len(sequences) - 12
+
+
+def test_tf_dataset_yields_the_same_triples(caption_data):
+    """Test the tf.data pipeline covers every triple with its image's features."""
+    from utils.input_pipeline import build_dataset
+    
+    tokenizer, descriptions, photos = caption_data
+    X1, X2, y = CaptionSequences(tokenizer, descriptions, 16).arrays(photos)
+    dataset = build_dataset(
+        descriptions, photos, tokenizer, 16, batch_size=4, shuffle_buffer=64, cache=True, bucket_boundaries=[]
+    )
+    
+    batches = [((f.numpy(), p.numpy()), t.numpy()) for (f, p), t in dataset]
+    features = np.concatenate([inputs[0] for inputs, _ in batches])
+    prefixes = np.concatenate([inputs[1] for inputs, _ in batches])
+    targets = np.concatenate([t for _, t in batches])
+    
+    assert len(batches) == int(np.ceil(len(y) / 4))
+    order = np.lexsort(np.column_stack([features[:, 0], targets, prefixes]).T)
+    reference = np.lexsort(np.column_stack([X1[:, 0], y, X2]).T)
+    np.testing.assert_array_equal(prefixes[order], X2[reference])
+    np.testing.assert_array_equal(targets[order], y[reference])
+    np.testing.assert_array_equal(features[order], X1[reference])
+
+
+@pytest.mark.parametrize("sequence", [False, True])
+def test_store_features_are_read_per_batch(caption_data, tmp_path, sequence):
+    """Test features read from a (compressed) FeatureStore per batch match the dict pipeline."""
+    from utils.feature_codecs import get_codec
+    from utils.feature_store import FeatureStore
+    from utils.input_pipeline import build_dataset, build_sequence_dataset
+    
+    tokenizer, descriptions, photos = caption_data
+    store = FeatureStore.create(str(tmp_path / "store"), photos, codec=get_codec('float16')).subset(["a", "c"])
+    build = build_sequence_dataset if sequence else build_dataset
+    
+    from_store = build(descriptions, store, tokenizer, 16, batch_size=3, shuffle=False, bucket_boundaries=[])
+    from_dict = build(descriptions, store.to_dict(), tokenizer, 16, batch_size=3, shuffle=False, bucket_boundaries=[])
+    
+    for (store_inputs, *_), (dict_inputs, *_) in zip(from_store, from_dict):
+        assert store_inputs[0].shape[1] == 3
+        np.testing.assert_array_equal(store_inputs[0].numpy(), dict_inputs[0].numpy())
+    assert len(list(from_store)) == len(list(from_dict)) > 1
+
+
+def test_teacher_forcing_rows_shift_captions(caption_data):
+    """Test whole-caption inputs predict the next token, truncated to max_length."""
+    tokenizer, descriptions, photos = caption_data
+    sequences = CaptionSequences(tokenizer, descriptions, 6)
+    
+    rows, inputs, targets = sequences.teacher_forcing()
+    captions = [c for captions in descriptions.values() for c in captions]
+    
+    for row, caption in enumerate(captions):
+        seq = tokenizer.texts_to_sequences([caption])[0]
+        n = min(len(seq) - 1, 6)
+        np.testing.assert_array_equal(inputs[row, :n], seq[:n])
+        np.testing.assert_array_equal(targets[row, :n], seq[1:n + 1])
+        assert not inputs[row, n:].any() and not targets[row, n:].any()
+    assert rows.tolist() == [0, 0, 1, 2, 2]
+
+
+def test_sequence_dataset_trains(caption_data):
+    """Test the sequence model fits on the teacher-forcing dataset with padding masked."""
+    from model import define_sequence_model
+    from utils.input_pipeline import build_sequence_dataset
+    
+    tokenizer, descriptions, photos = caption_data
+    dataset = build_sequence_dataset(descriptions, photos, tokenizer, 8, batch_size=2, bucket_boundaries=[])
+    (features, inputs), targets, weights = next(iter(dataset))
+    
+    assert inputs.shape == targets.shape == weights.shape == (2, 8)
+    np.testing.assert_array_equal(weights.numpy(), (targets.numpy() != 0).astype(np.float32))
+    
+    model = define_sequence_model(
+        len(tokenizer.word_index) + 1, 8, embedding_dim=8, lstm_units=8, feature_dim=3
+    )
+    history = model.fit(dataset, epochs=1, verbose=0)
+    assert np.isfinite(history.history['loss'][0])
+
+
+@pytest.mark.parametrize("sequence", [False, True])
+def test_bucketed_batches_trim_padding(caption_data, sequence):
+    """Test bucketed batches keep every token, pad less and fit a variable-length model."""
+    from model import define_model, define_sequence_model
+    from utils.input_pipeline import build_dataset, build_sequence_dataset, padding_waste
+    
+    tokenizer, descriptions, photos = caption_data
+    build = build_sequence_dataset if sequence else build_dataset
+    fixed = build(descriptions, photos, tokenizer, 12, batch_size=3, shuffle=False, bucket_boundaries=[])
+    bucketed = build(descriptions, photos, tokenizer, 12, batch_size=3, bucket_boundaries=[3, 6])
+    
+    widths = {element[0][1].shape[1] for element in bucketed}
+    assert widths <= {3, 6, 12} and len(widths) > 1
+    
+    fixed_padded, fixed_total = padding_waste(fixed)
+    padded, total = padding_waste(bucketed)
+    assert fixed_total - fixed_padded == total - padded
+    assert padded / total < fixed_padded / fixed_total
+    
+    define = define_sequence_model if sequence else define_model
+    model = define(len(tokenizer.word_index) + 1, 12, embedding_dim=8, lstm_units=8, feature_dim=3)
+    assert np.isfinite(model.fit(bucketed, epochs=1, verbose=0).history['loss'][0])
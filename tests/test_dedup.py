@@ -0,0 +1,99 @@
+"""Tests for exact and near-duplicate image detection."""
+import numpy as np
+from PIL import Image
+
+from utils.dedup import (
+    apply_aliases, find_duplicates, hamming_distances, load_aliases, load_file_hashes,
+    merge_duplicate_descriptions, save_aliases
+)
+from utils.extraction_manifest import file_hash
+from utils.feature_store import FeatureStore
+
+
+def smooth_image(seed):
+    """Gradient image that survives resizing and re-encoding."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:120, 0:160]
+    a, b, c = rng.uniform(0.2, 1.0, 3)
+    pixels = np.stack([x * a, y * b * 2, (x * y) % 255 * c], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def test_exact_and_near_duplicates_are_aliased(tmp_path):
+    """Test copies map to the smallest id and distinct images are kept."""
+    original = smooth_image(0)
+    original.save(tmp_path / "a.jpg", quality=95)
+    (tmp_path / "b.jpg").write_bytes((tmp_path / "a.jpg").read_bytes())
+    original.resize((80, 60)).save(tmp_path / "c.png")
+    smooth_image(1).transpose(Image.FLIP_LEFT_RIGHT).save(tmp_path / "d.jpg")
+    items = [(name, str(tmp_path / f"{name}.{ext}")) for name, ext in
+             [("d", "jpg"), ("c", "png"), ("b", "jpg"), ("a", "jpg")]]
+    
+    result = find_duplicates(items, max_distance=4)
+    
+    assert result.aliases == {"b": "a", "c": "a"}
+    assert (result.exact, result.near, result.canonical_count) == (1, 1, 2)
+    assert result.report(feature_dim=4096)["bytes_saved"] == 2 * 4096 * 4
+    assert find_duplicates(items, max_distance=0).aliases == {"b": "a"}
+    
+    save_aliases(result, str(tmp_path / "dedup.json"))
+    assert load_aliases(str(tmp_path / "dedup.json")) == result.aliases
+
+
+def test_rerun_hashes_only_changed_files(tmp_path, monkeypatch):
+    """Test saved hashes are reused for unchanged files and recomputed for a changed one."""
+    import utils.dedup as dedup
+    
+    smooth_image(0).save(tmp_path / "a.png")
+    (tmp_path / "b.png").write_bytes((tmp_path / "a.png").read_bytes())
+    smooth_image(1).transpose(Image.FLIP_LEFT_RIGHT).save(tmp_path / "c.png")
+    items = [(name, str(tmp_path / f"{name}.png")) for name in "abc"]
+    first = find_duplicates(items, max_distance=4)
+    save_aliases(first, str(tmp_path / "dedup.json"))
+    known = load_file_hashes(str(tmp_path / "dedup.json"))
+    noise = np.random.default_rng(2).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    Image.fromarray(noise).save(tmp_path / "b.png")
+    read = []
+    monkeypatch.setattr(dedup, "file_hash", lambda path: read.append(path) or file_hash(path))
+    
+    second = find_duplicates(items, max_distance=4, known=known)
+    
+    assert first.aliases == {"b": "a"} and second.aliases == {}
+    assert read == [str(tmp_path / "b.png")] and second.hashed == 1
+    assert known[str(tmp_path / "a.png")] == second.files[str(tmp_path / "a.png")]
+
+
+def test_hamming_distances_without_bitwise_count(monkeypatch):
+    """Test distances match a bit-string count on NumPy versions without ``bitwise_count``."""
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 50, dtype=np.uint64) * np.uint64(2)
+    image_hash = hashes[7] ^ np.uint64(0b1011) ^ np.uint64(1 << 63)
+    
+    distances = hamming_distances(hashes, image_hash)
+    
+    assert distances[7] == 4
+    assert distances.tolist() == [bin(int(h) ^ int(image_hash)).count("1") for h in hashes]
+
+
+def test_aliases_resolve_to_canonical_rows(tmp_path):
+    """Test store and dict features answer for duplicate ids without copying."""
+    features = {"a": np.ones((1, 3), np.float32), "d": np.zeros((1, 3), np.float32)}
+    aliases = {"b": "a", "x": "missing"}
+    store = FeatureStore.create(str(tmp_path / "store"), features)
+    
+    for resolved in (apply_aliases(store, aliases), apply_aliases(features, aliases)):
+        assert "b" in resolved and "x" not in resolved
+        np.testing.assert_array_equal(resolved["b"], features["a"])
+    
+    assert len(apply_aliases(store, aliases).subset({"b", "d"})) == 2
+    assert apply_aliases(features, {}) is features
+
+
+def test_duplicate_captions_are_merged():
+    """Test a duplicate's captions fold into its canonical image within a split."""
+    descriptions = {"a": ["startseq dog endseq"], "b": ["startseq dog endseq", "startseq a dog endseq"], "c": ["x"]}
+    
+    merged = merge_duplicate_descriptions(descriptions, {"b": "a", "c": "z"})
+    
+    assert merged == {"a": ["startseq dog endseq", "startseq a dog endseq"], "c": ["x"]}
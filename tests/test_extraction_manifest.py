@@ -0,0 +1,114 @@
+"""Tests for incremental, resumable feature extraction."""
+import os
+
+import numpy as np
+import pytest
+
+from utils.extraction_manifest import update_feature_store
+from utils.feature_store import FeatureStore
+
+
+class FakePipeline:
+    """Stands in for FeaturePipeline: features derived from file bytes."""
+    
+    def __init__(self, fail_after=None):
+        self.calls = []
+        self.fail_after = fail_after
+    
+    def extract(self, items):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise KeyboardInterrupt
+        self.calls.append([image_id for image_id, _ in items])
+        features = {}
+        for image_id, path in items:
+            data = np.frombuffer(open(path, 'rb').read().ljust(8, b'\0')[:8], dtype=np.uint8)
+            features[image_id] = data.astype(np.float32)[np.newaxis]
+        return features
+
+
+def write_images(directory, contents):
+    """Write fake image files and return (image_id, path) items."""
+    items = []
+    for image_id, data in contents.items():
+        path = directory / f"{image_id}.jpg"
+        path.write_bytes(data)
+        items.append((image_id, str(path)))
+    return items
+
+
+def test_only_the_delta_is_extracted(tmp_path):
+    """Test reruns skip unchanged files and handle new, changed and deleted ones."""
+    images = tmp_path / 'images'
+    images.mkdir()
+    store_path = str(tmp_path / 'store')
+    items = write_images(images, {'a': b'aaaa', 'b': b'bbbb', 'c': b'cccc'})
+    
+    pipeline = FakePipeline()
+    assert update_feature_store(items, store_path, pipeline)['extracted'] == 3
+    assert update_feature_store(items, store_path, pipeline)['extracted'] == 0
+    
+    # New, changed and deleted files
+    (images / 'c.jpg').unlink()
+    items = write_images(images, {'b': b'BBBB', 'd': b'dddd'}) + [items[0]]
+    stats = update_feature_store(items, store_path, pipeline)
+    
+    assert stats['extracted'] == 2
+    assert stats['unchanged'] == 1
+    assert stats['removed'] == 1
+    assert sorted(pipeline.calls[-1]) == ['b', 'd']
+    
+    store = FeatureStore(store_path)
+    assert sorted(store) == ['a', 'b', 'd']
+    assert store['b'][0, 0] == ord('B')
+
+
+def test_touched_file_is_not_reextracted(tmp_path):
+    """Test an mtime change with identical contents only refreshes the manifest."""
+    images = tmp_path / 'images'
+    images.mkdir()
+    store_path = str(tmp_path / 'store')
+    items = write_images(images, {'a': b'aaaa'})
+    
+    update_feature_store(items, store_path, FakePipeline())
+    stat = os.stat(items[0][1])
+    os.utime(items[0][1], (stat.st_atime, stat.st_mtime + 10))
+    
+    assert update_feature_store(items, store_path, FakePipeline())['extracted'] == 0
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path):
+    """Test checkpointed chunks survive a crash and are not re-extracted."""
+    images = tmp_path / 'images'
+    images.mkdir()
+    store_path = str(tmp_path / 'store')
+    items = write_images(images, {name: name.encode() * 4 for name in 'abcdef'})
+    
+    with pytest.raises(KeyboardInterrupt):
+        update_feature_store(items, store_path, FakePipeline(fail_after=1), checkpoint_every=2)
+    assert not (tmp_path / 'store').exists()
+    
+    pipeline = FakePipeline()
+    stats = update_feature_store(items, store_path, pipeline, checkpoint_every=2)
+    
+    assert stats['resumed'] == 2
+    assert stats['extracted'] == 4
+    assert sum(len(call) for call in pipeline.calls) == 4
+    assert sorted(FeatureStore(store_path)) == list('abcdef')
+    assert not (tmp_path / 'store.partial').exists()
+
+
+def test_backbone_change_rebuilds_store(tmp_path):
+    """Test a store extracted with another backbone is rebuilt, not merged."""
+    images = tmp_path / 'images'
+    images.mkdir()
+    store_path = str(tmp_path / 'store')
+    items = write_images(images, {'a': b'aaaa', 'b': b'bbbb'})
+    
+    pipeline = FakePipeline()
+    update_feature_store(items, store_path, pipeline, backbone='vgg16')
+    assert update_feature_store(items, store_path, pipeline, backbone='vgg16')['extracted'] == 0
+    
+    stats = update_feature_store(items, store_path, pipeline, backbone='mobilenet_v2')
+    
+    assert stats['extracted'] == 2
+    assert FeatureStore(store_path).metadata['backbone'] == 'mobilenet_v2'
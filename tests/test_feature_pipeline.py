@@ -0,0 +1,162 @@
+"""Tests for the batched feature extraction pipeline."""
+import numpy as np
+import pytest
+from PIL import Image
+
+tf = pytest.importorskip("tensorflow")
+
+from utils.feature_pipeline import (  # noqa: E402
+    FeaturePipeline, decode_image_into, load_image_array, verify_parity
+)
+
+
+@pytest.fixture
+def tiny_model():
+    """Small CNN standing in for VGG16."""
+    inputs = tf.keras.Input(shape=(32, 32, 3))
+    x = tf.keras.layers.Conv2D(4, 3)(inputs)
+    outputs = tf.keras.layers.GlobalAveragePooling2D()(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+@pytest.fixture
+def image_items(tmp_path):
+    """Write a few JPEGs and return (image_id, path) items."""
+    rng = np.random.default_rng(0)
+    items = []
+    for i in range(7):
+        path = tmp_path / f"img{i}.jpg"
+        Image.fromarray(rng.integers(0, 255, (40, 50, 3), dtype=np.uint8)).save(path)
+        items.append((f"img{i}", str(path)))
+    return items
+
+
+def test_pipeline_matches_per_image_output(tiny_model, image_items):
+    """Test batch size 1 is bit-identical to per-image extraction."""
+    pipeline = FeaturePipeline(model=tiny_model, batch_size=1, num_workers=2, target_size=(32, 32))
+    features = pipeline.extract(image_items, progress=False)
+    
+    for image_id, path in image_items:
+        reference = tiny_model.predict(load_image_array(path, (32, 32))[np.newaxis], verbose=0)
+        assert features[image_id].shape == (1, 4)
+        assert features[image_id].dtype == np.float32
+        np.testing.assert_array_equal(features[image_id], reference)
+
+
+def test_pipeline_batches_and_reports_throughput(tiny_model, image_items):
+    """Test batched extraction covers every image and records stats."""
+    pipeline = FeaturePipeline(model=tiny_model, batch_size=3, num_workers=2, target_size=(32, 32))
+    features = pipeline.extract(image_items, progress=False)
+    
+    assert set(features) == {image_id for image_id, _ in image_items}
+    assert pipeline.stats['images'] == 7
+    assert pipeline.stats['images_per_second'] > 0
+    assert verify_parity(pipeline, image_items, features) < 1e-4
+
+
+def test_pipeline_skips_unreadable_images(tiny_model, image_items, tmp_path):
+    """Test a corrupt file is logged and skipped."""
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not an image")
+    pipeline = FeaturePipeline(model=tiny_model, batch_size=4, target_size=(32, 32))
+    features = pipeline.extract(image_items + [("bad", str(bad))], progress=False)
+    
+    assert "bad" not in features
+    assert pipeline.stats['failed'] == 1
+
+
+def tiny_model_factory():
+    """Picklable model factory for worker processes."""
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(0)
+    inputs = tf.keras.Input(shape=(32, 32, 3))
+    x = tf.keras.layers.Conv2D(4, 3)(inputs)
+    outputs = tf.keras.layers.GlobalAveragePooling2D()(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def test_sharded_extraction_merges_all_shards(image_items):
+    """Test two worker processes produce the same features as one pipeline."""
+    from utils.sharded_extraction import ShardedExtractor, shard_items
+    
+    assert sorted(sum(shard_items(image_items, 3), [])) == sorted(image_items)
+    
+    extractor = ShardedExtractor(
+        num_processes=2, threads_per_process=1, model_factory=tiny_model_factory,
+        batch_size=1, target_size=(32, 32)
+    )
+    features = extractor.extract(image_items, progress=False)
+    reference = FeaturePipeline(model=tiny_model_factory(), batch_size=1, target_size=(32, 32)).extract(
+        image_items, progress=False
+    )
+    
+    assert extractor.stats["processes"] == 2
+    assert extractor.stats["extraction_seconds"] < extractor.stats["seconds"]
+    assert extractor.stats["extraction_images_per_second"] > extractor.stats["images_per_second"]
+    assert set(features) == set(reference)
+    for image_id in reference:
+        np.testing.assert_allclose(features[image_id], reference[image_id], rtol=1e-5, atol=1e-6)
+
+
+def test_scaling_report():
+    """Test speedup and efficiency are relative to the smallest worker count."""
+    from utils.sharded_extraction import scaling_report
+    
+    report = scaling_report([
+        {"processes": 4, "images_per_second": 60.0, "extraction_images_per_second": 76.0},
+        {"processes": 1, "images_per_second": 20.0, "extraction_images_per_second": 20.0},
+    ])
+    
+    assert report[0]["speedup"] == 1.0
+    assert report[1]["speedup"] == 3.0
+    assert report[1]["efficiency"] == 0.75
+    assert report[1]["extraction_speedup"] == 3.8
+    assert report[1]["extraction_efficiency"] == 0.95
+    assert "extraction_speedup" not in scaling_report([{"processes": 1, "images_per_second": 5.0}])[0]
+
+
+@pytest.mark.parametrize("mode,suffix", [("RGB", "jpg"), ("RGB", "png"), ("RGBA", "png"), ("L", "jpg")])
+def test_fast_decode_matches_preprocess_input(tmp_path, mode, suffix):
+    """Test the in-place decode path is bit-identical to load_img + preprocess_input."""
+    rng = np.random.default_rng(1)
+    channels = {"RGB": 3, "RGBA": 4, "L": 1}[mode]
+    pixels = rng.integers(0, 255, (60, 80, channels), dtype=np.uint8).squeeze()
+    path = tmp_path / f"image.{suffix}"
+    Image.fromarray(pixels, mode).save(path)
+    
+    out = np.full((32, 32, 3), np.nan, dtype=np.float32)
+    decode_image_into(str(path), out, draft=False)
+    
+    np.testing.assert_array_equal(out, load_image_array(str(path), (32, 32)))
+
+
+def test_fast_decode_drafts_large_jpegs(tmp_path):
+    """Test draft mode stays close to a full decode of a large, smooth JPEG."""
+    y, x = np.mgrid[0:1200, 0:1600]
+    pixels = np.stack([x * 255 // 1600, y * 255 // 1200, (x + y) * 255 // 2800], axis=-1).astype(np.uint8)
+    path = tmp_path / "large.jpg"
+    Image.fromarray(pixels).save(path, quality=95)
+    
+    with Image.open(path) as image:
+        image.draft('RGB', (224, 224))
+        assert image.size == (400, 300)
+    
+    fast = decode_image_into(str(path), np.empty((224, 224, 3), dtype=np.float32))
+    reference = load_image_array(str(path), (224, 224))
+    assert np.abs(fast - reference).mean() < 2.0
+
+
+def test_fast_decode_pipeline_reuses_buffers(tiny_model, image_items):
+    """Test recycled batch buffers never leak pixels between batches."""
+    reference = FeaturePipeline(model=tiny_model, batch_size=2, target_size=(32, 32)).extract(
+        image_items, progress=False
+    )
+    pipeline = FeaturePipeline(
+        model=tiny_model, batch_size=2, prefetch_batches=1, target_size=(32, 32), fast_decode=True
+    )
+    features = pipeline.extract(image_items + [("missing", "/nonexistent.jpg")], progress=False)
+    
+    assert pipeline.stats["failed"] == 1
+    assert set(features) == set(reference)
+    for image_id in reference:
+        np.testing.assert_array_equal(features[image_id], reference[image_id])
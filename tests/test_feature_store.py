@@ -0,0 +1,142 @@
+"""Tests for the memory-mapped feature store."""
+from pickle import dump
+
+import numpy as np
+import pytest
+
+from utils.feature_store import (
+    FeatureStore, convert_pickle_to_store, convert_store_to_pickle, load_features
+)
+
+
+@pytest.fixture
+def features():
+    """Small legacy-layout features dictionary."""
+    rng = np.random.default_rng(0)
+    return {f"img{i}": rng.random((1, 16), dtype=np.float32) for i in range(5)}
+
+
+def test_create_and_open(tmp_path, features):
+    """Test a store round-trips the legacy (1, D) layout."""
+    store = FeatureStore.create(str(tmp_path / 'store'), features)
+    
+    assert len(store) == 5
+    assert store.feature_dim == 16
+    assert set(store) == set(features)
+    assert store['img3'].shape == (1, 16)
+    np.testing.assert_array_equal(store['img3'][0], features['img3'][0])
+    assert not (tmp_path / 'store.tmp').exists()
+
+
+def test_lookups_are_memory_mapped_views(tmp_path, features):
+    """Test lookups are views of the mapped matrix, not copies."""
+    FeatureStore.create(str(tmp_path / 'store'), features)
+    store = FeatureStore(str(tmp_path / 'store'))
+    
+    assert isinstance(store.matrix, np.memmap)
+    assert np.shares_memory(store['img1'], store.matrix)
+    np.testing.assert_array_equal(store.rows(['img4', 'img0'])[0], features['img4'][0])
+
+
+def test_pickle_round_trip(tmp_path, features):
+    """Test conversion to and from the legacy pickle."""
+    pickle_path = tmp_path / 'features.pkl'
+    with open(pickle_path, 'wb') as f:
+        dump(features, f)
+    
+    store = convert_pickle_to_store(str(pickle_path), str(tmp_path / 'store'))
+    convert_store_to_pickle(str(tmp_path / 'store'), str(tmp_path / 'back.pkl'))
+    back = load_features(str(tmp_path / 'back.pkl'))
+    
+    assert isinstance(store, FeatureStore)
+    assert set(back) == set(features)
+    np.testing.assert_array_equal(back['img2'], features['img2'])
+
+
+def test_load_features_missing(tmp_path):
+    """Test a clear error when neither format exists."""
+    with pytest.raises(FileNotFoundError):
+        load_features(str(tmp_path / 'nothing'))
+
+
+@pytest.mark.parametrize("name,dtype", [("float16", np.float16), ("int8", np.int8)])
+def test_compressed_codecs_decode_on_read(tmp_path, features, name, dtype):
+    """Test float16 / int8 stores are smaller and decode to float32 on read."""
+    from utils.feature_codecs import get_codec
+    
+    raw = FeatureStore.create(str(tmp_path / 'raw'), features)
+    store = FeatureStore.create(str(tmp_path / name), features, codec=get_codec(name))
+    reopened = FeatureStore(str(tmp_path / name))
+    
+    assert reopened.matrix.dtype == dtype
+    assert reopened.nbytes < raw.nbytes
+    assert reopened['img1'].dtype == np.float32
+    assert reopened['img1'].shape == (1, 16)
+    np.testing.assert_allclose(reopened['img1'], features['img1'], atol=1e-2)
+    np.testing.assert_allclose(store.rows(['img0', 'img4'])[1], features['img4'][0], atol=1e-2)
+
+
+def test_pca_codec_reduces_dimension(tmp_path):
+    """Test PCA stores reduced features and projects raw inference features identically."""
+    from utils.feature_codecs import fit_codec
+    from utils.feature_store import load_codec
+    
+    rng = np.random.default_rng(1)
+    basis = rng.normal(size=(4, 32)).astype(np.float32)
+    features = {f"img{i}": (rng.normal(size=(1, 4)) @ basis).astype(np.float32) for i in range(40)}
+    train_ids = [f"img{i}" for i in range(30)]
+    
+    codec = fit_codec('pca', features, fit_ids=train_ids, pca_dim=4)
+    store = FeatureStore.create(str(tmp_path / 'pca'), features, codec=codec)
+    
+    assert store.feature_dim == 4
+    assert store['img35'].shape == (1, 4)
+    # Rank-4 data is reconstructed exactly from 4 components
+    reconstructed = store['img35'] @ codec.components + codec.mean
+    np.testing.assert_allclose(reconstructed, features['img35'], atol=1e-3)
+    # A codec reloaded at inference gives the same projection
+    np.testing.assert_allclose(
+        load_codec(str(tmp_path / 'pca')).transform(features['img35']), store['img35'], atol=1e-5
+    )
+
+
+def test_subset_keeps_store_compressed(tmp_path, features):
+    """Test subset() restricts ids without decoding rows."""
+    from utils.feature_codecs import get_codec
+    
+    store = FeatureStore.create(str(tmp_path / 'store'), features, codec=get_codec('int8'))
+    subset = store.subset(['img1', 'img3', 'missing'])
+    
+    assert isinstance(subset, FeatureStore)
+    assert list(subset) == ['img1', 'img3']
+    assert 'img0' not in subset
+    assert subset.matrix is store.matrix
+
+
+def test_crash_mid_swap_keeps_previous_version(tmp_path, features, monkeypatch):
+    """Test a crash between the swap's renames leaves the old store to reopen, not no store."""
+    import utils.feature_store as feature_store
+    
+    path = tmp_path / 'store'
+    FeatureStore.create(str(path), features)
+    real_replace = feature_store.os.replace
+    
+    renames = []
+    
+    def crash_after_first_rename(src, dst):
+        if renames:
+            raise OSError("crashed")
+        renames.append(dst)
+        real_replace(src, dst)
+    
+    monkeypatch.setattr(feature_store.os, 'replace', crash_after_first_rename)
+    with pytest.raises(OSError, match="crashed"):
+        FeatureStore.merge(str(path), {'new': np.ones((1, 16), np.float32)}, remove_ids=['img0'])
+    monkeypatch.setattr(feature_store.os, 'replace', real_replace)
+    
+    assert not path.exists()
+    assert set(FeatureStore(str(path))) == set(features)
+    
+    merged = FeatureStore.merge(str(path), {'new': np.ones((1, 16), np.float32)}, remove_ids=['img0'])
+    assert set(merged) == set(features) - {'img0'} | {'new'}
+    assert not (tmp_path / 'store.old').exists() and not (tmp_path / 'store.tmp').exists()
@@ -0,0 +1,77 @@
+"""Tests for streaming images out of zip and tar archives."""
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.image_archive import iter_sources, list_archive_images
+
+tf = pytest.importorskip("tensorflow")
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """A directory of small JPEGs."""
+    directory = tmp_path / "Images"
+    directory.mkdir()
+    rng = np.random.default_rng(3)
+    for i in range(5):
+        Image.fromarray(rng.integers(0, 255, (40, 50, 3), dtype=np.uint8)).save(directory / f"img{i}.jpg")
+    (directory / "readme.txt").write_text("not an image")
+    return directory
+
+
+@pytest.fixture(params=["zip", "tar.gz"])
+def archive(request, image_dir, tmp_path):
+    """The image directory packed as a zip or a gzipped tar."""
+    path = tmp_path / f"images.{request.param}"
+    if request.param == "zip":
+        with zipfile.ZipFile(path, 'w') as zf:
+            for file in sorted(image_dir.iterdir()):
+                zf.write(file, f"Images/{file.name}")
+    else:
+        with tarfile.open(path, 'w:gz') as tf_archive:
+            tf_archive.add(image_dir, arcname="Images")
+    return str(path)
+
+
+def test_archive_members_stream_in_one_pass(archive, image_dir):
+    """Test archive members are listed and read back byte for byte."""
+    items = list_archive_images(archive)
+    
+    assert sorted(image_id for image_id, _ in items) == [f"img{i}" for i in range(5)]
+    for image_id, source in iter_sources(reversed(items)):
+        assert source.getvalue() == (image_dir / f"{image_id}.jpg").read_bytes()
+
+
+def test_pipeline_extracts_from_archive(archive, image_dir):
+    """Test features from an archive match features from the unpacked files."""
+    from utils.extraction_manifest import update_feature_store
+    from utils.feature_pipeline import FeaturePipeline
+    from utils.feature_store import FeatureStore
+    
+    inputs = tf.keras.Input(shape=(32, 32, 3))
+    model = tf.keras.Model(inputs, tf.keras.layers.GlobalAveragePooling2D()(inputs))
+    pipeline = FeaturePipeline(model=model, batch_size=2, target_size=(32, 32), fast_decode=True)
+    items = list_archive_images(archive)
+    
+    store_path = str(image_dir.parent / "store")
+    assert update_feature_store(items, store_path, pipeline)["extracted"] == 5
+    assert update_feature_store(items, store_path, pipeline)["extracted"] == 0
+    
+    reference = pipeline.extract([(f"img{i}", str(image_dir / f"img{i}.jpg")) for i in range(5)], progress=False)
+    store = FeatureStore(store_path)
+    for image_id, features in reference.items():
+        np.testing.assert_array_equal(store[image_id], features)
+
+
+def test_missing_members_are_logged_and_skipped(archive, caplog):
+    """Test a member missing from the archive is logged and the others still stream."""
+    from utils.image_archive import member_path
+    
+    items = list_archive_images(archive) + [("gone", member_path(archive, "Images/gone.jpg"))]
+    
+    assert sorted(image_id for image_id, _ in iter_sources(items)) == [f"img{i}" for i in range(5)]
+    assert "Images/gone.jpg" in caplog.text
@@ -0,0 +1,48 @@
+"""Tests for remote API upload preparation."""
+import numpy as np
+from PIL import Image
+
+from utils.image_payload import clear_cache, prepare_image, target_size
+
+
+def test_target_size_openai_short_side():
+    """Test OpenAI images are fit to 2048 and then a 768 short side."""
+    assert target_size((4000, 3000), 'openai') == (1024, 768)
+    assert target_size((400, 300), 'openai') == (400, 300)
+
+
+def test_target_size_gemini_long_side():
+    """Test Gemini images are capped on the long side only."""
+    assert target_size((6144, 1024), 'gemini') == (3072, 512)
+
+
+def test_prepare_image_is_smaller_than_png():
+    """Test the encoded payload is a downsized JPEG."""
+    clear_cache()
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (1500, 2000, 3), dtype=np.uint8))
+    
+    payload = prepare_image(image, provider='openai')
+    
+    assert payload.mime_type == 'image/jpeg'
+    assert payload.size == (1024, 768)
+    assert payload.data_url.startswith('data:image/jpeg;base64,')
+    assert payload.raw[:2] == b'\xff\xd8'
+
+
+def test_prepare_image_cached_by_content():
+    """Test identical images share one encoded payload."""
+    clear_cache()
+    first = prepare_image(Image.new('RGB', (64, 64), 'red'), provider='openai')
+    second = prepare_image(Image.new('RGB', (64, 64), 'red'), provider='openai')
+    other = prepare_image(Image.new('RGB', (64, 64), 'blue'), provider='openai')
+    
+    assert first is second
+    assert other is not first
+
+
+def test_prepare_image_flattens_alpha():
+    """Test RGBA images can be encoded as JPEG."""
+    clear_cache()
+    payload = prepare_image(Image.new('RGBA', (32, 32), (0, 0, 0, 0)), provider='gemini')
+    assert payload.mime_type == 'image/jpeg'
@@ -0,0 +1,45 @@
+"""Tests for the model store."""
+from utils import model_store
+from utils.model_store import ModelStore, resolve_cache_dir, warmup
+
+
+def test_resolve_cache_dir_prefers_environment(monkeypatch, tmp_path):
+    """Test HF_HOME from the environment wins over config.yaml."""
+    monkeypatch.setenv('HF_HOME', str(tmp_path))
+    assert resolve_cache_dir() == tmp_path
+
+
+def test_resolve_cache_dir_from_config(monkeypatch, tmp_path):
+    """Test model_store.cache_dir is used when HF_HOME is unset."""
+    monkeypatch.delenv('HF_HOME', raising=False)
+    monkeypatch.setattr(model_store.config, 'get', lambda key, default=None: str(tmp_path) if key == 'model_store.cache_dir' else default)
+    assert resolve_cache_dir() == tmp_path
+
+
+def test_bundle_export_install_roundtrip(tmp_path):
+    """Test a cached bundle can be packed and installed into another cache."""
+    source = ModelStore(str(tmp_path / 'source'))
+    repo_dir = source.hub_dir / 'models--Salesforce--blip-image-captioning-base' / 'snapshots' / 'abc'
+    repo_dir.mkdir(parents=True)
+    (repo_dir / 'config.json').write_text('{}')
+    
+    archive = source.export_bundle(['blip'], str(tmp_path / 'bundle.tar.gz'))
+    target = ModelStore(str(tmp_path / 'target'))
+    target.install_bundle(str(archive))
+    
+    installed = target.hub_dir / 'models--Salesforce--blip-image-captioning-base' / 'snapshots' / 'abc' / 'config.json'
+    assert installed.read_text() == '{}'
+
+
+def test_warmup_runs_one_inference():
+    """Test warmup calls the captioner once with a dummy image."""
+    calls = []
+    
+    class FakeCaptioner:
+        def generate_caption(self, image, **kwargs):
+            calls.append(image.size)
+            return "caption", {}
+    
+    elapsed = warmup(FakeCaptioner(), image_size=64)
+    assert calls == [(64, 64)]
+    assert elapsed >= 0
@@ -0,0 +1,278 @@
+"""Tests for caption decoding utilities."""
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from tensorflow.keras.preprocessing.text import Tokenizer  # noqa: E402
+
+from model import IncrementalDecoder, define_model, define_sequence_model, set_precision_policy  # noqa: E402
+from utils.model_utils import (  # noqa: E402
+    CaptionGenerator,
+    generate_caption_beam_search,
+    generate_caption_greedy,
+    generate_captions_beam_search_batch,
+    generate_captions_greedy_batch,
+    generate_captions_incremental,
+)
+
+
+@pytest.fixture(scope="module")
+def caption_setup():
+    """Tiny untrained caption model with a real tokenizer."""
+    tf.keras.utils.set_random_seed(0)
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([
+        'startseq a dog runs on grass endseq',
+        'startseq a cat sits on a mat endseq',
+        'startseq two children play in the water endseq',
+    ])
+    vocab_size = len(tokenizer.word_index) + 1
+    model = define_model(vocab_size, max_length=8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    photos = np.random.default_rng(0).random((4, 12)).astype(np.float32)
+    return model, tokenizer, photos
+
+
+def test_greedy_batch_matches_single(caption_setup):
+    """Test batched greedy decoding gives the per-image captions."""
+    model, tokenizer, photos = caption_setup
+    
+    batch = generate_captions_greedy_batch(model, tokenizer, photos, 8)
+    single = [generate_caption_greedy(model, tokenizer, photos[i:i + 1], 8) for i in range(len(photos))]
+    
+    assert batch == single
+
+
+def test_beam_batch_matches_single(caption_setup):
+    """Test batched beam search gives the per-image captions."""
+    model, tokenizer, photos = caption_setup
+    
+    batch = generate_captions_beam_search_batch(model, tokenizer, photos, 8, beam_width=3)
+    single = [
+        generate_caption_beam_search(model, tokenizer, photos[i:i + 1], 8, beam_width=3)
+        for i in range(len(photos))
+    ]
+    
+    assert batch == single
+
+
+def test_generator_batch(caption_setup):
+    """Test CaptionGenerator.generate_batch returns one clean caption per image."""
+    model, tokenizer, photos = caption_setup
+    generator = CaptionGenerator(model, tokenizer, 8, use_beam_search=False)
+    
+    captions = generator.generate_batch(photos)
+    
+    assert len(captions) == len(photos)
+    assert captions[1] == generator.generate(photos[1:2])
+    assert not any('startseq' in c or 'endseq' in c for c in captions)
+
+
+def test_sequences_use_sparse_targets(caption_setup, tmp_path):
+    """Test int32 targets train both new models and resumed one-hot models."""
+    from model import use_sparse_targets
+    from utils.model_utils import create_sequences
+    
+    model, tokenizer, photos = caption_setup
+    vocab_size = len(tokenizer.word_index) + 1
+    descriptions = {"a": ['startseq a dog runs on grass endseq'], "b": ['startseq a cat sits on a mat endseq']}
+    X1, X2, y = create_sequences(tokenizer, 8, descriptions, {"a": photos[:1], "b": photos[1:2]}, vocab_size)
+    
+    assert y.dtype == np.int32 and y.shape == (len(X1),)
+    
+    # A model saved with the old one-hot loss keeps its weights and only swaps the loss
+    legacy = define_model(vocab_size, max_length=8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    legacy.compile(loss='categorical_crossentropy', optimizer='adam')
+    legacy.save(tmp_path / "legacy.keras")
+    resumed = use_sparse_targets(tf.keras.models.load_model(tmp_path / "legacy.keras"))
+    
+    for m in (model, resumed):
+        history = m.fit([X1, X2], y, epochs=1, verbose=0)
+        assert np.isfinite(history.history['loss'][0])
+
+
+@pytest.fixture(scope="module")
+def sequence_setup(caption_setup):
+    """Tiny untrained teacher-forcing model sharing the tokenizer and photos."""
+    _, tokenizer, photos = caption_setup
+    tf.keras.utils.set_random_seed(0)
+    vocab_size = len(tokenizer.word_index) + 1
+    model = define_sequence_model(vocab_size, max_length=8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    return model, tokenizer, photos
+
+
+def test_incremental_decoder_matches_sequence_model(sequence_setup):
+    """Test single-step probabilities equal the full model's per-timestep softmax."""
+    model, tokenizer, photos = sequence_setup
+    tokens = np.array(tokenizer.texts_to_sequences(['startseq a dog runs on grass endseq'] * len(photos)))
+    padded = np.zeros((len(photos), 8), dtype=np.int32)
+    padded[:, :tokens.shape[1]] = tokens
+    
+    full = model.predict([photos, padded], verbose=0)
+    decoder = IncrementalDecoder(model)
+    image = decoder.encode(photos)
+    h, c = decoder.initial_state(len(photos))
+    
+    for t in range(tokens.shape[1]):
+        probs, h, c = decoder.step(image, padded[:, t], h, c)
+        np.testing.assert_allclose(probs, full[:, t], rtol=1e-4, atol=1e-6)
+
+
+def test_incremental_greedy_matches_full_model(sequence_setup):
+    """Test incremental greedy decoding picks what re-running the whole prefix picks."""
+    model, tokenizer, photos = sequence_setup
+    index_word = {index: word for word, index in tokenizer.word_index.items()}
+    end = tokenizer.word_index['endseq']
+    
+    expected = []
+    for photo in photos:
+        seq = [tokenizer.word_index['startseq']]
+        for _ in range(8):
+            padded = np.zeros((1, 8), dtype=np.int32)
+            padded[0, :len(seq)] = seq[-8:]
+            probs = model.predict([photo[np.newaxis], padded], verbose=0)[0, min(len(seq), 8) - 1]
+            probs[0] = 0
+            seq.append(int(np.argmax(probs)))
+            if seq[-1] == end:
+                break
+        expected.append(' '.join(index_word[i] for i in seq[1:] if i != end))
+    
+    decoder = IncrementalDecoder(model)
+    assert generate_captions_incremental(decoder, tokenizer, photos, 8) == expected
+
+
+def test_caption_generator_uses_incremental_decoder(sequence_setup):
+    """Test CaptionGenerator decodes sequence models through the step decoder."""
+    model, tokenizer, photos = sequence_setup
+    generator = CaptionGenerator(model, tokenizer, max_length=8, beam_width=3)
+    
+    captions = generator.generate_batch(photos)
+    
+    assert generator.decoder is not None
+    assert len(captions) == len(photos) and "Error" not in captions[0]
+    assert generator.generate(photos[:1]) == captions[0]
+
+
+def test_prefixes_decode_at_current_length(caption_setup):
+    """Test trimming left padding to the prefix length leaves predictions unchanged."""
+    from utils.model_utils import _left_pad, _prefix_width
+    
+    model, _, photos = caption_setup
+    prefixes = [[1, 4], [1, 2, 3]]
+    
+    assert _prefix_width(model, prefixes, 8) == 3
+    np.testing.assert_allclose(
+        model.predict([photos[:2], _left_pad(prefixes, 3)], verbose=0),
+        model.predict([photos[:2], _left_pad(prefixes, 8)], verbose=0),
+        rtol=1e-5, atol=1e-6
+    )
+
+
+def test_mixed_bfloat16_model_keeps_float32_softmax(caption_setup):
+    """Test the bfloat16 policy computes in bfloat16 but outputs and trains in float32."""
+    _, tokenizer, photos = caption_setup
+    set_precision_policy('mixed_bfloat16')
+    try:
+        model = define_model(len(tokenizer.word_index) + 1, 8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    finally:
+        set_precision_policy('float32')
+    
+    prefixes = np.array(tokenizer.texts_to_sequences(['startseq a dog'] * len(photos)))
+    loss = model.train_on_batch((photos, prefixes), np.ones(len(photos), dtype=np.int32))
+    
+    assert model.get_layer('lstm').compute_dtype == 'bfloat16'
+    assert model.get_layer('lstm').variable_dtype == 'float32'
+    assert model.output.dtype == 'float32'
+    assert np.isfinite(loss if np.isscalar(loss) else loss[0])
+
+
+def test_bfloat16_decoder_tracks_float32(sequence_setup):
+    """Test decoding float32 weights under bfloat16 stays close to float32."""
+    model, tokenizer, photos = sequence_setup
+    tokens = np.array(tokenizer.texts_to_sequences(['startseq a cat sits'] * len(photos)))
+    
+    probs = {}
+    for precision in ('float32', 'mixed_bfloat16'):
+        decoder = IncrementalDecoder(model, precision)
+        image = decoder.encode(photos)
+        h, c = decoder.initial_state(len(photos))
+        for t in range(tokens.shape[1]):
+            step_probs, h, c = decoder.step(image, tokens[:, t], h, c)
+        probs[precision] = step_probs
+    
+    assert probs['mixed_bfloat16'].dtype == np.float32
+    np.testing.assert_allclose(probs['mixed_bfloat16'], probs['float32'], atol=2e-2)
+    assert CaptionGenerator(model, tokenizer, 8, precision='mixed_bfloat16').generate_batch(photos)[0] != "Error generating caption"
+
+
+def test_shortlist_decoding_renormalizes_full_softmax(sequence_setup):
+    """Test shortlist steps equal the full step softmax restricted to each image's candidates."""
+    from utils.shortlist import Shortlist
+    
+    model, tokenizer, photos = sequence_setup
+    captions = ['startseq a cat sits on a mat endseq', 'startseq a dog runs on grass endseq']
+    descriptions = {str(i): [captions[i % 2]] for i in range(len(photos))}
+    features = {str(i): photos[i:i + 1] for i in range(len(photos))}
+    shortlist = Shortlist.fit(descriptions, features, tokenizer, size=6, clusters=2, common=2)
+    
+    decoder = IncrementalDecoder(model)
+    image = decoder.encode(photos)
+    h, c = decoder.initial_state(len(photos))
+    tokens = np.full(len(photos), tokenizer.word_index['startseq'])
+    full, _, _ = decoder.step(image, tokens, h, c)
+    hidden, _, _ = decoder.step_hidden(image, tokens, h, c)
+    clusters = shortlist.assign(photos)
+    probs = shortlist.probabilities(hidden, clusters, *decoder.output_weights)
+    
+    expected = np.take_along_axis(full, shortlist.words[clusters][:, 1:], axis=1)
+    np.testing.assert_allclose(probs[:, 1:], expected / expected.sum(axis=1, keepdims=True), rtol=1e-4)
+    
+    allowed = {tokenizer.index_word[int(i)] for i in shortlist.words[:, 1:].ravel()}
+    captions = generate_captions_incremental(decoder, tokenizer, photos, 8, beam_width=3, shortlist=shortlist)
+    assert all(set(caption.split()) <= allowed for caption in captions)
+
+
+@pytest.mark.parametrize("sequence", [False, True])
+def test_sampled_softmax_trains_caption_model(caption_setup, sequence, tmp_path):
+    """Test the sampled softmax loss trains the shared output layer and saves the full model."""
+    from model import SampledSoftmaxTrainer
+    
+    _, tokenizer, photos = caption_setup
+    vocab_size = len(tokenizer.word_index) + 1
+    define = define_sequence_model if sequence else define_model
+    model = define(vocab_size, max_length=8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    trainer = SampledSoftmaxTrainer(model, num_sampled=4)
+    rng = np.random.default_rng(0)
+    text = rng.integers(1, vocab_size, (16, 8))
+    targets = rng.integers(1, vocab_size, (16, 8) if sequence else (16,))
+    kernel = model.get_layer('output').get_weights()[0].copy()
+    
+    history = trainer.fit([np.repeat(photos, 4, axis=0), text], targets, epochs=2, verbose=0)
+    trainer.save(tmp_path / "sampled.keras")
+    
+    assert np.isfinite(history.history['loss']).all()
+    assert not np.allclose(model.get_layer('output').get_weights()[0], kernel)
+    loaded = tf.keras.models.load_model(tmp_path / "sampled.keras")
+    assert loaded.output.shape[-1] == vocab_size
+    with pytest.raises(ValueError):
+        SampledSoftmaxTrainer(model, num_sampled=vocab_size)
+
+
+@pytest.mark.parametrize("sequence", [False, True])
+def test_sampled_softmax_evaluates_full_softmax_loss(caption_setup, sequence):
+    """Test evaluation reports the exact full-softmax loss, not the sampled one."""
+    from model import SampledSoftmaxTrainer
+    
+    _, tokenizer, photos = caption_setup
+    vocab_size = len(tokenizer.word_index) + 1
+    define = define_sequence_model if sequence else define_model
+    model = define(vocab_size, max_length=8, embedding_dim=16, lstm_units=16, feature_dim=12)
+    trainer = SampledSoftmaxTrainer(model, num_sampled=2)
+    rng = np.random.default_rng(1)
+    inputs = [np.repeat(photos, 4, axis=0), rng.integers(1, vocab_size, (16, 8))]
+    targets = rng.integers(1, vocab_size, (16, 8) if sequence else (16,))
+    
+    probs = model.predict(inputs, verbose=0)
+    expected = -np.log(np.take_along_axis(probs, targets[..., None], axis=-1)).mean()
+    
+    assert trainer.evaluate(inputs, targets, batch_size=16, verbose=0) == pytest.approx(expected, rel=1e-4)
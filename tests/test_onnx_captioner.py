@@ -0,0 +1,78 @@
+"""Tests for the ONNX Runtime caption decoding loop."""
+import numpy as np
+
+from utils.onnx_captioner import OnnxCaptionModel, _banned_ngram_tokens
+
+
+class FakeSession:
+    """Stands in for an onnxruntime session; always prefers last_token + 1."""
+
+    def __init__(self, vocab_size=6):
+        self.vocab_size = vocab_size
+        self.calls = 0
+
+    def run(self, _, feeds):
+        self.calls += 1
+        last = feeds["input_ids"][:, -1]
+        logits = np.full((len(last), 1, self.vocab_size), -5.0, dtype=np.float32)
+        logits[np.arange(len(last)), 0, np.minimum(last + 1, self.vocab_size - 1)] = 5.0
+        past = feeds.get("past_key_values.0.key")
+        length = 1 if past is None else past.shape[2] + 1
+        cache = np.zeros((len(last), 1, length, 2), dtype=np.float32)
+        return [logits, cache, cache]
+
+
+def make_model(eos_token_id=4):
+    """Build an OnnxCaptionModel around fake sessions."""
+    model = OnnxCaptionModel.__new__(OnnxCaptionModel)
+    model.config = {}
+    model.num_layers = 1
+    model.decoder_start_token_id = 0
+    model.eos_token_id = eos_token_id
+    model.pad_token_id = 0
+    model.encoder = type("Encoder", (), {"run": lambda self, _, feeds: [np.zeros((len(feeds["pixel_values"]), 3, 8), np.float32)]})()
+    model.decoder = FakeSession()
+    model.decoder_with_past = FakeSession()
+    model._past_names = ["past_key_values.0.key", "past_key_values.0.value"]
+    return model
+
+
+def test_banned_ngram_tokens():
+    """Test repeated n-grams are banned."""
+    assert _banned_ngram_tokens([1, 2, 3, 1, 2], 3) == [3]
+    assert _banned_ngram_tokens([1, 2], 0) == []
+
+
+def test_greedy_uses_kv_cache():
+    """Test greedy decoding stops at EOS and reuses the cache after step one."""
+    model = make_model()
+    tokens = model.generate(np.zeros((1, 3, 4, 4)), max_length=10)
+    
+    assert tokens == [[0, 1, 2, 3, 4]]
+    assert model.decoder.calls == 1
+    assert model.decoder_with_past.calls == 3
+
+
+def test_beam_search_matches_greedy_on_peaked_logits():
+    """Test beam search finds the dominant path for every image in a batch."""
+    model = make_model()
+    tokens = model.generate(np.zeros((2, 3, 4, 4)), max_length=10, num_beams=3)
+    
+    assert tokens == [[0, 1, 2, 3, 4], [0, 1, 2, 3, 4]]
+
+
+def test_min_length_blocks_eos():
+    """Test EOS is suppressed until min_length tokens exist."""
+    model = make_model(eos_token_id=2)
+    tokens = model.generate(np.zeros((1, 3, 4, 4)), max_length=4, min_length=4)
+    
+    assert 2 not in tokens[0][1:]
+
+
+def test_beam_search_with_tiny_vocabulary():
+    """Test 2 * num_beams candidates may be all the beams have."""
+    model = make_model(eos_token_id=1)
+    model.decoder, model.decoder_with_past = FakeSession(vocab_size=2), FakeSession(vocab_size=2)
+    tokens = model.generate(np.zeros((1, 3, 4, 4)), max_length=10, num_beams=3)
+    
+    assert tokens == [[0, 1]]
@@ -0,0 +1,72 @@
+"""Tests for the per-image decoding shortlist."""
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from tensorflow.keras.preprocessing.text import Tokenizer  # noqa: E402
+
+from utils.shortlist import Shortlist, load_shortlist  # noqa: E402
+
+
+@pytest.fixture
+def topics():
+    """Two well-separated groups of images captioned with different words."""
+    rng = np.random.default_rng(0)
+    descriptions, photos = {}, {}
+    for i in range(20):
+        topic = i % 2
+        words = ['dog grass ball', 'boat water sea'][topic]
+        descriptions[f"img{i}"] = [f'startseq a {words} endseq', f'startseq the {words.split()[0]} endseq']
+        photos[f"img{i}"] = (rng.normal(size=(1, 8)) + (10 if topic else -10)).astype(np.float32)
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([c for captions in descriptions.values() for c in captions])
+    return descriptions, photos, tokenizer
+
+
+def test_fit_ranks_cluster_words(topics):
+    """Test each image's shortlist holds its topic's words and the common words."""
+    descriptions, photos, tokenizer = topics
+    
+    shortlist = Shortlist.fit(descriptions, photos, tokenizer, size=8, clusters=2, common=3)
+    
+    index = tokenizer.word_index
+    dog, boat = (set(shortlist.candidates(photos[f"img{i}"])[0].tolist()) for i in (0, 1))
+    assert shortlist.words.shape == (2, 8) and (shortlist.words[:, 0] == 0).all()
+    assert {index['dog'], index['grass'], index['ball'], index['endseq']} <= dog
+    assert {index['boat'], index['water'], index['sea'], index['endseq']} <= boat
+    assert index['startseq'] not in dog | boat
+    assert shortlist.coverage(descriptions, photos, tokenizer) == 1.0
+
+
+def test_probabilities_match_renormalized_softmax():
+    """Test the shortlist softmax equals the full softmax restricted to the candidates."""
+    rng = np.random.default_rng(0)
+    kernel = rng.normal(size=(4, 30)).astype(np.float32)
+    bias = rng.normal(size=30).astype(np.float32)
+    hidden = rng.normal(size=(5, 4)).astype(np.float32)
+    words = np.array([[0, 3, 7, 9], [0, 1, 2, 29]], dtype=np.int32)
+    clusters = np.array([0, 1, 1, 0, 1])
+    shortlist = Shortlist(np.zeros((2, 4)), words)
+    
+    probs = shortlist.probabilities(hidden, clusters, kernel, bias)
+    
+    logits = hidden @ kernel + bias
+    for row, cluster in enumerate(clusters):
+        expected = np.exp(logits[row, words[cluster, 1:]])
+        np.testing.assert_allclose(probs[row, 1:], expected / expected.sum(), rtol=1e-5)
+    assert (probs[:, 0] == 0).all()
+
+
+def test_save_and_load(topics, tmp_path):
+    """Test a saved shortlist loads back, and a missing one loads as None."""
+    descriptions, photos, tokenizer = topics
+    shortlist = Shortlist.fit(descriptions, photos, tokenizer, size=5, clusters=2)
+    path = str(tmp_path / "shortlist.npz")
+    
+    shortlist.save(path)
+    loaded = load_shortlist(path)
+    
+    np.testing.assert_array_equal(loaded.words, shortlist.words)
+    np.testing.assert_array_equal(loaded.candidates(photos["img3"]), shortlist.candidates(photos["img3"]))
+    assert load_shortlist(str(tmp_path / "missing.npz")) is None
@@ -0,0 +1,108 @@
+"""Tests for resumable training checkpoints."""
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from tensorflow.keras.callbacks import Callback  # noqa: E402
+from tensorflow.keras.preprocessing.text import Tokenizer  # noqa: E402
+
+from model import define_model  # noqa: E402
+from utils.input_pipeline import build_dataset  # noqa: E402
+from utils.training_checkpoint import TrainingCheckpoint, fit_resumable  # noqa: E402
+
+STEPS_PER_EPOCH = 6
+
+
+class Crash(Exception):
+    """Stands in for the process dying mid-epoch."""
+
+
+class CrashAfter(Callback):
+    def __init__(self, batches):
+        super().__init__()
+        self.batches = batches
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.batches -= 1
+        if not self.batches:
+            raise Crash()
+
+
+@pytest.fixture
+def caption_data():
+    """A few captions, a tokenizer and features."""
+    rng = np.random.default_rng(0)
+    descriptions = {
+        f"img{i}": [f'startseq a {word} runs on grass endseq', f'startseq the {word} swims endseq']
+        for i, word in enumerate(['dog', 'cat', 'boy', 'girl', 'horse', 'bird'])
+    }
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts([c for captions in descriptions.values() for c in captions])
+    photos = {image_id: rng.random((1, 4), dtype=np.float32) for image_id in descriptions}
+    return descriptions, photos, tokenizer
+
+
+def train(caption_data, directory, crash_after=None, resume=False):
+    """Two epochs of a dropout model on a seeded input; returns its weights and state."""
+    descriptions, photos, tokenizer = caption_data
+    tf.keras.utils.set_random_seed(0)
+    model = define_model(len(tokenizer.word_index) + 1, 8, embedding_dim=8, lstm_units=8, feature_dim=4)
+    state = TrainingCheckpoint(str(directory), save_steps=4, seed=7)
+    if resume:
+        # Weights must come from the checkpoint, not the seeded initialisation
+        model.set_weights([np.zeros_like(w) for w in model.get_weights()])
+        assert state.restore(model)
+    
+    def make_input(position):
+        return build_dataset(
+            descriptions, photos, tokenizer, 8, batch_size=4, shuffle_buffer=64,
+            bucket_boundaries=[], repeat=True, seed=int(state.seed), skip=position
+        )
+    
+    callbacks = [state] + ([CrashAfter(crash_after)] if crash_after else [])
+    history = fit_resumable(model, make_input, 2, STEPS_PER_EPOCH, state, callbacks=callbacks, verbose=0)
+    return model, state, history
+
+
+def test_seeded_input_resumes_at_batch(caption_data):
+    """Test a seeded, repeating input is one reproducible stream that ``skip`` starts into."""
+    descriptions, photos, tokenizer = caption_data
+    
+    def batches(skip, count):
+        dataset = build_dataset(
+            descriptions, photos, tokenizer, 8, batch_size=4, repeat=True, seed=3, skip=skip
+        )
+        return [targets.numpy() for _, targets in dataset.take(count)]
+    
+    stream = batches(0, 12)
+    assert all(len(targets) == 4 for targets in stream)
+    np.testing.assert_array_equal(np.concatenate(batches(9, 3)), np.concatenate(stream[9:]))
+
+
+def test_resume_mid_epoch_matches_uninterrupted_run(caption_data, tmp_path):
+    """Test a run killed mid-epoch and resumed ends with the weights of an uninterrupted run."""
+    reference, _, history = train(caption_data, tmp_path / "reference")
+    assert len(history["loss"]) == 2
+    
+    # Killed after batch 9 of 12: the latest checkpoint is at batch 8, in epoch 2
+    with pytest.raises(Crash):
+        train(caption_data, tmp_path / "run", crash_after=9)
+    
+    resumed, state, history = train(caption_data, tmp_path / "run", resume=True)
+    
+    assert int(state.position) == 2 * STEPS_PER_EPOCH and int(state.epoch) == 2
+    assert int(resumed.optimizer.iterations) == 2 * STEPS_PER_EPOCH
+    assert len(history["loss"]) == 1
+    for expected, actual in zip(reference.get_weights(), resumed.get_weights()):
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_restore_without_checkpoint(caption_data, tmp_path):
+    """Test an empty directory restores nothing and leaves the run at its start."""
+    descriptions, photos, tokenizer = caption_data
+    model = define_model(len(tokenizer.word_index) + 1, 8, embedding_dim=8, lstm_units=8, feature_dim=4)
+    state = TrainingCheckpoint(str(tmp_path), seed=5)
+    
+    assert not state.restore(model)
+    assert int(state.epoch) == int(state.position) == 0 and int(state.seed) == 5
@@ -0,0 +1,63 @@
+"""Tests for the training throughput profiler."""
+import builtins
+import json
+import time
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from model import define_model, get_callbacks  # noqa: E402
+from utils.config import config  # noqa: E402
+from utils.training_profiler import ThroughputProfiler, peak_rss_mb, step_summary  # noqa: E402
+
+
+def test_step_summary():
+    """Test throughput, percentiles and the input wait share of a run of steps."""
+    summary = step_summary(wait=[0.01, 0.03], compute=[0.09, 0.07], samples=[32, 32])
+    
+    assert summary["steps"] == 2 and summary["samples"] == 64
+    assert summary["samples_per_second"] == pytest.approx(320)
+    assert summary["step_ms"]["p50"] == pytest.approx(100)
+    assert summary["input_wait_ms"] == pytest.approx(20)
+    assert summary["input_wait_fraction"] == pytest.approx(0.2)
+
+
+def test_profiler_separates_input_wait(tmp_path, monkeypatch):
+    """Test a slow generator shows up as input wait and the summary lands next to the checkpoints."""
+    model = define_model(20, 6, embedding_dim=8, lstm_units=8, feature_dim=4)
+    rng = np.random.default_rng(0)
+    batch = ((rng.random((8, 4), dtype=np.float32), rng.integers(1, 20, (8, 6))), rng.integers(1, 20, 8))
+    
+    def slow_batches():
+        while True:
+            time.sleep(0.05)
+            yield batch
+    
+    monkeypatch.setitem(config._config['training'], 'profile', True)
+    profiler = next(cb for cb in get_callbacks(str(tmp_path)) if isinstance(cb, ThroughputProfiler))
+    model.make_train_function()
+    keras_train_function = model.train_function
+    model.fit(slow_batches(), steps_per_epoch=4, epochs=2, callbacks=[profiler], verbose=0)
+    
+    summary = json.load(open(tmp_path / "throughput.json"))
+    assert [record["epoch"] for record in summary["epochs"]] == [1, 2]
+    assert summary["total"]["samples"] == 8 * 7  # the first (tracing) step is skipped
+    assert summary["total"]["input_wait_ms"] > summary["total"]["compute_ms"]
+    assert summary["epochs"][1]["input_wait_fraction"] > 0.5
+    assert summary["peak_rss_mb"] > 0
+    assert model.train_function is keras_train_function
+
+
+def test_peak_rss_without_resource(monkeypatch):
+    """Test peak RSS is None, not an import error, where neither resource nor psutil exists."""
+    real_import = builtins.__import__
+    
+    def import_without(name, *args, **kwargs):
+        if name in ("resource", "psutil"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    
+    monkeypatch.setattr(builtins, "__import__", import_without)
+    assert peak_rss_mb() is None
@@ -2,7 +2,6 @@ import os
 from pickle import load
 from numpy import array
 from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.models import load_model
 from tqdm import tqdm
 
@@ -64,11 +63,10 @@ def create_sequences(tokenizer, max_length, descriptions, photos, vocab_size):
             for i in range(1, len(seq)):
                 in_seq, out_seq = seq[:i], seq[i]
                 in_seq = pad_sequences([in_seq], maxlen=max_length)[0]
-                out_seq = to_categorical([out_seq], num_classes=vocab_size)[0]
                 X1.append(photos[key][0])
                 X2.append(in_seq)
                 y.append(out_seq)
-    return array(X1), array(X2), array(y)
+    return array(X1), array(X2), array(y, dtype='int32')
 
 def data_generator(descriptions, photos, tokenizer, max_length, vocab_size):
     while 1:
@@ -95,7 +93,7 @@ if __name__ == "__main__":
     print('Photos: train=%d' % len(train_features))
 
     from model import define_model
-    model = define_model(vocab_size, max_length)
+    model = define_model(vocab_size, max_length, feature_dim=next(iter(train_features.values())).shape[-1])
     epochs = 20
     steps = len(train_descriptions)
     for i in range(epochs):
@@ -5,7 +5,6 @@ from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Input, Dense, LSTM, Embedding, Dropout, Add
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.preprocessing.text import Tokenizer
 
 print("="*60)
@@ -89,7 +88,7 @@ merged = Dense(lstm_units, activation='relu')(merged)
 output = Dense(vocab_size, activation='softmax')(merged)
 
 model = Model(inputs=[input_img, input_caption], outputs=output)
-model.compile(loss='categorical_crossentropy', optimizer=Adam(learning_rate=0.001))
+model.compile(loss='sparse_categorical_crossentropy', optimizer=Adam(learning_rate=0.001))
 
 print("Model built successfully")
 
@@ -106,7 +105,7 @@ for caption in all_captions:
     
     for i in range(1, len(seq)):
         in_seq = pad_sequences([seq[:i]], maxlen=max_length)[0]
-        out_seq = to_categorical([seq[i]], num_classes=vocab_size)[0]
+        out_seq = seq[i]
         
         X1.append(feature)
         X2.append(in_seq)
@@ -114,7 +113,7 @@ for caption in all_captions:
 
 X1 = np.array(X1)
 X2 = np.array(X2)
-y = np.array(y)
+y = np.array(y, dtype=np.int32)  # word indices, not one-hot
 
 print(f"Training samples: {len(X1)}")
 
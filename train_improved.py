@@ -3,8 +3,7 @@ import os
 import numpy as np
 from pickle import load, dump
 from pathlib import Path
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.utils import to_categorical
+from typing import Optional
 from tensorflow.keras.models import load_model as keras_load_model
 from tqdm import tqdm
 
@@ -13,21 +12,34 @@ from utils.logger import logger
 from utils.data_utils import (
     load_set, load_clean_descriptions, load_doc, to_lines
 )
-from model import define_model, get_callbacks
+from utils.caption_sequences import CaptionSequences
+from utils.dedup import apply_aliases, load_aliases, merge_duplicate_descriptions
+from utils.feature_store import FeatureStore, load_features
+from utils.training_checkpoint import TrainingCheckpoint, fit_resumable, skip_batches
+from model import (
+    SampledSoftmaxTrainer, define_model, define_sequence_model, get_callbacks, set_precision_policy,
+    use_sparse_targets
+)
 
 
-def load_photo_features(filename: str, dataset: set) -> dict:
+def load_photo_features(filename: Optional[str], dataset: set) -> dict:
     """Load photo features for specific dataset.
     
     Args:
-        filename: Path to features file
+        filename: Feature store directory or legacy .pkl file
+            (None = paths.feature_store, then paths.features_file)
         dataset: Set of image IDs
         
     Returns:
-        Dictionary of features
+        Dictionary of features (memory-mapped views when loaded from a store);
+        duplicate images resolve to their canonical row (utils/dedup.py)
     """
-    all_features = load(open(filename, 'rb'))
-    features = {k: all_features[k] for k in dataset if k in all_features}
+    all_features = apply_aliases(load_features(filename))
+    if isinstance(all_features, FeatureStore):
+        # Stays memory-mapped (and compressed) until rows are read
+        features = all_features.subset(dataset)
+    else:
+        features = {k: all_features[k] for k in dataset if k in all_features}
     logger.info(f"Loaded {len(features)} photo features")
     return features
 
@@ -38,7 +50,8 @@ def data_generator(
     tokenizer,
     max_length: int,
     vocab_size: int,
-    batch_size: int = 32
+    batch_size: int = 32,
+    seed: Optional[int] = None
 ):
     """Generate batches of training data.
     
@@ -48,49 +61,19 @@ def data_generator(
         tokenizer: Fitted tokenizer
         max_length: Maximum sequence length
         vocab_size: Vocabulary size
-        batch_size: Batch size
+        batch_size: Images per batch
+        seed: Seed for the image order (None = the global random state)
         
     Yields:
-        Tuple of ([image_features, sequences], targets)
+        Tuple of ((image_features, sequences), targets), targets being
+        int32 word indices for sparse categorical crossentropy
     """
-    # Create list of all image IDs
-    keys = list(descriptions.keys())
+    # Tokenised and indexed once; each batch is a few array gathers
+    sequences = CaptionSequences(tokenizer, descriptions, max_length)
+    rng = None if seed is None else np.random.default_rng(seed)
     
     while True:
-        # Shuffle keys for each epoch
-        np.random.shuffle(keys)
-        
-        for i in range(0, len(keys), batch_size):
-            batch_keys = keys[i:i + batch_size]
-            
-            X1_batch, X2_batch, y_batch = [], [], []
-            
-            for key in batch_keys:
-                if key not in photos:
-                    continue
-                
-                # Get photo features
-                photo = photos[key][0]
-                
-                # Process each description
-                for desc in descriptions[key]:
-                    seq = tokenizer.texts_to_sequences([desc])[0]
-                    
-                    # Create input-output pairs
-                    for j in range(1, len(seq)):
-                        in_seq, out_seq = seq[:j], seq[j]
-                        in_seq = pad_sequences([in_seq], maxlen=max_length)[0]
-                        out_seq = to_categorical([out_seq], num_classes=vocab_size)[0]
-                        
-                        X1_batch.append(photo)
-                        X2_batch.append(in_seq)
-                        y_batch.append(out_seq)
-            
-            if X1_batch:
-                yield (
-                    [np.array(X1_batch), np.array(X2_batch)],
-                    np.array(y_batch)
-                )
+        yield from sequences.batches(photos, batch_size, rng=rng)
 
 
 def calculate_steps(descriptions: dict, batch_size: int) -> int:
@@ -113,14 +96,84 @@ def calculate_steps(descriptions: dict, batch_size: int) -> int:
     return max(steps, 1)
 
 
+def make_training_input(
+    descriptions: dict,
+    photos: dict,
+    tokenizer,
+    max_length: int,
+    vocab_size: int,
+    batch_size: int,
+    shuffle: bool = True,
+    bucket_boundaries: Optional[list] = None,
+    seed: Optional[int] = None,
+    skip: int = 0
+):
+    """Training or validation input for ``model.fit``.
+
+    ``training.input_pipeline`` selects the tf.data pipeline
+    (utils/input_pipeline.py, the default) or the Python generator. The
+    sequence architecture (``model.architecture: sequence``) trains on
+    whole captions and always uses tf.data.
+
+    With a ``seed`` the input is resumable (utils/training_checkpoint.py):
+    it repeats indefinitely, every run yields the same stream of batches,
+    and the stream starts ``skip`` batches in.
+
+    Args:
+        descriptions: Dictionary of descriptions
+        photos: Dictionary of photo features
+        tokenizer: Fitted tokenizer
+        max_length: Maximum sequence length
+        vocab_size: Vocabulary size
+        batch_size: Batch size
+        shuffle: Shuffle every epoch (off for validation)
+        bucket_boundaries: Length buckets for the tf.data pipelines
+            (None = training.bucket_boundaries, empty = full-width batches)
+        seed: Shuffle seed of a resumable training input
+        skip: Batches of the resumable input already trained on
+
+    Returns:
+        Tuple of (dataset or generator, steps per epoch or None when the
+        dataset knows its own length)
+    """
+    resumable = seed is not None
+    if config.get('model.architecture', 'merge') == 'sequence':
+        from utils.input_pipeline import build_sequence_dataset
+
+        dataset = build_sequence_dataset(
+            descriptions, photos, tokenizer, max_length, batch_size,
+            shuffle=shuffle, bucket_boundaries=bucket_boundaries, repeat=resumable, seed=seed, skip=skip
+        )
+        captions = sum(len(captions) for image_id, captions in descriptions.items() if image_id in photos)
+        return dataset, max(captions // batch_size, 1) if resumable else None
+
+    if config.get('training.input_pipeline', 'tf.data') == 'tf.data':
+        from utils.input_pipeline import build_dataset
+
+        dataset = build_dataset(
+            descriptions, photos, tokenizer, max_length, batch_size,
+            shuffle=shuffle, bucket_boundaries=bucket_boundaries, repeat=resumable, seed=seed, skip=skip
+        )
+        return dataset, calculate_steps(descriptions, batch_size) if resumable else None
+
+    generator = data_generator(descriptions, photos, tokenizer, max_length, vocab_size, batch_size, seed)
+    return skip_batches(generator, skip), calculate_steps(descriptions, batch_size)
+
+
 def train_model(
     resume_from: str = None,
     use_validation: bool = True
 ):
     """Train the caption generation model.
     
+    The full training state is checkpointed to ``<checkpoint_dir>/state``
+    (utils/training_checkpoint.py). Resuming from that directory continues
+    at the saved epoch and batch; resuming from a model file restarts the
+    epochs with its weights only.
+    
     Args:
-        resume_from: Path to model checkpoint to resume from
+        resume_from: Training-state checkpoint directory or model file to
+            resume from
         use_validation: Whether to use validation set
     """
     logger.info("Starting training process...")
@@ -149,14 +202,56 @@ def train_model(
     # Load descriptions and features
     descriptions_file = config.get('paths.descriptions_file')
     train_descriptions = load_clean_descriptions(descriptions_file, train_ids)
+    aliases = load_aliases()
+    if aliases:
+        train_descriptions = merge_duplicate_descriptions(train_descriptions, aliases)
     logger.info(f"Training descriptions: {len(train_descriptions)}")
     
-    features_file = config.get('paths.features_file')
+    features_file = None  # paths.feature_store, else legacy paths.features_file
     train_features = load_photo_features(features_file, train_ids)
-    logger.info(f"Training features: {len(train_features)}")
+    feature_dim = next(iter(train_features.values())).shape[-1]
+    logger.info(f"Training features: {len(train_features)} x {feature_dim}")
+    
+    # Create or load model
+    set_precision_policy()
+    checkpoint_dir = config.get('training.checkpoint_dir', 'checkpoints')
+    resume_state = bool(resume_from) and Path(resume_from).is_dir()
+    if resume_from and Path(resume_from).exists() and not resume_state:
+        logger.info(f"Resuming from checkpoint: {resume_from}")
+        model = use_sparse_targets(keras_load_model(resume_from))
+    else:
+        logger.info("Creating new model...")
+        architecture = config.get('model.architecture', 'merge')
+        define = define_sequence_model if architecture == 'sequence' else define_model
+        model = define(
+            vocab_size=vocab_size,
+            max_length=max_length,
+            embedding_dim=config.get('model.embedding_dim', 256),
+            lstm_units=config.get('model.lstm_units', 256),
+            dropout_rate=config.get('model.dropout_rate', 0.5),
+            feature_dim=feature_dim,
+            learning_rate=config.get('training.learning_rate', 0.001)
+        )
+    
+    # Models saved with a fixed text input length cannot take trimmed batches
+    bucket_boundaries = None if model.inputs[1].shape[1] is None else []
+    
+    # Sampled softmax trains the same layers; the full-softmax model is saved
+    num_sampled = config.get('training.sampled_softmax', 0)
+    trainer = SampledSoftmaxTrainer(model, num_sampled) if num_sampled else model
+    if num_sampled:
+        logger.info(f"Sampled softmax loss: {num_sampled} negatives per step")
     
-    # Calculate steps
-    steps_per_epoch = calculate_steps(train_descriptions, batch_size)
+    # Resumable state; a restore replaces the seed with the checkpointed one
+    seed = config.get('training.seed')
+    state = TrainingCheckpoint(
+        resume_from if resume_state else f'{checkpoint_dir}/state',
+        save_steps=config.get('training.checkpoint_steps', 500),
+        max_to_keep=config.get('training.checkpoint_keep', 3),
+        seed=int(np.random.default_rng().integers(2**31)) if seed is None else seed
+    )
+    if resume_state and not state.restore(trainer):
+        logger.warning(f"No training state in {resume_from}, starting from scratch")
     
     # Validation data
     validation_data = None
@@ -169,53 +264,49 @@ def train_model(
             val_descriptions = load_clean_descriptions(descriptions_file, val_ids)
             val_features = load_photo_features(features_file, val_ids)
             
-            validation_steps = calculate_steps(val_descriptions, batch_size)
-            validation_data = data_generator(
+            validation_data, validation_steps = make_training_input(
                 val_descriptions,
                 val_features,
                 tokenizer,
                 max_length,
                 vocab_size,
-                batch_size
+                batch_size,
+                shuffle=False,
+                bucket_boundaries=bucket_boundaries
             )
             logger.info(f"Validation images: {len(val_ids)}")
     
-    # Create or load model
-    if resume_from and Path(resume_from).exists():
-        logger.info(f"Resuming from checkpoint: {resume_from}")
-        model = keras_load_model(resume_from)
-    else:
-        logger.info("Creating new model...")
-        model = define_model(
-            vocab_size=vocab_size,
-            max_length=max_length,
-            embedding_dim=config.get('model.embedding_dim', 256),
-            lstm_units=config.get('model.lstm_units', 256),
-            dropout_rate=config.get('model.dropout_rate', 0.5),
-            learning_rate=config.get('training.learning_rate', 0.001)
+    # Get callbacks
+    callbacks = get_callbacks(checkpoint_dir) + [state]
+    
+    # Training input from the given number of consumed batches
+    def training_input(position: int):
+        return make_training_input(
+            train_descriptions,
+            train_features,
+            tokenizer,
+            max_length,
+            vocab_size,
+            batch_size,
+            bucket_boundaries=bucket_boundaries,
+            seed=int(state.seed),
+            skip=position
         )
     
-    # Get callbacks
-    callbacks = get_callbacks(config.get('training.checkpoint_dir', 'checkpoints'))
-    
-    # Create data generator
-    train_generator = data_generator(
-        train_descriptions,
-        train_features,
-        tokenizer,
-        max_length,
-        vocab_size,
-        batch_size
-    )
+    # Built once at the restored position; a mid-epoch resume builds one more
+    start = int(state.position)
+    train_data, steps_per_epoch = training_input(start)
     
     # Train model
     logger.info(f"Training for {epochs} epochs...")
     
     try:
-        history = model.fit(
-            train_generator,
-            epochs=epochs,
-            steps_per_epoch=steps_per_epoch,
+        history = fit_resumable(
+            trainer,
+            lambda position: train_data if position == start else training_input(position)[0],
+            epochs,
+            steps_per_epoch,
+            state,
             validation_data=validation_data,
             validation_steps=validation_steps,
             callbacks=callbacks,
@@ -229,11 +320,13 @@ def train_model(
         
         # Save training history
         history_path = 'training_history.pkl'
-        dump(history.history, open(history_path, 'wb'))
+        dump(history, open(history_path, 'wb'))
         logger.info(f"Training history saved to {history_path}")
         
     except KeyboardInterrupt:
         logger.info("Training interrupted by user")
+        state.sync()
+        logger.info(f"Resume with --resume {state.directory}")
         model.save('model_interrupted.h5')
         logger.info("Model saved to model_interrupted.h5")
     
@@ -241,6 +334,106 @@ def train_model(
         logger.error(f"Error during training: {e}")
         raise
 
+def train_distributed(use_validation: bool = True):
+    """Train as one worker of a multi-worker cluster.
+    
+    Run under ``MultiWorkerMirroredStrategy`` with the cluster taken from
+    ``TF_CONFIG`` (see ``--workers``). Each worker loads and trains on its
+    own shard of the images; ``training.batch_size`` is the global batch,
+    split evenly across workers. Only worker 0 writes checkpoints, the
+    final model and the history.
+    
+    Args:
+        use_validation: Whether to use validation set
+    """
+    import tensorflow as tf
+    from utils.distributed import DistributedTrainer, shard_ids, shard_steps, worker_info
+    from utils.input_pipeline import build_dataset, build_sequence_dataset
+    
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    index, num_workers = worker_info()
+    chief = index == 0
+    logger.info(f"Worker {index + 1}/{num_workers}, {strategy.num_replicas_in_sync} replicas in sync")
+    
+    tokenizer = load(open(config.get('paths.tokenizer_file'), 'rb'))
+    vocab_size = len(tokenizer.word_index) + 1
+    max_length = config.get('model.max_length', 34)
+    epochs = config.get('training.epochs', 20)
+    worker_batch = max(config.get('training.batch_size', 32) // num_workers, 1)
+    sequence = config.get('model.architecture', 'merge') == 'sequence'
+    build = build_sequence_dataset if sequence else build_dataset
+    descriptions_file = config.get('paths.descriptions_file')
+    aliases = load_aliases()
+    
+    def shard(split_file):
+        """This worker's descriptions and features, and the steps every worker can take."""
+        descriptions = load_clean_descriptions(descriptions_file, load_set(split_file))
+        if aliases:
+            descriptions = merge_duplicate_descriptions(descriptions, aliases)
+        samples = {
+            image_id: len(captions) if sequence else sum(len(c.split()) - 1 for c in captions)
+            for image_id, captions in descriptions.items()
+        }
+        ids = shard_ids(descriptions, index, num_workers)
+        own = {image_id: descriptions[image_id] for image_id in ids}
+        return own, load_photo_features(None, ids), shard_steps(samples, num_workers, worker_batch)
+    
+    train_descriptions, train_features, steps_per_epoch = shard(config.get('data.train_split', 'data/train.txt'))
+    feature_dim = next(iter(train_features.values())).shape[-1]
+    logger.info(f"Worker {index}: {len(train_descriptions)} training images, {steps_per_epoch} steps per epoch")
+    
+    set_precision_policy()
+    with strategy.scope():
+        define = define_sequence_model if sequence else define_model
+        model = define(
+            vocab_size=vocab_size,
+            max_length=max_length,
+            embedding_dim=config.get('model.embedding_dim', 256),
+            lstm_units=config.get('model.lstm_units', 256),
+            dropout_rate=config.get('model.dropout_rate', 0.5),
+            feature_dim=feature_dim,
+            learning_rate=config.get('training.learning_rate', 0.001)
+        )
+    trainer = DistributedTrainer(strategy, model, worker_batch * num_workers, sequence=sequence)
+    
+    # Fixed shapes and step counts keep the workers' collectives in lockstep
+    train_data = trainer.distribute(lambda: build(
+        train_descriptions, train_features, tokenizer, max_length, worker_batch,
+        bucket_boundaries=[], repeat=True
+    ))
+    validation_data, validation_steps = None, None
+    val_file = config.get('data.val_split', 'data/val.txt')
+    if use_validation and Path(val_file).exists():
+        val_descriptions, val_features, validation_steps = shard(val_file)
+        validation_data = trainer.distribute(lambda: build(
+            val_descriptions, val_features, tokenizer, max_length, worker_batch,
+            shuffle=False, bucket_boundaries=[], repeat=True
+        ))
+    
+    checkpoint_dir = Path(config.get('training.checkpoint_dir', 'checkpoints'))
+    best = {'val_loss': np.inf}
+    
+    def save_best(epoch: int, logs: dict):
+        if chief and logs.get('val_loss', np.inf) < best['val_loss']:
+            best['val_loss'] = logs['val_loss']
+            checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            model.save(checkpoint_dir / f"model_{epoch + 1:02d}_{logs['val_loss']:.2f}.h5")
+    
+    history = trainer.fit(
+        train_data,
+        epochs=epochs,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=validation_data,
+        validation_steps=validation_steps,
+        on_epoch_end=save_best
+    )
+    
+    if chief:
+        final_model_path = config.get('paths.model_file', 'model.h5')
+        model.save(final_model_path)
+        logger.info(f"Training complete! Model saved to {final_model_path}")
+        dump(history, open('training_history.pkl', 'wb'))
+
 
 if __name__ == "__main__":
     import argparse
@@ -250,17 +443,36 @@ if __name__ == "__main__":
         '--resume',
         type=str,
         default=None,
-        help='Path to model checkpoint to resume from'
+        help='Training-state directory (checkpoints/state) to continue mid-epoch, or a model file'
     )
     parser.add_argument(
         '--no-validation',
         action='store_true',
         help='Disable validation during training'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Train data-parallel in this many local worker processes'
+    )
+    parser.add_argument(
+        '--distributed',
+        action='store_true',
+        help='Run as one worker of the cluster in TF_CONFIG'
+    )
     
     args = parser.parse_args()
     
-    train_model(
-        resume_from=args.resume,
-        use_validation=not args.no_validation
-    )
+    if args.workers > 1:
+        from utils.distributed import launch_local_workers
+        
+        worker_args = [__file__, '--distributed'] + (['--no-validation'] if args.no_validation else [])
+        raise SystemExit(launch_local_workers(args.workers, worker_args))
+    elif args.distributed:
+        train_distributed(use_validation=not args.no_validation)
+    else:
+        train_model(
+            resume_from=args.resume,
+            use_validation=not args.no_validation
+        )
@@ -2,10 +2,10 @@
 import numpy as np
 from pickle import load, dump
 from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Input, Dense, LSTM, Embedding, Dropout, Add
 from tensorflow.keras.optimizers import Adam
+from utils.feature_store import load_features
 
 print("Loading data...")
 
@@ -15,7 +15,7 @@ vocab_size = len(tokenizer.word_index) + 1
 print(f"Vocabulary size: {vocab_size}")
 
 # Load features
-all_features = load(open('features.pkl', 'rb'))
+all_features = load_features()
 print(f"Loaded features for {len(all_features)} images")
 
 # Load descriptions
@@ -54,7 +54,6 @@ for image_id, desc_list in descriptions.items():
             out_seq = seq[i]
             
             in_seq = pad_sequences([in_seq], maxlen=max_length)[0]
-            out_seq = to_categorical([out_seq], num_classes=vocab_size)[0]
             
             X1.append(photo)
             X2.append(in_seq)
@@ -62,7 +61,7 @@ for image_id, desc_list in descriptions.items():
 
 X1 = np.array(X1)
 X2 = np.array(X2)
-y = np.array(y)
+y = np.array(y, dtype=np.int32)  # word indices, not one-hot
 
 print(f"Training samples: {len(X1)}")
 print(f"X1 shape: {X1.shape}")
@@ -90,7 +89,7 @@ outputs = Dense(vocab_size, activation='softmax')(decoder2)
 
 # Create model
 model = Model(inputs=[input1, input2], outputs=outputs)
-model.compile(loss='categorical_crossentropy', optimizer=Adam(learning_rate=0.001))
+model.compile(loss='sparse_categorical_crossentropy', optimizer=Adam(learning_rate=0.001))
 
 print(model.summary())
 
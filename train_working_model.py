@@ -7,6 +7,7 @@ from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 import os
+from utils.feature_store import load_features
 
 print("=" * 60)
 print("TRAINING WORKING MODEL")
@@ -20,7 +21,7 @@ print(f"   Vocabulary size: {vocab_size}")
 
 # Load features
 print("\n2. Loading image features...")
-features = load(open('features.pkl', 'rb'))
+features = load_features()
 print(f"   Total images: {len(features)}")
 
 # Load descriptions
@@ -1,8 +1,16 @@
 """AI-powered image captioning using OpenAI and Google Gemini APIs."""
-import base64
-from io import BytesIO
+import asyncio
 import os
 from PIL import Image
+from utils.image_payload import prepare_image
+
+
+STYLE_PROMPTS = {
+    "descriptive": "Describe this image in detail. Focus on what you see, including objects, people, actions, colors, and setting.",
+    "creative": "Write a creative, engaging caption for this image that would work well on social media.",
+    "technical": "Provide a technical, objective description of this image, including composition, lighting, and key elements.",
+    "social_media": "Create a catchy social media caption with relevant hashtags for this image."
+}
 
 
 class OpenAICaptioner:
@@ -26,10 +34,8 @@ class OpenAICaptioner:
             raise ImportError("OpenAI package not installed. Run: pip install openai")
     
     def _encode_image(self, image):
-        """Encode PIL image to base64."""
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        """Downsize and encode PIL image for upload (cached per image)."""
+        return prepare_image(image, provider="openai")
     
     def generate_caption(self, image, style="descriptive"):
         """Generate caption using GPT-4 Vision.
@@ -42,17 +48,10 @@ class OpenAICaptioner:
             Generated caption string
         """
         # Encode image
-        base64_image = self._encode_image(image)
+        payload = self._encode_image(image)
         
         # Create prompt based on style
-        prompts = {
-            "descriptive": "Describe this image in detail. Focus on what you see, including objects, people, actions, colors, and setting.",
-            "creative": "Write a creative, engaging caption for this image that would work well on social media.",
-            "technical": "Provide a technical, objective description of this image, including composition, lighting, and key elements.",
-            "social_media": "Create a catchy social media caption with relevant hashtags for this image."
-        }
-        
-        prompt = prompts.get(style, prompts["descriptive"])
+        prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["descriptive"])
         
         try:
             response = self.client.chat.completions.create(
@@ -65,7 +64,7 @@ class OpenAICaptioner:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
+                                    "url": payload.data_url
                                 }
                             }
                         ]
@@ -79,6 +78,33 @@ class OpenAICaptioner:
         except Exception as e:
             return f"Error: {str(e)}"
     
+    def generate_captions_batch(self, images, style="descriptive"):
+        """Generate captions for many images concurrently.
+        
+        Uses the pooled async client (bounded concurrency, rate limiting,
+        retries) instead of one blocking SDK call per image. Call
+        ``agenerate_captions_batch`` from code already running an event loop.
+        
+        Args:
+            images: List of PIL Images
+            style: Caption style - "descriptive", "creative", "technical", "social_media"
+            
+        Returns:
+            List of captions in input order
+        """
+        return asyncio.run(self.agenerate_captions_batch(images, style))
+    
+    async def agenerate_captions_batch(self, images, style="descriptive"):
+        """Async version of generate_captions_batch."""
+        prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["descriptive"])
+        async with self._async_client() as client:
+            return await client.caption_batch(list(images), prompt)
+    
+    def _async_client(self):
+        """Create the async client for batch captioning."""
+        from utils.async_caption_clients import AsyncOpenAIClient
+        return AsyncOpenAIClient(self.api_key)
+    
     def generate_multiple_options(self, image, num_options=5):
         """Generate multiple caption options like ChatGPT does.
         
@@ -89,7 +115,7 @@ class OpenAICaptioner:
         Returns:
             List of caption options
         """
-        base64_image = self._encode_image(image)
+        payload = self._encode_image(image)
         
         prompt = f"""Analyze this image and provide {num_options} different caption options.
 
@@ -118,7 +144,7 @@ Format EXACTLY as:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
+                                    "url": payload.data_url
                                 }
                             }
                         ]
@@ -167,6 +193,11 @@ class GeminiCaptioner:
         except ImportError:
             raise ImportError("Google Generative AI package not installed. Run: pip install google-generativeai")
     
+    def _encode_image(self, image):
+        """Downsize and encode PIL image as an inline blob (cached per image)."""
+        payload = prepare_image(image, provider="gemini")
+        return {"mime_type": payload.mime_type, "data": payload.raw}
+    
     def generate_caption(self, image, style="descriptive"):
         """Generate caption using Gemini Vision.
         
@@ -178,22 +209,42 @@ class GeminiCaptioner:
             Generated caption string
         """
         # Create prompt based on style
-        prompts = {
-            "descriptive": "Describe this image in detail. Focus on what you see, including objects, people, actions, colors, and setting.",
-            "creative": "Write a creative, engaging caption for this image that would work well on social media.",
-            "technical": "Provide a technical, objective description of this image, including composition, lighting, and key elements.",
-            "social_media": "Create a catchy social media caption with relevant hashtags for this image."
-        }
-        
-        prompt = prompts.get(style, prompts["descriptive"])
+        prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["descriptive"])
         
         try:
-            response = self.model.generate_content([prompt, image])
+            response = self.model.generate_content([prompt, self._encode_image(image)])
             return response.text.strip()
             
         except Exception as e:
             return f"Error: {str(e)}"
     
+    def generate_captions_batch(self, images, style="descriptive"):
+        """Generate captions for many images concurrently.
+        
+        Uses the pooled async client (bounded concurrency, rate limiting,
+        retries) instead of one blocking SDK call per image. Call
+        ``agenerate_captions_batch`` from code already running an event loop.
+        
+        Args:
+            images: List of PIL Images
+            style: Caption style - "descriptive", "creative", "technical", "social_media"
+            
+        Returns:
+            List of captions in input order
+        """
+        return asyncio.run(self.agenerate_captions_batch(images, style))
+    
+    async def agenerate_captions_batch(self, images, style="descriptive"):
+        """Async version of generate_captions_batch."""
+        prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["descriptive"])
+        async with self._async_client() as client:
+            return await client.caption_batch(list(images), prompt)
+    
+    def _async_client(self):
+        """Create the async client for batch captioning."""
+        from utils.async_caption_clients import AsyncGeminiClient
+        return AsyncGeminiClient(self.api_key)
+    
     def generate_multiple_options(self, image, num_options=5):
         """Generate multiple caption options like ChatGPT does.
         
@@ -221,7 +272,7 @@ Format EXACTLY as:
 5. [caption 5]"""
         
         try:
-            response = self.model.generate_content([prompt, image])
+            response = self.model.generate_content([prompt, self._encode_image(image)])
             content = response.text.strip()
             
             # Parse numbered options
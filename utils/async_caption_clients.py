@@ -0,0 +1,340 @@
+"""Async, connection-pooled HTTP clients for the OpenAI and Gemini vision APIs.
+
+Every request goes through one shared ``httpx.AsyncClient``. The client
+bounds concurrency with a semaphore and paces requests with a token bucket.
+Transient failures (timeouts, 429 and 5xx) are retried with jittered
+exponential backoff, and slow requests can optionally be hedged with a
+duplicate.
+
+Example:
+    async with AsyncOpenAIClient(api_key) as client:
+        captions = await client.caption_batch(images, prompt)
+"""
+import asyncio
+import functools
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image
+
+from utils.config import config
+from utils.image_payload import EncodedImage, prepare_image
+from utils.logger import logger
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CaptionAPIError(Exception):
+    """Raised when a vision API request fails permanently."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (None if absent or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for asyncio code."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize token bucket.
+
+        Args:
+            rate: Tokens added per second (requests per second)
+            capacity: Maximum burst size (defaults to max(1, rate))
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until ``tokens`` are available and consume them."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+@dataclass
+class ClientSettings:
+    """Concurrency, rate-limit, retry and hedging settings."""
+    max_concurrency: int = 8
+    requests_per_second: float = 5.0
+    burst: Optional[float] = None
+    timeout: float = 30.0
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge_after: Optional[float] = None
+
+    @classmethod
+    def from_config(cls) -> 'ClientSettings':
+        """Build settings from the ``api_clients`` section of config.yaml."""
+        section = config.get('api_clients', {}) or {}
+        return cls(**{k: v for k, v in section.items() if k in cls.__dataclass_fields__})
+
+
+class AsyncCaptionClient(ABC):
+    """Base class handling pooling, limiting, retries and hedging."""
+
+    provider = "base"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        settings: Optional[ClientSettings] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        """Initialize async client.
+
+        Args:
+            api_key: Provider API key
+            base_url: API root URL (point at a mock server in tests)
+            settings: Client settings (defaults to config.yaml)
+            http_client: Existing client whose connection pool should be shared
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.settings = settings or ClientSettings.from_config()
+        self._http = http_client
+        self._owns_http = http_client is None
+        self._semaphore = None
+        self._bucket = None
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "failures": 0}
+
+    async def __aenter__(self):
+        # asyncio primitives are created inside the running loop
+        self._semaphore = asyncio.Semaphore(self.settings.max_concurrency)
+        self._bucket = TokenBucket(self.settings.requests_per_second, self.settings.burst)
+        if self._http is None:
+            limits = httpx.Limits(
+                max_connections=self.settings.max_concurrency * 2,
+                max_keepalive_connections=self.settings.max_concurrency
+            )
+            self._http = httpx.AsyncClient(limits=limits, timeout=self.settings.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._owns_http and self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _send(self, url: str, payload: Dict, headers: Dict, params: Optional[Dict]) -> Dict:
+        """Send one rate-limited request within the concurrency bound."""
+        await self._bucket.acquire()
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            response = await self._http.post(url, json=payload, headers=headers, params=params)
+
+        if response.status_code >= 400:
+            raise CaptionAPIError(
+                f"{self.provider} API returned {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("retry-after"))
+            )
+        return response.json()
+
+    async def _hedged(self, url: str, payload: Dict, headers: Dict, params: Optional[Dict]) -> Dict:
+        """Send a request and race a duplicate if it is slower than hedge_after."""
+        hedge_after = self.settings.hedge_after
+        primary = asyncio.ensure_future(self._send(url, payload, headers, params))
+        tasks = [primary]
+        try:
+            if not hedge_after:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            self.stats["hedges"] += 1
+            tasks.append(asyncio.ensure_future(self._send(url, payload, headers, params)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser, or every request if the caller was cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt."""
+        if retry_after is not None:
+            return min(retry_after, self.settings.backoff_max)
+        ceiling = min(self.settings.backoff_max, self.settings.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def _post(self, path: str, payload: Dict, headers: Dict, params: Optional[Dict] = None) -> Dict:
+        """POST with retries on timeouts, connection errors, 429 and 5xx."""
+        url = f"{self.base_url}{path}"
+        last_error = None
+        retry_after = None
+
+        for attempt in range(self.settings.max_retries + 1):
+            try:
+                return await self._hedged(url, payload, headers, params)
+            except CaptionAPIError as e:
+                if e.status_code not in RETRYABLE_STATUSES:
+                    self.stats["failures"] += 1
+                    raise
+                last_error, retry_after = e, e.retry_after
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error, retry_after = CaptionAPIError(f"{self.provider} request failed: {e}"), None
+
+            if attempt < self.settings.max_retries:
+                self.stats["retries"] += 1
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"{last_error}; retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        self.stats["failures"] += 1
+        raise last_error
+
+    async def _prepare(self, image: Image.Image) -> EncodedImage:
+        """Resize and encode an image on a worker thread, off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(prepare_image, image, provider=self.provider))
+
+    @abstractmethod
+    async def caption(self, image: Image.Image, prompt: str, max_tokens: int = 300) -> str:
+        """Caption one image."""
+
+    async def caption_batch(
+        self,
+        images: List[Image.Image],
+        prompt: str,
+        max_tokens: int = 300
+    ) -> List[str]:
+        """Caption N images concurrently.
+
+        Failed images yield ``"Error: ..."`` strings, matching the sync
+        captioners, so one bad image does not fail the batch.
+
+        Args:
+            images: List of PIL Images
+            prompt: Prompt sent with every image
+            max_tokens: Maximum tokens per response
+
+        Returns:
+            Captions in input order
+        """
+        results = await asyncio.gather(
+            *(self.caption(image, prompt, max_tokens) for image in images),
+            return_exceptions=True
+        )
+        return [
+            f"Error: {result}" if isinstance(result, Exception) else result
+            for result in results
+        ]
+
+
+class AsyncOpenAIClient(AsyncCaptionClient):
+    """Async client for OpenAI chat completions with image input."""
+
+    provider = "openai"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.openai.com/v1",
+        model: str = "gpt-4o-mini",
+        **kwargs
+    ):
+        super().__init__(api_key, base_url, **kwargs)
+        self.model = model
+
+    async def caption(self, image: Image.Image, prompt: str, max_tokens: int = 300) -> str:
+        """Caption one image with GPT-4 Vision."""
+        encoded = await self._prepare(image)
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": encoded.data_url}
+                        }
+                    ]
+                }
+            ],
+            "max_tokens": max_tokens
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        data = await self._post("/chat/completions", payload, headers)
+        return data["choices"][0]["message"]["content"].strip()
+
+
+class AsyncGeminiClient(AsyncCaptionClient):
+    """Async client for the Gemini generateContent REST endpoint."""
+
+    provider = "gemini"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://generativelanguage.googleapis.com/v1beta",
+        model: str = "gemini-1.5-flash",
+        **kwargs
+    ):
+        super().__init__(api_key, base_url, **kwargs)
+        self.model = model
+
+    async def caption(self, image: Image.Image, prompt: str, max_tokens: int = 300) -> str:
+        """Caption one image with Gemini Vision."""
+        encoded = await self._prepare(image)
+        payload = {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": prompt},
+                        {"inline_data": {"mime_type": encoded.mime_type, "data": encoded.data}}
+                    ]
+                }
+            ],
+            "generationConfig": {"maxOutputTokens": max_tokens}
+        }
+        data = await self._post(
+            f"/models/{self.model}:generateContent",
+            payload,
+            headers={},
+            params={"key": self.api_key}
+        )
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts).strip()
@@ -0,0 +1,95 @@
+"""CNN backbones for image feature extraction.
+
+The backbone is selected with ``model.backbone`` in config.yaml. VGG16 fc2
+is the original (and default) extractor. The lightweight backbones use
+global-average-pooled features at a fraction of its FLOPs and weight size:
+
+=================  ===========  ===========  =========
+backbone           feature_dim  preprocess   weights
+=================  ===========  ===========  =========
+vgg16              4096         caffe        528 MB
+mobilenet_v2       1280         tf           14 MB
+mobilenet_v3_small 576          none         10 MB
+mobilenet_v3_large 960          none         22 MB
+efficientnet_b0    1280         none         29 MB
+=================  ===========  ===========  =========
+
+Preprocess modes follow ``keras.applications``: ``caffe`` converts to BGR
+and subtracts the ImageNet mean, ``tf`` scales to [-1, 1], and ``none``
+feeds raw 0-255 RGB to models that rescale internally.
+"""
+import importlib
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.config import config
+
+
+@dataclass
+class Backbone:
+    """A keras.applications model used as a feature extractor.
+
+    ``module`` is the application module providing ``preprocess_input``;
+    ``constructor`` is the model class exported by keras.applications.
+    """
+    name: str
+    module: str
+    constructor: str
+    feature_dim: int
+    preprocess_mode: str
+    input_size: Tuple[int, int] = (224, 224)
+    feature_layer: Optional[str] = None
+
+    def _module(self):
+        return importlib.import_module(self.module)
+
+    @property
+    def preprocess_input(self) -> Callable[[np.ndarray], np.ndarray]:
+        """The application's own ``preprocess_input``."""
+        return self._module().preprocess_input
+
+    def build(self):
+        """Build the feature model (downloads ImageNet weights on first use)."""
+        from tensorflow.keras.models import Model
+
+        constructor = getattr(importlib.import_module('tensorflow.keras.applications'), self.constructor)
+        if self.feature_layer:
+            base_model = constructor()
+            return Model(inputs=base_model.inputs, outputs=base_model.get_layer(self.feature_layer).output)
+        return constructor(include_top=False, pooling='avg', input_shape=(*self.input_size, 3))
+
+
+BACKBONES: Dict[str, Backbone] = {
+    "vgg16": Backbone(
+        "vgg16", "tensorflow.keras.applications.vgg16", "VGG16", 4096, "caffe", feature_layer="fc2"
+    ),
+    "mobilenet_v2": Backbone(
+        "mobilenet_v2", "tensorflow.keras.applications.mobilenet_v2", "MobileNetV2", 1280, "tf"
+    ),
+    "mobilenet_v3_small": Backbone(
+        "mobilenet_v3_small", "tensorflow.keras.applications.mobilenet_v3", "MobileNetV3Small", 576, "none"
+    ),
+    "mobilenet_v3_large": Backbone(
+        "mobilenet_v3_large", "tensorflow.keras.applications.mobilenet_v3", "MobileNetV3Large", 960, "none"
+    ),
+    "efficientnet_b0": Backbone(
+        "efficientnet_b0", "tensorflow.keras.applications.efficientnet", "EfficientNetB0", 1280, "none"
+    ),
+}
+
+
+def get_backbone(name: Optional[str] = None) -> Backbone:
+    """Look up a backbone by name (defaults to ``model.backbone``).
+
+    Args:
+        name: Backbone name
+
+    Returns:
+        Backbone definition
+    """
+    name = name or config.get('model.backbone', 'vgg16')
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown backbone '{name}'. Available: {', '.join(BACKBONES)}")
+    return BACKBONES[name]
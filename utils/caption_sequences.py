@@ -0,0 +1,152 @@
+"""Vectorised (photo, prefix, next word) training triples.
+
+Every caption of n tokens gives n - 1 training samples: the first j tokens,
+left-padded to ``max_length``, predict token j. The old generators rebuilt
+these with ``texts_to_sequences`` and ``pad_sequences`` once per prefix,
+every epoch.
+
+``CaptionSequences`` tokenises all captions once into a right-padded int32
+matrix. It then lays a sliding window of width ``max_length`` over that
+matrix, left-padded with ``max_length`` zeros. Window j of a caption is its
+first j tokens padded on the left, exactly what
+``pad_sequences([seq[:j]], maxlen=max_length)`` returns, including keeping
+the last ``max_length`` tokens of longer prefixes. The windows are a view,
+so a batch of triples is one fancy-indexing gather.
+
+``teacher_forcing`` gives the same captions whole, for the sequence model:
+one (inputs, targets) row pair per caption instead of one sample per prefix.
+"""
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class CaptionSequences:
+    """All training triples of a set of captions, as index arrays."""
+
+    def __init__(self, tokenizer, descriptions: Dict[str, List[str]], max_length: int):
+        """Tokenise captions and index their prefixes.
+
+        Args:
+            tokenizer: Fitted tokenizer
+            descriptions: Image id -> captions
+            max_length: Model input sequence length
+        """
+        self.max_length = max_length
+        self.image_ids: List[str] = list(descriptions)
+
+        captions = [caption for image_id in self.image_ids for caption in descriptions[image_id]]
+        self.caption_image = caption_image = np.repeat(
+            np.arange(len(self.image_ids), dtype=np.int32),
+            [len(descriptions[image_id]) for image_id in self.image_ids]
+        )
+        sequences = tokenizer.texts_to_sequences(captions)
+
+        self.lengths = np.array([len(seq) for seq in sequences], dtype=np.int32)
+        width = int(self.lengths.max()) if len(sequences) else 0
+        self.tokens = np.zeros((len(sequences), width), dtype=np.int32)
+        for row, seq in enumerate(sequences):
+            self.tokens[row, :len(seq)] = seq
+
+        # windows[c, j] = tokens[c, :j] left-padded to max_length
+        padded = np.concatenate([np.zeros((len(sequences), max_length), dtype=np.int32), self.tokens], axis=1)
+        self._windows = sliding_window_view(padded, max_length, axis=1)
+
+        positions = np.arange(width)
+        valid = (positions >= 1) & (positions < self.lengths[:, np.newaxis])
+        self.caption_rows, self.positions = np.nonzero(valid)
+        triple_image = caption_image[self.caption_rows]
+
+        # Captions are grouped by image, so each image's triples are one range
+        self.offsets = np.searchsorted(triple_image, np.arange(len(self.image_ids) + 1))
+
+    def __len__(self) -> int:
+        return len(self.caption_rows)
+
+    def triples(self, image_indices: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gather the training triples of some images.
+
+        Args:
+            image_indices: Positions in ``image_ids``
+
+        Returns:
+            Tuple of (position of each triple's image within
+            ``image_indices``, (n, max_length) int32 prefixes, (n,) int32
+            next-word targets)
+        """
+        image_indices = np.asarray(image_indices, dtype=np.int64)
+        starts = self.offsets[image_indices]
+        counts = self.offsets[image_indices + 1] - starts
+
+        # Concatenated ranges [start, start + count) without a Python loop
+        local = np.repeat(np.arange(len(image_indices)), counts)
+        first = np.cumsum(counts) - counts
+        index = starts[local] + np.arange(counts.sum()) - first[local]
+
+        rows, positions = self.caption_rows[index], self.positions[index]
+        return local, self._windows[rows, positions], self.tokens[rows, positions]
+
+    def teacher_forcing(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Whole captions as shifted (inputs, targets) rows.
+
+        Input token t predicts target t, the caption's token t + 1. Both are
+        right-padded with zeros (padding the model masks out) and truncated
+        to ``max_length``.
+
+        Returns:
+            Tuple of ((n,) int32 position of each caption's image in
+            ``image_ids``, (n, max_length) int32 inputs, (n, max_length)
+            int32 targets)
+        """
+        padded = np.zeros((len(self.tokens), self.max_length + 1), dtype=np.int32)
+        width = min(self.tokens.shape[1], self.max_length + 1)
+        padded[:, :width] = self.tokens[:, :width]
+
+        positions = np.arange(self.max_length)
+        inputs = np.where(positions < self.lengths[:, np.newaxis] - 1, padded[:, :-1], 0).astype(np.int32)
+        return self.caption_image, inputs, padded[:, 1:]
+
+    def arrays(self, photos: Mapping) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every triple at once, as ``create_sequences`` returns them.
+
+        Args:
+            photos: Image id -> (1, feature_dim) features
+
+        Returns:
+            Tuple of (image features, input sequences, int32 output words)
+        """
+        local, prefixes, targets = self.triples(np.arange(len(self.image_ids)))
+        features = np.concatenate([np.asarray(photos[image_id]) for image_id in self.image_ids])
+        return features[local], prefixes, targets
+
+    def batches(
+        self,
+        photos: Mapping,
+        batch_size: int,
+        shuffle: bool = True,
+        rng: Optional[np.random.Generator] = None
+    ) -> Iterator[Tuple[Tuple[np.ndarray, np.ndarray], np.ndarray]]:
+        """One epoch of ((image features, prefixes), targets) batches.
+
+        Args:
+            photos: Image id -> (1, feature_dim) features
+            batch_size: Images per batch (each contributes all its triples)
+            shuffle: Shuffle image order
+            rng: Random generator for the shuffle (default: the global one)
+
+        Yields:
+            Keras-ready batches (inputs as a tuple: Keras 3 rejects lists
+            from generators)
+        """
+        order = np.array([i for i, image_id in enumerate(self.image_ids) if image_id in photos], dtype=np.int64)
+        if shuffle:
+            (rng or np.random).shuffle(order)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            local, prefixes, targets = self.triples(batch)
+            if not len(targets):
+                continue
+            features = np.concatenate([np.asarray(photos[self.image_ids[i]]) for i in batch])
+            yield (features[local], prefixes), targets
@@ -0,0 +1,284 @@
+"""Exact and near-duplicate image detection.
+
+Every image gets a SHA-256 content hash and a 64-bit difference hash (dHash)
+of its 9x8 grayscale thumbnail. Byte-identical files share a SHA-256;
+re-encoded, resized or lightly recompressed copies have dHashes a few bits
+apart. Each group of duplicates is mapped to one canonical id (the smallest
+id in the group), which is the only one whose features are extracted and
+stored.
+
+The alias mapping is saved to ``paths.dedup_file``. Feature loading in
+training and evaluation resolves duplicate ids to their canonical feature
+row through ``apply_aliases``.
+
+The file also keeps every image's size, mtime and hashes. Like the
+extraction manifest (utils/extraction_manifest.py), a re-run only reads and
+hashes new or changed files.
+"""
+import io
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from utils.config import config
+from utils.extraction_manifest import file_hash, file_stat
+from utils.feature_store import FeatureStore
+from utils.image_archive import iter_sources, open_source
+from utils.logger import logger
+
+
+def dhash(path: Union[str, io.BytesIO]) -> int:
+    """64-bit difference hash: one bit per horizontally adjacent pixel pair.
+
+    Args:
+        path: Image file, archive member path or in-memory file
+
+    Returns:
+        Hash as an unsigned integer
+    """
+    with Image.open(open_source(path)) as image:
+        image.draft('L', (36, 32))
+        thumbnail = image.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distances(hashes: np.ndarray, image_hash: np.uint64) -> np.ndarray:
+    """Bits by which each 64-bit hash differs from ``image_hash``.
+
+    Counted over the bytes with ``unpackbits``: ``np.bitwise_count`` needs
+    NumPy 2.
+    """
+    differences = np.ascontiguousarray(hashes ^ image_hash)
+    return np.unpackbits(differences.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+@dataclass
+class FileHashes:
+    """Hashes of one image file, valid while its size and mtime match."""
+    size: int
+    mtime: float
+    sha256: str
+    dhash: Optional[int] = None
+
+
+@dataclass
+class DedupResult:
+    """Duplicate ids and what removing them saves."""
+    aliases: Dict[str, str] = field(default_factory=dict)
+    exact: int = 0
+    near: int = 0
+    images: int = 0
+    hashed: int = 0
+    seconds: float = 0.0
+    files: Dict[str, FileHashes] = field(default_factory=dict)
+
+    @property
+    def canonical_count(self) -> int:
+        """Images left to extract after deduplication."""
+        return self.images - len(self.aliases)
+
+    def report(self, feature_dim: int, bytes_per_value: int = 4, seconds_per_image: Optional[float] = None) -> Dict:
+        """Space and extraction time saved by skipping duplicates.
+
+        Args:
+            feature_dim: Stored feature dimension
+            bytes_per_value: Bytes per stored feature value (4 for float32)
+            seconds_per_image: Measured extraction time per image, if known
+
+        Returns:
+            Counts plus ``bytes_saved`` and ``extraction_seconds_saved``
+        """
+        duplicates = len(self.aliases)
+        return {
+            "images": self.images,
+            "canonical": self.canonical_count,
+            "exact_duplicates": self.exact,
+            "near_duplicates": self.near,
+            "bytes_saved": duplicates * feature_dim * bytes_per_value,
+            "extraction_seconds_saved": duplicates * seconds_per_image if seconds_per_image else None,
+            "hash_seconds": self.seconds,
+        }
+
+
+def hash_files(
+    items: List[Tuple[str, str]],
+    with_dhash: bool = True,
+    known: Optional[Dict[str, FileHashes]] = None
+) -> Tuple[Dict[str, FileHashes], int]:
+    """SHA-256 (and dHash) of every file, reusing the hashes of unchanged files.
+
+    Args:
+        items: (image_id, path) items
+        with_dhash: Also compute perceptual hashes
+        known: Path -> FileHashes from an earlier run
+
+    Returns:
+        Tuple of (path -> FileHashes, number of files read and hashed)
+    """
+    known = known or {}
+    hashes: Dict[str, FileHashes] = {}
+    stats: Dict[str, Tuple[int, float]] = {}
+    for _, path in items:
+        key = str(path)
+        size, mtime = file_stat(path)
+        record = known.get(key)
+        if (record is not None and (record.size, record.mtime) == (size, mtime)
+                and (record.dhash is not None or not with_dhash)):
+            hashes[key] = record
+        else:
+            stats[key] = (size, mtime)
+
+    # Archive members are read once, in a single streaming pass
+    for key, source in iter_sources((key, key) for key in stats):
+        image_hash = None
+        if with_dhash:
+            try:
+                image_hash = dhash(source)
+            except Exception as e:
+                logger.warning(f"Could not hash {key}: {e}")
+        hashes[key] = FileHashes(*stats[key], file_hash(source), image_hash)
+    return hashes, len(stats)
+
+
+def find_duplicates(
+    items: List[Tuple[str, str]],
+    max_distance: Optional[int] = None,
+    known: Optional[Dict[str, FileHashes]] = None
+) -> DedupResult:
+    """Group exact and near-duplicate images.
+
+    Args:
+        items: (image_id, path) items
+        max_distance: Largest dHash Hamming distance treated as a near
+            duplicate (default: preprocessing.dedup_max_distance, 0 = exact
+            duplicates only)
+        known: Hashes from an earlier run (``load_file_hashes()``); files
+            whose size and mtime match are not read again
+
+    Returns:
+        DedupResult mapping each duplicate id to its canonical id
+    """
+    if max_distance is None:
+        max_distance = config.get('preprocessing.dedup_max_distance', 0)
+
+    start = time.perf_counter()
+    result = DedupResult(images=len(items))
+    result.files, result.hashed = hash_files(items, with_dhash=max_distance > 0, known=known)
+    by_sha: Dict[str, str] = {}
+    canonical_ids: List[str] = []
+    canonical_hashes = np.zeros(len(items), dtype=np.uint64)
+
+    for image_id, path in sorted(items):
+        hashes = result.files.get(str(path))
+        if hashes is None:
+            continue  # unreadable archive member, already logged
+        sha = hashes.sha256
+        if sha in by_sha:
+            result.aliases[image_id] = by_sha[sha]
+            result.exact += 1
+            continue
+
+        if max_distance > 0 and hashes.dhash is not None:
+            image_hash = np.uint64(hashes.dhash)
+            count = len(canonical_ids)
+            if count:
+                distances = hamming_distances(canonical_hashes[:count], image_hash)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= max_distance:
+                    by_sha[sha] = canonical_ids[nearest]
+                    result.aliases[image_id] = canonical_ids[nearest]
+                    result.near += 1
+                    continue
+            canonical_hashes[count] = image_hash
+            canonical_ids.append(image_id)
+
+        by_sha[sha] = image_id
+
+    result.seconds = time.perf_counter() - start
+    logger.info(
+        f"Deduplicated {result.images} images ({result.hashed} hashed) in {result.seconds:.1f}s: "
+        f"{result.exact} exact and {result.near} near duplicates"
+    )
+    return result
+
+
+def save_aliases(result: DedupResult, path: Optional[str] = None) -> None:
+    """Write the alias mapping and counts to ``paths.dedup_file``."""
+    path = path or config.get('paths.dedup_file', 'dedup.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(asdict(result), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_aliases(path: Optional[str] = None) -> Dict[str, str]:
+    """Duplicate id -> canonical id mapping (empty if dedup was never run)."""
+    path = path or config.get('paths.dedup_file', 'dedup.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)["aliases"]
+
+
+def load_file_hashes(path: Optional[str] = None) -> Dict[str, FileHashes]:
+    """Path -> FileHashes saved by the last dedup run (empty if none)."""
+    path = path or config.get('paths.dedup_file', 'dedup.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return {key: FileHashes(**record) for key, record in json.load(f).get("files", {}).items()}
+
+
+def apply_aliases(features: Mapping, aliases: Optional[Dict[str, str]] = None) -> Mapping:
+    """Make duplicate ids resolve to their canonical feature row.
+
+    Args:
+        features: FeatureStore or legacy features dictionary
+        aliases: Duplicate id -> canonical id (default: ``load_aliases()``)
+
+    Returns:
+        Mapping that also answers for duplicate ids, sharing the
+        canonical rows (no features are copied)
+    """
+    aliases = load_aliases() if aliases is None else aliases
+    if not aliases:
+        return features
+    if isinstance(features, FeatureStore):
+        return features.with_aliases(aliases)
+    resolved = dict(features)
+    for image_id, canonical in aliases.items():
+        if canonical in features and image_id not in features:
+            resolved[image_id] = features[canonical]
+    return resolved
+
+
+def merge_duplicate_descriptions(
+    descriptions: Dict[str, List[str]],
+    aliases: Dict[str, str]
+) -> Dict[str, List[str]]:
+    """Fold a duplicate's captions into its canonical image.
+
+    Training would otherwise visit the same photo once per copy. Captions
+    are merged under the canonical id when it is in the same split, and
+    captions repeated across copies are kept once.
+
+    Args:
+        descriptions: Image id -> captions
+        aliases: Duplicate id -> canonical id
+
+    Returns:
+        Descriptions with duplicates merged
+    """
+    merged = {image_id: list(captions) for image_id, captions in descriptions.items()}
+    for image_id, canonical in aliases.items():
+        if image_id in merged and canonical in merged:
+            captions = merged.pop(image_id)
+            merged[canonical].extend(c for c in captions if c not in merged[canonical])
+    return merged
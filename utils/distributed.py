@@ -0,0 +1,223 @@
+"""Data-parallel multi-process CPU training with tf.distribute.
+
+One Keras process leaves most cores of a big CPU box idle. Here training
+runs in N worker processes under ``MultiWorkerMirroredStrategy``. Each
+worker holds a replica of the model and trains on its own shard of the
+images, and gradients are all-reduced every step. The workers find each
+other through ``TF_CONFIG``.
+
+``launch_local_workers`` starts N workers on this host, with free ports,
+one ``TF_CONFIG`` each and a share of the cores. A worker calls
+``worker_info`` and ``shard_ids`` to pick its images and uses
+``DistributedTrainer`` to train.
+
+Keras 3 ``model.fit`` cannot take multi-worker distributed input, so
+``DistributedTrainer`` is a small custom loop around ``strategy.run``.
+Every worker has to run the same number of collective steps, so the
+datasets repeat, are batched at a fixed size (``repeat=True``, no length
+buckets) and are stepped a fixed number of times per epoch.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.logger import logger
+from utils.sharded_extraction import _available_cores
+
+
+def free_ports(count: int) -> List[int]:
+    """Ports that are free on this host right now."""
+    sockets = []
+    try:
+        for _ in range(count):
+            s = socket.socket()
+            s.bind(('localhost', 0))
+            sockets.append(s)
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+def tf_config(workers: Sequence[str], index: int) -> str:
+    """``TF_CONFIG`` value for worker ``index`` of a cluster."""
+    return json.dumps({"cluster": {"worker": list(workers)}, "task": {"type": "worker", "index": index}})
+
+
+def worker_info() -> Tuple[int, int]:
+    """(worker index, number of workers) from ``TF_CONFIG``; (0, 1) outside a cluster."""
+    spec = json.loads(os.environ.get('TF_CONFIG') or '{}')
+    workers = spec.get('cluster', {}).get('worker', [])
+    return int(spec.get('task', {}).get('index', 0)), max(len(workers), 1)
+
+
+def shard_ids(ids: Iterable[str], index: int, num_workers: int) -> set:
+    """The image ids worker ``index`` trains on (round-robin over sorted ids)."""
+    return set(sorted(ids)[index::num_workers])
+
+
+def shard_steps(samples: Dict[str, int], num_workers: int, batch_size: int) -> int:
+    """Steps per epoch every worker can take: the smallest shard's full batches.
+
+    Args:
+        samples: Image id -> training samples it contributes
+        num_workers: Number of workers
+        batch_size: Per-worker batch size
+
+    Returns:
+        Steps per epoch (at least 1)
+    """
+    shards = [shard_ids(samples, index, num_workers) for index in range(num_workers)]
+    return max(min(sum(samples[image_id] for image_id in shard) for shard in shards) // batch_size, 1)
+
+
+def launch_local_workers(num_workers: int, argv: List[str], pin_cores: bool = True) -> int:
+    """Run ``python <argv>`` as a local cluster of workers and wait for them.
+
+    Args:
+        num_workers: Worker processes to start
+        argv: Script and arguments each worker runs
+        pin_cores: Give each worker its own cores and a matching thread budget
+
+    Returns:
+        0 if every worker succeeded, else the first non-zero exit code
+    """
+    workers = [f"localhost:{port}" for port in free_ports(num_workers)]
+    cores = _available_cores()
+    per_worker = max(len(cores) // num_workers, 1)
+
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ, TF_CONFIG=tf_config(workers, index))
+        preexec = None
+        if pin_cores:
+            env['OMP_NUM_THREADS'] = env['TF_NUM_INTRAOP_THREADS'] = str(per_worker)
+            worker_cores = cores[index * per_worker:(index + 1) * per_worker] or cores
+            if hasattr(os, 'sched_setaffinity') and len(cores) >= num_workers:
+                preexec = lambda worker_cores=worker_cores: os.sched_setaffinity(0, worker_cores)  # noqa: E731
+        processes.append(subprocess.Popen([sys.executable] + argv, env=env, preexec_fn=preexec))
+    logger.info(f"Started {num_workers} workers: {', '.join(workers)}")
+
+    codes = [process.wait() for process in processes]
+    failed = [code for code in codes if code]
+    if failed:
+        logger.error(f"{len(failed)} of {num_workers} workers failed (exit codes {codes})")
+    return failed[0] if failed else 0
+
+
+class DistributedTrainer:
+    """Custom training loop for a compiled caption model under a tf.distribute strategy."""
+
+    def __init__(self, strategy, model, global_batch_size: int, sequence: bool = False):
+        """Prepare distributed train and validation steps.
+
+        Args:
+            strategy: Strategy the model was built under
+            model: Model from ``define_model`` or ``define_sequence_model``,
+                created and compiled inside ``strategy.scope()``
+            global_batch_size: Samples per step summed over all workers
+            sequence: Targets are whole captions with per-token sample weights
+        """
+        import tensorflow as tf
+
+        self.strategy = strategy
+        self.model = model
+        self.global_batch_size = global_batch_size
+        self.sequence = sequence
+        self._loss = tf.keras.losses.SparseCategoricalCrossentropy(reduction='none')
+        self._train_step = tf.function(self._step_fn(training=True))
+        self._test_step = tf.function(self._step_fn(training=False))
+
+    def _per_example_loss(self, batch, training: bool):
+        """Model loss per sample; per caption for the sequence model."""
+        import tensorflow as tf
+
+        inputs, targets, *weights = batch
+        per_token = self._loss(targets, self.model(inputs, training=training))
+        if not self.sequence:
+            return per_token
+        weights = weights[0]
+        return tf.reduce_sum(per_token * weights, axis=1) / tf.maximum(tf.reduce_sum(weights, axis=1), 1.0)
+
+    def _step_fn(self, training: bool) -> Callable:
+        """One synchronous step over every replica, returning the mean loss."""
+        import tensorflow as tf
+
+        def replica_loss(batch):
+            return tf.nn.compute_average_loss(
+                self._per_example_loss(batch, training), global_batch_size=self.global_batch_size
+            )
+
+        def replica_step(batch):
+            if not training:
+                return replica_loss(batch)
+            with tf.GradientTape() as tape:
+                loss = replica_loss(batch)
+                # Loss scaling under mixed_float16 (a no-op otherwise)
+                scaled_loss = self.model.optimizer.scale_loss(loss)
+            variables = self.model.trainable_variables
+            self.model.optimizer.apply_gradients(zip(tape.gradient(scaled_loss, variables), variables))
+            return loss
+
+        def step(iterator):
+            losses = self.strategy.run(replica_step, args=(next(iterator),))
+            return self.strategy.reduce('SUM', losses, axis=None)
+
+        return step
+
+    def distribute(self, dataset_fn: Callable):
+        """Per-worker datasets from ``dataset_fn()``, without re-sharding or re-batching."""
+        return self.strategy.distribute_datasets_from_function(lambda context: dataset_fn())
+
+    def fit(
+        self,
+        train_data,
+        epochs: int,
+        steps_per_epoch: int,
+        validation_data=None,
+        validation_steps: Optional[int] = None,
+        on_epoch_end: Optional[Callable[[int, Dict[str, float]], None]] = None
+    ) -> Dict[str, List[float]]:
+        """Train for a fixed number of steps per epoch on every worker.
+
+        Args:
+            train_data: Distributed repeating dataset (``distribute``)
+            epochs: Number of epochs
+            steps_per_epoch: Steps per epoch, identical on every worker
+            validation_data: Optional distributed repeating validation dataset
+            validation_steps: Validation steps per epoch
+            on_epoch_end: Called with (epoch, logs) after each epoch
+
+        Returns:
+            History with 'loss', 'samples_per_second' and, with validation
+            data, 'val_loss' per epoch
+        """
+        history: Dict[str, List[float]] = {}
+        train_iterator = iter(train_data)
+        val_iterator = iter(validation_data) if validation_data is not None else None
+
+        for epoch in range(epochs):
+            start = time.perf_counter()
+            losses = [float(self._train_step(train_iterator)) for _ in range(steps_per_epoch)]
+            seconds = time.perf_counter() - start
+            logs = {
+                'loss': float(np.mean(losses)),
+                'samples_per_second': steps_per_epoch * self.global_batch_size / seconds,
+            }
+            if val_iterator is not None and validation_steps:
+                logs['val_loss'] = float(np.mean([float(self._test_step(val_iterator)) for _ in range(validation_steps)]))
+
+            for key, value in logs.items():
+                history.setdefault(key, []).append(value)
+            logger.info(
+                f"Epoch {epoch + 1}/{epochs} - " + ' - '.join(f"{key}: {value:.4f}" for key, value in logs.items())
+            )
+            if on_epoch_end is not None:
+                on_epoch_end(epoch, logs)
+        return history
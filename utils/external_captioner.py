@@ -2,19 +2,23 @@
 from PIL import Image
 import numpy as np
 from typing import Optional, Tuple
+from utils.config import config
 from utils.logger import logger
-import os
+from utils.model_store import configure_cache, warmup
 
-# Set Hugging Face cache to D drive
-os.environ['HF_HOME'] = 'D:/huggingface_cache'
-os.environ['TRANSFORMERS_CACHE'] = 'D:/huggingface_cache/transformers'
-os.environ['HF_DATASETS_CACHE'] = 'D:/huggingface_cache/datasets'
+# Resolve the Hugging Face cache from the environment / config.yaml
+configure_cache()
 
 
 class ExternalCaptioner:
     """Caption generator using Hugging Face transformers."""
     
-    def __init__(self, model_name: str = "Salesforce/blip-image-captioning-base"):
+    def __init__(
+        self,
+        model_name: str = "Salesforce/blip-image-captioning-base",
+        backend: Optional[str] = None,
+        onnx_dir: Optional[str] = None
+    ):
         """Initialize external captioner.
         
         Args:
@@ -23,17 +27,31 @@ class ExternalCaptioner:
             - Salesforce/blip-image-captioning-base (balanced, recommended)
             - Salesforce/blip-image-captioning-large (best quality, slower)
             - microsoft/git-base-coco (good alternative)
+            backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime on CPU);
+                defaults to ``external.backend`` in config.yaml
+            onnx_dir: Directory created by scripts/export_onnx.py; defaults to
+                ``external.onnx_dir`` in config.yaml. The ONNX backend also
+                runs exported ViT-GPT2 models.
         """
         self.model_name = model_name
+        self.backend = (backend or config.get('external.backend', 'torch')).lower()
+        self.onnx_dir = onnx_dir or config.get('external.onnx_dir', 'models/onnx/blip')
         self.processor = None
         self.model = None
         self._initialized = False
+        
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown backend: {self.backend}. Use 'torch' or 'onnx'")
     
     def _lazy_load(self):
         """Lazy load the model to avoid loading if not needed."""
         if self._initialized:
             return
         
+        if self.backend == "onnx":
+            self._load_onnx()
+            return
+        
         try:
             from transformers import BlipProcessor, BlipForConditionalGeneration
             
@@ -53,6 +71,44 @@ class ExternalCaptioner:
             logger.error(f"Error loading external captioner: {e}")
             raise
     
+    def _load_onnx(self):
+        """Load an exported model and its preprocessing files for ONNX Runtime."""
+        try:
+            from transformers import AutoImageProcessor, AutoTokenizer
+            from utils.onnx_captioner import OnnxCaptionModel
+            
+            self.model = OnnxCaptionModel(self.onnx_dir)
+            self.model_name = self.model.config.get("model_name", self.model_name)
+            self.image_processor = AutoImageProcessor.from_pretrained(self.onnx_dir)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.onnx_dir)
+            self._initialized = True
+            logger.info("External captioner loaded successfully (onnx backend)")
+            
+        except ImportError:
+            logger.error("onnxruntime not installed. Run: pip install onnxruntime transformers")
+            raise ImportError(
+                "Please install required packages:\n"
+                "pip install onnxruntime transformers pillow"
+            )
+        except Exception as e:
+            logger.error(f"Error loading ONNX captioner: {e}")
+            raise
+    
+    def _preprocess(self, image: Image.Image):
+        """Convert an image into model inputs for the active backend."""
+        if self.backend == "onnx":
+            return self.image_processor(images=image, return_tensors="np")
+        return self.processor(image, return_tensors="pt")
+    
+    def _generate(self, inputs, **generate_kwargs) -> str:
+        """Run generation on the active backend and decode the best sequence."""
+        if self.backend == "onnx":
+            output_ids = self.model.generate(inputs["pixel_values"], **generate_kwargs)
+            return self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+        
+        outputs = self.model.generate(**inputs, **generate_kwargs)
+        return self.processor.decode(outputs[0], skip_special_tokens=True)
+    
     def generate_caption(
         self,
         image: Image.Image,
@@ -93,11 +149,11 @@ class ExternalCaptioner:
                 image = image.resize(new_size, Image.Resampling.LANCZOS)
             
             # Process image
-            inputs = self.processor(image, return_tensors="pt")
+            inputs = self._preprocess(image)
             
             # Generate caption with optimized parameters for better descriptions
-            outputs = self.model.generate(
-                **inputs,
+            caption = self._generate(
+                inputs,
                 max_length=max_length,
                 min_length=min_length,
                 num_beams=num_beams,
@@ -109,9 +165,6 @@ class ExternalCaptioner:
                 repetition_penalty=1.5  # Increased to avoid repetitive words
             )
             
-            # Decode caption
-            caption = self.processor.decode(outputs[0], skip_special_tokens=True)
-            
             # Clean up caption
             caption = caption.strip()
             
@@ -148,8 +201,8 @@ class ExternalCaptioner:
             # If quality issue detected, try with sampling for more creative description
             if has_quality_issue and num_beams > 1:
                 logger.warning(f"Quality issue detected in caption: {caption}, trying alternative...")
-                outputs = self.model.generate(
-                    **inputs,
+                alt_caption = self._generate(
+                    inputs,
                     max_length=max_length,
                     min_length=min_length,
                     num_beams=5,
@@ -161,8 +214,7 @@ class ExternalCaptioner:
                     top_p=0.92,
                     temperature=0.8,
                     repetition_penalty=1.3
-                )
-                alt_caption = self.processor.decode(outputs[0], skip_special_tokens=True).strip()
+                ).strip()
                 
                 # Use alternative if it doesn't have quality issues
                 alt_lower = alt_caption.lower()
@@ -177,6 +229,7 @@ class ExternalCaptioner:
             metadata = {
                 "model": self.model_name,
                 "method": "external_api",
+                "backend": self.backend,
                 "max_length": max_length,
                 "num_beams": num_beams
             }
@@ -192,7 +245,10 @@ class ExternalCaptioner:
         """Check if external captioner is available."""
         try:
             import transformers
-            import torch
+            if self.backend == "onnx":
+                import onnxruntime
+            else:
+                import torch
             return True
         except ImportError:
             return False
@@ -205,7 +261,8 @@ class HybridCaptioner:
         self,
         local_generator=None,
         local_feature_extractor=None,
-        use_external_by_default: bool = True
+        use_external_by_default: bool = True,
+        eager_load: bool = False
     ):
         """Initialize hybrid captioner.
         
@@ -213,6 +270,8 @@ class HybridCaptioner:
             local_generator: Local CaptionGenerator instance
             local_feature_extractor: Local FeatureExtractor instance
             use_external_by_default: Whether to use external API by default
+            eager_load: Load the external model and run a warmup inference now
+                instead of on the first request
         """
         self.local_generator = local_generator
         self.local_feature_extractor = local_feature_extractor
@@ -223,6 +282,8 @@ class HybridCaptioner:
         if use_external_by_default:
             try:
                 self.external_captioner = ExternalCaptioner()
+                if eager_load:
+                    warmup(self.external_captioner)
             except Exception as e:
                 logger.warning(f"External captioner not available: {e}")
     
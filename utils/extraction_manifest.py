@@ -0,0 +1,276 @@
+"""Incremental, resumable feature extraction.
+
+An extraction manifest (``manifest.json`` inside the feature store) records
+the image id, size, mtime and content hash of every extracted file. A run
+compares the image directory against it and extracts only new or changed
+files. Entries for deleted files are dropped from the store.
+
+New features are checkpointed to ``<store>.partial/`` in chunks as they are
+extracted, so an interrupted run resumes where it stopped. Once every chunk
+is done they are merged into the store in one atomic swap.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from utils.feature_codecs import codec_from_config
+from utils.feature_store import INDEX_FILE, FeatureStore
+from utils.image_archive import iter_sources, member_stat, read_member, split_member_path
+from utils.logger import logger
+
+MANIFEST_FILE = "manifest.json"
+PARTIAL_SUFFIX = ".partial"
+
+
+@dataclass
+class FileRecord:
+    """What a feature row was extracted from."""
+    image_id: str
+    size: int
+    mtime: float
+    sha256: str
+
+
+@dataclass
+class ExtractionPlan:
+    """Work needed to bring a store up to date with an image directory."""
+    todo: List[Tuple[str, str]] = field(default_factory=list)
+    records: Dict[str, FileRecord] = field(default_factory=dict)
+    unchanged: int = 0
+    refreshed: int = 0
+    removed_ids: Set[str] = field(default_factory=set)
+
+
+def file_hash(path: Union[str, io.BytesIO], block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's, archive member's or in-memory file's contents."""
+    if isinstance(path, io.BytesIO):
+        return hashlib.sha256(path.getvalue()).hexdigest()
+    if split_member_path(path) is not None:
+        return hashlib.sha256(read_member(path)).hexdigest()
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def file_stat(path: str) -> Tuple[int, float]:
+    """(size, mtime) of a file or archive member."""
+    if split_member_path(path) is not None:
+        return member_stat(path)
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+class ExtractionManifest:
+    """File path -> FileRecord for every row in a feature store."""
+
+    def __init__(self, records: Optional[Dict[str, FileRecord]] = None):
+        self.records: Dict[str, FileRecord] = records or {}
+
+    @classmethod
+    def load(cls, store_path: str) -> 'ExtractionManifest':
+        """Load the manifest of a store (empty if there is none)."""
+        manifest_path = Path(store_path) / MANIFEST_FILE
+        if not manifest_path.exists():
+            return cls()
+        with open(manifest_path, 'r') as f:
+            data = json.load(f)
+        return cls({path: FileRecord(**record) for path, record in data["files"].items()})
+
+    def to_json(self) -> Dict:
+        """JSON-serialisable form stored next to the features."""
+        return {"files": {path: asdict(record) for path, record in self.records.items()}}
+
+    def save(self, store_path: str) -> None:
+        """Atomically rewrite the manifest inside an existing store."""
+        manifest_path = Path(store_path) / MANIFEST_FILE
+        tmp_path = manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp_path, manifest_path)
+
+    def plan(self, items: List[Tuple[str, str]]) -> ExtractionPlan:
+        """Compare (image_id, path) items with the manifest.
+
+        Files whose size and mtime match are skipped without being read.
+        Otherwise the content hash decides, so a touched but unchanged file
+        only has its record refreshed.
+
+        Args:
+            items: Current (image_id, path) items
+
+        Returns:
+            ExtractionPlan with the items to extract and ids to remove
+        """
+        plan = ExtractionPlan()
+        current_paths = set()
+        to_hash = []
+
+        for image_id, path in items:
+            key = str(path)
+            current_paths.add(key)
+            size, mtime = file_stat(path)
+            record = self.records.get(key)
+
+            if (record is not None and record.image_id == image_id
+                    and record.size == size and record.mtime == mtime):
+                plan.unchanged += 1
+                continue
+            to_hash.append((image_id, path, size, mtime))
+
+        # Archive members are hashed in one streaming pass, not one seek each
+        hashes = {
+            path: file_hash(source)
+            for path, source in iter_sources((path, path) for _, path, _, _ in to_hash)
+        }
+
+        for image_id, path, size, mtime in to_hash:
+            if path not in hashes:
+                continue  # unreadable archive member, already logged
+            key = str(path)
+            record = self.records.get(key)
+            new_record = FileRecord(image_id, size, mtime, hashes[path])
+            if record is not None and record.image_id == image_id and record.sha256 == new_record.sha256:
+                self.records[key] = new_record
+                plan.unchanged += 1
+                plan.refreshed += 1
+                continue
+
+            plan.todo.append((image_id, path))
+            plan.records[key] = new_record
+
+        current_ids = {image_id for image_id, _ in items}
+        for key in [key for key in self.records if key not in current_paths]:
+            record = self.records.pop(key)
+            if record.image_id not in current_ids:
+                plan.removed_ids.add(record.image_id)
+
+        return plan
+
+
+def _load_partial(partial_dir: Path) -> Tuple[Dict[str, np.ndarray], Dict[str, FileRecord]]:
+    """Features and records from checkpoint chunks of an interrupted run."""
+    features, records = {}, {}
+    for chunk_path in sorted(partial_dir.glob('chunk_*.npz')):
+        with np.load(chunk_path) as chunk:
+            for image_id, row in zip(chunk['ids'], chunk['features']):
+                features[str(image_id)] = row[np.newaxis]
+            for path, record in json.loads(str(chunk['records'])).items():
+                records[path] = FileRecord(**record)
+    return features, records
+
+
+def _save_chunk(partial_dir: Path, index: int, features: Dict[str, np.ndarray], records: Dict[str, FileRecord]) -> None:
+    """Atomically write one checkpoint chunk."""
+    ids = list(features)
+    tmp_path = partial_dir / f'chunk_{index:05d}.npz.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            ids=np.array(ids),
+            features=np.concatenate([features[image_id] for image_id in ids]),
+            records=np.array(json.dumps({path: asdict(record) for path, record in records.items()}))
+        )
+    os.replace(tmp_path, partial_dir / f'chunk_{index:05d}.npz')
+
+
+def update_feature_store(
+    items: List[Tuple[str, str]],
+    store_path: str,
+    pipeline,
+    checkpoint_every: int = 1000,
+    full: bool = False,
+    codec_name: Optional[str] = None,
+    pca_dim: Optional[int] = None,
+    backbone: Optional[str] = None
+) -> Dict[str, int]:
+    """Bring a feature store up to date with a set of image files.
+
+    Args:
+        items: Current (image_id, path) items
+        store_path: Feature store directory
+        pipeline: FeaturePipeline used for extraction
+        checkpoint_every: Images per checkpoint chunk
+        full: Ignore the manifest and any checkpoint, re-extract everything
+            and refit the codec
+        codec_name: Codec for a new store (default: preprocessing.feature_codec)
+        pca_dim: PCA dimension for a new store
+        backbone: Backbone the features come from; a store built with a
+            different backbone is rebuilt from scratch
+
+    Returns:
+        Counts of total, unchanged, resumed, extracted, failed and removed images
+    """
+    store_path = Path(store_path)
+    partial_dir = store_path.with_name(store_path.name + PARTIAL_SUFFIX)
+    store_exists = (store_path / INDEX_FILE).exists() and not full
+
+    if store_exists and backbone:
+        stored_backbone = FeatureStore(str(store_path)).metadata.get("backbone", "vgg16")
+        if stored_backbone != backbone:
+            logger.warning(f"{store_path} holds {stored_backbone} features; rebuilding for {backbone}")
+            full, store_exists = True, False
+
+    if full and partial_dir.exists():
+        shutil.rmtree(partial_dir)
+    partial_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = ExtractionManifest.load(str(store_path)) if store_exists else ExtractionManifest()
+    new_features, resumed_records = _load_partial(partial_dir)
+    manifest.records.update(resumed_records)
+    if resumed_records:
+        logger.info(f"Resuming extraction: {len(new_features)} images already checkpointed")
+
+    plan = manifest.plan(items)
+    stats = {
+        "total": len(items),
+        "unchanged": plan.unchanged - len(resumed_records),
+        "resumed": len(new_features),
+        "extracted": 0,
+        "failed": 0,
+        "removed": len(plan.removed_ids),
+    }
+    logger.info(
+        f"Extraction plan: {len(plan.todo)} to extract, {stats['unchanged']} unchanged, "
+        f"{stats['removed']} removed"
+    )
+
+    chunk_index = len(list(partial_dir.glob('chunk_*.npz')))
+    for start in range(0, len(plan.todo), checkpoint_every):
+        chunk_items = plan.todo[start:start + checkpoint_every]
+        features = pipeline.extract(chunk_items)
+        records = {
+            str(path): plan.records[str(path)] for image_id, path in chunk_items if image_id in features
+        }
+        if features:
+            _save_chunk(partial_dir, chunk_index, features, records)
+            chunk_index += 1
+        new_features.update(features)
+        manifest.records.update(records)
+        stats["extracted"] += len(features)
+        stats["failed"] += len(chunk_items) - len(features)
+
+    files = {MANIFEST_FILE: manifest.to_json()}
+    metadata = {"backbone": backbone} if backbone else None
+    if store_exists and (new_features or plan.removed_ids):
+        FeatureStore.merge(str(store_path), new_features, remove_ids=plan.removed_ids, metadata=metadata, files=files)
+    elif new_features:
+        codec = codec_from_config(new_features, name=codec_name, pca_dim=pca_dim)
+        FeatureStore.create(str(store_path), new_features, metadata=metadata, codec=codec, files=files)
+    elif plan.refreshed:
+        manifest.save(str(store_path))
+
+    shutil.rmtree(partial_dir)
+    logger.info(
+        f"Feature store up to date: {stats['extracted']} extracted, {stats['resumed']} resumed, "
+        f"{stats['unchanged']} unchanged, {stats['removed']} removed, {stats['failed']} failed"
+    )
+    return stats
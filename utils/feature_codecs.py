@@ -0,0 +1,225 @@
+"""Compact storage codecs for CNN image features.
+
+A float32 VGG16 fc2 vector is 16 KB. Codecs trade a little accuracy for
+much smaller feature stores and in-memory caches:
+
+- ``float32``: no compression (the default)
+- ``float16``: half precision, 2x smaller
+- ``int8``:    symmetric int8 with one float32 scale per vector, ~4x smaller
+- ``pca``:     projection onto the top ``dim`` principal components fitted on
+  the training split; the caption model is trained on the reduced vectors
+
+Decoding happens on the fly when a vector is read from the store, so callers
+always see float32 arrays of shape (1, feature_dim).
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+import numpy as np
+
+from utils.config import config
+from utils.data_utils import load_set
+from utils.logger import logger
+
+
+class FeatureCodec:
+    """Identity codec; base class for the compressed codecs."""
+
+    name = "float32"
+    dtype = np.float32
+
+    def fit(self, matrix: np.ndarray) -> 'FeatureCodec':
+        """Fit codec parameters on raw (n, D) features."""
+        return self
+
+    def output_dim(self, input_dim: int) -> int:
+        """Dimension of decoded vectors for raw vectors of ``input_dim``."""
+        return input_dim
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        """Map raw CNN features into the space the caption model is trained on."""
+        return np.asarray(features, dtype=np.float32)
+
+    def encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Encode raw (n, D) features.
+
+        Returns:
+            Tuple of (encoded rows, per-row scales or None)
+        """
+        return self.transform(matrix).astype(self.dtype), None
+
+    def decode(self, encoded: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decode stored rows back to float32 model inputs."""
+        return np.asarray(encoded, dtype=np.float32)
+
+    def params(self) -> Dict[str, np.ndarray]:
+        """Fitted arrays that must be saved with the store."""
+        return {}
+
+    def metadata(self) -> Dict:
+        """JSON-serialisable settings kept in the store index."""
+        return {"codec": self.name}
+
+
+class Float16Codec(FeatureCodec):
+    """Half-precision storage."""
+
+    name = "float16"
+    dtype = np.float16
+
+
+class Int8Codec(FeatureCodec):
+    """Symmetric int8 quantisation with a per-vector scale."""
+
+    name = "int8"
+    dtype = np.int8
+
+    def encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        matrix = np.asarray(matrix, dtype=np.float32)
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        encoded = np.clip(np.rint(matrix / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+        return encoded, scales.astype(np.float32)
+
+    def decode(self, encoded: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.asarray(encoded, dtype=np.float32) * np.asarray(scales, dtype=np.float32)[:, np.newaxis]
+
+
+class PCACodec(FeatureCodec):
+    """Projection onto the leading principal components."""
+
+    name = "pca"
+
+    def __init__(self, dim: int = 256, mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None):
+        """Initialize PCA codec.
+
+        Args:
+            dim: Number of components to keep
+            mean: Fitted feature mean, shape (D,)
+            components: Fitted components, shape (dim, D)
+        """
+        self.dim = dim
+        self.mean = mean
+        self.components = components
+
+    def fit(self, matrix: np.ndarray) -> 'PCACodec':
+        """Fit components on raw training features (n >= dim rows)."""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape[0] < self.dim:
+            raise ValueError(f"PCA to {self.dim} dims needs at least {self.dim} training vectors, got {matrix.shape[0]}")
+
+        self.mean = matrix.mean(axis=0)
+        # Eigen-decomposition of the (D, D) covariance is cheaper than an SVD
+        # of the (n, D) data for n >> D
+        covariance = np.cov(matrix - self.mean, rowvar=False)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:self.dim]
+        self.components = eigenvectors[:, order].T.astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+
+        explained = eigenvalues[order].sum() / max(eigenvalues.sum(), 1e-12)
+        logger.info(f"Fitted PCA {matrix.shape[1]} -> {self.dim} dims ({explained:.1%} variance kept)")
+        return self
+
+    def output_dim(self, input_dim: int) -> int:
+        return self.dim
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        if self.components is None:
+            raise ValueError("PCA codec is not fitted")
+        features = np.asarray(features, dtype=np.float32)
+        return (features - self.mean) @ self.components.T
+
+    def params(self) -> Dict[str, np.ndarray]:
+        return {"mean": self.mean, "components": self.components}
+
+    def metadata(self) -> Dict:
+        return {"codec": self.name, "pca_dim": self.dim}
+
+
+CODECS = {
+    "float32": FeatureCodec,
+    "float16": Float16Codec,
+    "int8": Int8Codec,
+    "pca": PCACodec,
+}
+
+
+def get_codec(name: str = "float32", pca_dim: int = 256) -> FeatureCodec:
+    """Create an unfitted codec by name.
+
+    Args:
+        name: One of float32, float16, int8, pca
+        pca_dim: Output dimension for the pca codec
+
+    Returns:
+        Codec instance
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unknown feature codec '{name}'. Available: {', '.join(CODECS)}")
+    if name == "pca":
+        return PCACodec(dim=pca_dim)
+    return CODECS[name]()
+
+
+def restore_codec(metadata: Mapping, params: Optional[Mapping[str, np.ndarray]] = None) -> FeatureCodec:
+    """Rebuild a fitted codec from store metadata and saved arrays."""
+    name = metadata.get("codec", "float32")
+    if name == "pca":
+        return PCACodec(dim=metadata["pca_dim"], mean=params["mean"], components=params["components"])
+    return get_codec(name)
+
+
+def fit_codec(
+    name: str,
+    features: Mapping[str, np.ndarray],
+    fit_ids: Optional[Iterable[str]] = None,
+    pca_dim: int = 256
+) -> FeatureCodec:
+    """Create a codec and fit it on (a split of) a features mapping.
+
+    Args:
+        name: Codec name
+        features: Mapping of image id to raw (1, D) features
+        fit_ids: Image ids to fit on, normally the training split (default: all)
+        pca_dim: Output dimension for the pca codec
+
+    Returns:
+        Fitted codec
+    """
+    codec = get_codec(name, pca_dim=pca_dim)
+    if name != "pca":
+        return codec
+
+    ids = [image_id for image_id in (fit_ids if fit_ids is not None else features) if image_id in features]
+    matrix = np.concatenate([np.asarray(features[image_id]).reshape(1, -1) for image_id in ids])
+    return codec.fit(matrix)
+
+
+def codec_from_config(
+    features: Mapping[str, np.ndarray],
+    name: Optional[str] = None,
+    pca_dim: Optional[int] = None
+) -> FeatureCodec:
+    """Fit the configured codec, using the training split for PCA.
+
+    Args:
+        features: Mapping of image id to raw (1, D) features
+        name: Codec name (defaults to preprocessing.feature_codec)
+        pca_dim: PCA dimension (defaults to preprocessing.pca_dim)
+
+    Returns:
+        Fitted codec
+    """
+    name = name or config.get('preprocessing.feature_codec', 'float32')
+    pca_dim = pca_dim or config.get('preprocessing.pca_dim', 256)
+
+    fit_ids = None
+    train_file = config.get('data.train_split', 'data/train.txt')
+    if name == "pca":
+        if Path(train_file).exists():
+            fit_ids = load_set(train_file)
+        else:
+            logger.warning(f"{train_file} not found; fitting PCA on all images")
+
+    return fit_codec(name, features, fit_ids=fit_ids, pca_dim=pca_dim)
@@ -0,0 +1,406 @@
+"""Memory-mapped image feature store.
+
+A store is a directory holding:
+
+- ``features.npy``: one contiguous (N, feature_dim) matrix
+- ``index.json``:   image ids in row order plus metadata
+- ``scales.npy`` / ``codec.npz``: codec state for compressed stores
+
+Opening a store memory-maps the matrix, so it loads instantly whatever its
+size, and ``store[image_id]`` returns a (1, feature_dim) float32 array: a
+zero-copy view for float32 stores, or a row decoded on the fly for stores
+written with a codec from ``utils.feature_codecs``. That is the same shape
+the legacy ``features.pkl`` dictionary held, so existing ``photos[key][0]``
+code works unchanged.
+"""
+import copy
+import json
+import os
+import shutil
+from pathlib import Path
+from pickle import dump, load
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+import numpy as np
+
+from utils.config import config
+from utils.feature_codecs import FeatureCodec, restore_codec
+from utils.logger import logger
+
+MATRIX_FILE = "features.npy"
+INDEX_FILE = "index.json"
+SCALES_FILE = "scales.npy"
+CODEC_FILE = "codec.npz"
+FORMAT_VERSION = 1
+OLD_SUFFIX = ".old"
+
+
+class FeatureStore(Mapping):
+    """Read-only, memory-mapped mapping of image id -> (1, feature_dim) float32 features."""
+
+    def __init__(self, path: str, mmap: bool = True):
+        """Open a feature store.
+
+        Args:
+            path: Store directory
+            mmap: Memory-map the matrix (False loads it into RAM)
+        """
+        self.path = Path(path)
+        _recover_swap(self.path)
+        index_path = self.path / INDEX_FILE
+        if not index_path.exists():
+            raise FileNotFoundError(f"Feature store not found: {self.path}")
+
+        with open(index_path, 'r') as f:
+            self.metadata = json.load(f)
+
+        self.ids: List[str] = self.metadata["ids"]
+        self._rows: Dict[str, int] = {image_id: row for row, image_id in enumerate(self.ids)}
+        self.matrix = np.load(self.path / MATRIX_FILE, mmap_mode='r' if mmap else None)
+        self.codec = load_codec(str(self.path), self.metadata)
+        scales_path = self.path / SCALES_FILE
+        self.scales = np.load(scales_path, mmap_mode='r' if mmap else None) if scales_path.exists() else None
+
+        if self.matrix.shape[0] != len(self.ids):
+            raise ValueError(
+                f"Corrupt feature store {self.path}: {self.matrix.shape[0]} rows, {len(self.ids)} ids"
+            )
+
+    @property
+    def feature_dim(self) -> int:
+        """Dimension of each feature vector."""
+        return int(self.matrix.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored features in bytes."""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _decode(self, rows) -> np.ndarray:
+        """Decode stored rows (a slice or index array) to float32."""
+        scales = self.scales[rows] if self.scales is not None else None
+        return self.codec.decode(self.matrix[rows], scales)
+
+    def __getitem__(self, image_id: str) -> np.ndarray:
+        row = self._rows[image_id]
+        if self.matrix.dtype == np.float32:
+            return self.matrix[row:row + 1]
+        return self._decode(slice(row, row + 1))
+
+    def __contains__(self, image_id) -> bool:
+        return image_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_index(self, image_ids: Iterable[str]) -> np.ndarray:
+        """Row numbers of the given image ids."""
+        return np.array([self._rows[image_id] for image_id in image_ids], dtype=np.int64)
+
+    def rows(self, image_ids: Iterable[str]) -> np.ndarray:
+        """Gather and decode features for many ids into one (n, feature_dim) array."""
+        return self.gather(self.row_index(image_ids))
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        """Decode the features at row numbers from ``row_index``."""
+        return self._decode(rows)
+
+    def subset(self, image_ids: Iterable[str]) -> 'FeatureStore':
+        """Store restricted to the given ids, sharing the mapped matrix.
+
+        Unlike a dict of decoded arrays, this keeps compressed stores
+        compressed in memory.
+        """
+        view = copy.copy(self)
+        view.ids = [image_id for image_id in image_ids if image_id in self._rows]
+        view._rows = {image_id: self._rows[image_id] for image_id in view.ids}
+        return view
+
+    def with_aliases(self, aliases: Dict[str, str]) -> 'FeatureStore':
+        """Store that also answers for duplicate ids, sharing the canonical rows.
+
+        Args:
+            aliases: Duplicate id -> canonical id (see utils/dedup.py)
+        """
+        view = copy.copy(self)
+        view._rows = dict(self._rows)
+        for image_id, canonical in aliases.items():
+            if canonical in self._rows and image_id not in self._rows:
+                view._rows[image_id] = self._rows[canonical]
+        view.ids = list(view._rows)
+        return view
+
+    def close(self) -> None:
+        """Unmap the features; Windows cannot replace a store's files while they are mapped."""
+        self.matrix = self.scales = None
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """Copy the whole store into a legacy features dictionary."""
+        return {image_id: np.array(self[image_id]) for image_id in self.ids}
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        features: Mapping[str, np.ndarray],
+        metadata: Optional[Dict] = None,
+        codec: Optional[FeatureCodec] = None,
+        chunk_size: int = 1024,
+        files: Optional[Dict[str, object]] = None
+    ) -> 'FeatureStore':
+        """Write a feature store from an id -> features mapping.
+
+        The store is written to a temporary directory and renamed into place,
+        so readers never see a half-written store. The old version is renamed
+        aside first and deleted last; if a crash leaves no store, opening it
+        restores that old version.
+
+        Args:
+            path: Store directory to create (replaced if it exists)
+            features: Mapping of image id to raw (1, D) or (D,) arrays
+            metadata: Extra metadata to keep in index.json
+            codec: Fitted storage codec (default: float32, uncompressed)
+            chunk_size: Rows encoded at a time
+            files: Extra JSON files to write into the store, by file name
+
+        Returns:
+            The opened store
+        """
+        ids = list(features.keys())
+        if not ids:
+            raise ValueError("Cannot create an empty feature store")
+
+        codec = codec or FeatureCodec()
+        source_dim = np.asarray(features[ids[0]]).reshape(-1).shape[0]
+
+        def chunks():
+            for start in range(0, len(ids), chunk_size):
+                yield codec.encode(_stack(features, ids[start:start + chunk_size]))
+
+        return cls._write(Path(path), ids, chunks(), codec, source_dim, metadata, files)
+
+    @classmethod
+    def merge(
+        cls,
+        path: str,
+        features: Mapping[str, np.ndarray],
+        remove_ids: Iterable[str] = (),
+        metadata: Optional[Dict] = None,
+        codec: Optional[FeatureCodec] = None,
+        chunk_size: int = 1024,
+        files: Optional[Dict[str, object]] = None
+    ) -> 'FeatureStore':
+        """Write a new version of a store with rows added, replaced or removed.
+
+        Existing rows are copied as stored, and new rows are encoded with the
+        store's fitted codec, so a PCA store keeps its projection. Only a
+        full rebuild refits the codec.
+
+        Args:
+            path: Store directory (created if it does not exist)
+            features: Raw features to add, replacing rows with the same id
+            remove_ids: Ids to drop
+            metadata: Extra metadata to keep in index.json
+            codec: Codec for a new store (ignored when the store exists)
+            chunk_size: Rows copied or encoded at a time
+            files: Extra JSON files to write into the store, by file name
+
+        Returns:
+            The opened store
+        """
+        path = Path(path)
+        if not (path / INDEX_FILE).exists():
+            return cls.create(str(path), features, metadata, codec, chunk_size, files)
+
+        existing = cls(str(path))
+        drop = set(remove_ids) | set(features)
+        keep = [image_id for image_id in existing.ids if image_id not in drop]
+        new_ids = list(features.keys())
+        codec = existing.codec
+
+        def chunks():
+            for start in range(0, len(keep), chunk_size):
+                rows = existing.row_index(keep[start:start + chunk_size])
+                scales = existing.scales[rows] if existing.scales is not None else None
+                yield np.asarray(existing.matrix[rows]), scales
+            # Copied out; unmap before the directory is swapped
+            existing.close()
+            for start in range(0, len(new_ids), chunk_size):
+                yield codec.encode(_stack(features, new_ids[start:start + chunk_size]))
+
+        reserved = ("version", "feature_dim", "source_dim", "dtype", "codec", "pca_dim", "ids")
+        merged_metadata = {k: v for k, v in existing.metadata.items() if k not in reserved}
+        merged_metadata.update(metadata or {})
+        source_dim = existing.metadata.get("source_dim", existing.feature_dim)
+
+        return cls._write(path, keep + new_ids, chunks(), codec, source_dim, merged_metadata, files)
+
+    @classmethod
+    def _write(
+        cls,
+        path: Path,
+        ids: List[str],
+        chunks: Iterable,
+        codec: FeatureCodec,
+        source_dim: int,
+        metadata: Optional[Dict],
+        files: Optional[Dict[str, object]]
+    ) -> 'FeatureStore':
+        """Write encoded (rows, scales) chunks in id order and swap the store in."""
+        if not ids:
+            raise ValueError("Cannot create an empty feature store")
+
+        feature_dim = codec.output_dim(source_dim)
+        dtype = np.dtype(codec.dtype)
+
+        tmp_path = path.with_name(path.name + '.tmp')
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        matrix = np.lib.format.open_memmap(
+            tmp_path / MATRIX_FILE, mode='w+', dtype=dtype, shape=(len(ids), feature_dim)
+        )
+        scales = None
+        start = 0
+        for encoded, chunk_scales in chunks:
+            matrix[start:start + len(encoded)] = encoded
+            if chunk_scales is not None:
+                if scales is None:
+                    scales = np.lib.format.open_memmap(
+                        tmp_path / SCALES_FILE, mode='w+', dtype=np.float32, shape=(len(ids),)
+                    )
+                scales[start:start + len(encoded)] = chunk_scales
+            start += len(encoded)
+        matrix.flush()
+        del matrix, scales
+
+        if codec.params():
+            np.savez(tmp_path / CODEC_FILE, **codec.params())
+
+        index = {
+            "version": FORMAT_VERSION,
+            "feature_dim": feature_dim,
+            "source_dim": source_dim,
+            "dtype": str(dtype),
+            **codec.metadata(),
+            "ids": ids,
+            **(metadata or {}),
+        }
+        with open(tmp_path / INDEX_FILE, 'w') as f:
+            json.dump(index, f)
+        for name, content in (files or {}).items():
+            with open(tmp_path / name, 'w') as f:
+                json.dump(content, f)
+
+        _recover_swap(path)
+        old_path = path.with_name(path.name + OLD_SUFFIX)
+        if old_path.exists():
+            shutil.rmtree(old_path)
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        if old_path.exists():
+            shutil.rmtree(old_path)
+
+        logger.info(f"Wrote feature store {path}: {len(ids)} x {feature_dim} {dtype} ({codec.name})")
+        return cls(str(path))
+
+
+def _recover_swap(path: Path) -> None:
+    """Put the previous version back if a crash fell between the swap's two renames."""
+    old_path = path.with_name(path.name + OLD_SUFFIX)
+    if not path.exists() and (old_path / INDEX_FILE).exists():
+        logger.warning(f"Restoring {path} from {old_path} after an interrupted update")
+        os.replace(old_path, path)
+
+
+def _stack(features: Mapping[str, np.ndarray], ids: List[str]) -> np.ndarray:
+    """Stack raw features for ids into one (n, D) float32 matrix."""
+    return np.stack([np.asarray(features[image_id], dtype=np.float32).reshape(-1) for image_id in ids])
+
+
+def load_codec(path: str, metadata: Optional[Dict] = None) -> FeatureCodec:
+    """Load the fitted codec of a store without mapping its features.
+
+    Inference uses this to project raw CNN features the same way the
+    training features were (e.g. PCA).
+
+    Args:
+        path: Store directory
+        metadata: Parsed index.json, if already loaded
+
+    Returns:
+        Fitted codec
+    """
+    path = Path(path)
+    if metadata is None:
+        with open(path / INDEX_FILE, 'r') as f:
+            metadata = json.load(f)
+
+    params = None
+    if (path / CODEC_FILE).exists():
+        with np.load(path / CODEC_FILE) as saved:
+            params = {name: saved[name] for name in saved.files}
+    return restore_codec(metadata, params)
+
+
+def convert_pickle_to_store(
+    pickle_path: str,
+    store_path: str,
+    codec: Optional[FeatureCodec] = None
+) -> FeatureStore:
+    """Convert a legacy features.pkl into a feature store.
+
+    Args:
+        pickle_path: Legacy pickle
+        store_path: Store directory to write
+        codec: Fitted storage codec (default: float32)
+
+    Returns:
+        The opened store
+    """
+    with open(pickle_path, 'rb') as f:
+        features = load(f)
+    return FeatureStore.create(store_path, features, metadata={"source": str(pickle_path)}, codec=codec)
+
+
+def convert_store_to_pickle(store_path: str, pickle_path: str) -> None:
+    """Write a feature store back out as a legacy features.pkl."""
+    features = FeatureStore(store_path).to_dict()
+    with open(pickle_path, 'wb') as f:
+        dump(features, f)
+    logger.info(f"Wrote {len(features)} features to {pickle_path}")
+
+
+def load_features(path: Optional[str] = None) -> Union[FeatureStore, Dict[str, np.ndarray]]:
+    """Open image features from a store directory, falling back to a pickle.
+
+    Args:
+        path: Store directory or .pkl file. Defaults to ``paths.feature_store``
+            and then ``paths.features_file`` from config.yaml.
+
+    Returns:
+        FeatureStore, or a plain dictionary for legacy pickles
+    """
+    candidates = [path] if path else [
+        config.get('paths.feature_store', 'features_store'),
+        config.get('paths.features_file', 'features.pkl'),
+    ]
+
+    for candidate in candidates:
+        candidate_path = Path(candidate)
+        if (candidate_path / INDEX_FILE).exists():
+            return FeatureStore(str(candidate_path))
+        if candidate_path.is_file():
+            logger.warning(
+                f"Loading legacy pickle {candidate_path}; convert it with "
+                f"scripts/convert_features.py for instant memory-mapped loading"
+            )
+            with open(candidate_path, 'rb') as f:
+                return load(f)
+
+    raise FileNotFoundError(f"No image features found at: {', '.join(map(str, candidates))}")
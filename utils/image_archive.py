@@ -0,0 +1,167 @@
+"""Read images straight out of .zip and .tar archives.
+
+An image inside an archive is addressed as ``<archive>::<member>``, e.g.
+``data/Flickr8k_Dataset.zip::Flicker8k_Dataset/667626_18933d713e.jpg``.
+These member paths can be used wherever an image path is expected by the
+feature pipeline, the extraction manifest and dedup, so a dataset never has
+to be unpacked.
+
+``iter_sources`` is the streaming reader used by ``FeaturePipeline``: it
+reads members in archive order on one thread and hands in-memory files to
+the decode workers. Zip members are read directly by offset. Tar archives,
+including compressed ones, are read in a single forward pass, stopping as
+soon as every requested member has been seen.
+"""
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from utils.logger import logger
+
+ARCHIVE_SEPARATOR = "::"
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+_handles = threading.local()
+
+
+def is_archive(path: str) -> bool:
+    """Whether a path names a supported archive file."""
+    return str(path).lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def member_path(archive: str, name: str) -> str:
+    """Path addressing one member of an archive."""
+    return f"{archive}{ARCHIVE_SEPARATOR}{name}"
+
+
+def split_member_path(path: str) -> Optional[Tuple[str, str]]:
+    """(archive, member name) for a member path, None for a plain file path."""
+    if not isinstance(path, str) or ARCHIVE_SEPARATOR not in path:
+        return None
+    archive, name = path.split(ARCHIVE_SEPARATOR, 1)
+    return archive, name
+
+
+@lru_cache(maxsize=8)
+def _archive_index(archive: str, archive_mtime: float) -> Dict[str, Tuple[int, float]]:
+    """Member name -> (size, mtime) for every file in an archive (cached per archive mtime)."""
+    if archive.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive) as zf:
+            return {
+                info.filename: (info.file_size, datetime(*info.date_time).timestamp())
+                for info in zf.infolist() if not info.is_dir()
+            }
+    with tarfile.open(archive, mode='r|*') as tf:
+        return {member.name: (member.size, float(member.mtime)) for member in tf if member.isfile()}
+
+
+def list_archive_images(archive: str) -> List[Tuple[str, str]]:
+    """(image_id, member path) for every image in an archive, in archive order.
+
+    Args:
+        archive: .zip or .tar(.gz/.bz2/.xz) file
+
+    Returns:
+        Items in the same form ``preprocess_images.list_images`` returns
+    """
+    items = []
+    for name in _archive_index(archive, os.path.getmtime(archive)):
+        basename = os.path.basename(name)
+        if basename.startswith('.') or not basename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        items.append((basename.split('.')[0], member_path(archive, name)))
+    return items
+
+
+def member_stat(path: str) -> Tuple[int, float]:
+    """(size, mtime) of an archive member, like ``os.stat`` for a file."""
+    archive, name = split_member_path(path)
+    size, mtime = _archive_index(archive, os.path.getmtime(archive))[name]
+    return size, mtime
+
+
+def _zip_handle(archive: str) -> zipfile.ZipFile:
+    """Per-thread open ZipFile, so decode workers can read concurrently."""
+    handles = getattr(_handles, 'zips', None)
+    if handles is None:
+        handles = _handles.zips = {}
+    if archive not in handles:
+        handles[archive] = zipfile.ZipFile(archive)
+    return handles[archive]
+
+
+def read_member(path: str) -> bytes:
+    """Bytes of one archive member (random access; slow for compressed tars)."""
+    archive, name = split_member_path(path)
+    if archive.lower().endswith('.zip'):
+        return _zip_handle(archive).read(name)
+    with tarfile.open(archive, mode='r:*') as tf:
+        return tf.extractfile(name).read()
+
+
+def open_source(path: str) -> Union[str, io.BytesIO]:
+    """A file path unchanged, or an archive member as an in-memory file."""
+    if split_member_path(path) is None:
+        return path
+    return io.BytesIO(read_member(path))
+
+
+def _stream_tar(archive: str, wanted: Dict[str, List[str]]) -> Iterator[Tuple[str, io.BytesIO]]:
+    """One forward pass over a tar, yielding the wanted members as they appear."""
+    remaining = dict(wanted)
+    with tarfile.open(archive, mode='r|*') as tf:
+        for member in tf:
+            if member.name not in remaining:
+                continue
+            data = tf.extractfile(member).read()
+            for image_id in remaining.pop(member.name):
+                yield image_id, io.BytesIO(data)
+            if not remaining:
+                break
+    for name in remaining:
+        logger.error(f"Error reading {member_path(archive, name)}: no such member in {archive}")
+
+
+def iter_sources(items: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, Union[str, io.BytesIO]]]:
+    """Stream (image_id, path) items, reading archive members into memory.
+
+    Plain file paths pass through untouched. Consecutive members of the same
+    tar are batched into one forward pass over the archive, so a tar is
+    never re-read per image; zip members are read by offset in item order.
+
+    Args:
+        items: (image_id, path or member path) items
+
+    Yields:
+        (image_id, path or BytesIO)
+    """
+    pending_archive, pending = None, {}
+
+    for image_id, path in items:
+        parts = split_member_path(path)
+        archive = parts[0] if parts else None
+        if pending and archive != pending_archive:
+            yield from _stream_tar(pending_archive, pending)
+            pending_archive, pending = None, {}
+
+        if parts is None:
+            yield image_id, path
+        elif archive.lower().endswith('.zip'):
+            try:
+                data = _zip_handle(archive).read(parts[1])
+            except (KeyError, zipfile.BadZipFile) as e:
+                logger.error(f"Error reading {path}: {e}")
+                continue
+            yield image_id, io.BytesIO(data)
+        else:
+            pending_archive = archive
+            pending.setdefault(parts[1], []).append(image_id)
+
+    if pending:
+        yield from _stream_tar(pending_archive, pending)
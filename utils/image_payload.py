@@ -0,0 +1,169 @@
+"""Upload preparation for remote vision APIs.
+
+Images are downsized to the resolution the provider actually uses and
+encoded as quality-tuned JPEG or WebP instead of full-size PNG. Encoded
+payloads are cached by image content hash, so several calls on the same
+image (e.g. ``generate_caption`` then ``generate_multiple_options``) encode
+it only once.
+"""
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from utils.config import config
+from utils.logger import logger
+
+# Effective input resolution per provider. OpenAI fits high-detail images
+# into 2048x2048 and then scales the short side to 768; Gemini downsamples
+# anything larger than 3072 on the long side.
+PROVIDER_LIMITS: Dict[str, Dict[str, Optional[int]]] = {
+    "openai": {"max_side": 2048, "short_side": 768},
+    "gemini": {"max_side": 3072, "short_side": None},
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass
+class EncodedImage:
+    """An encoded upload payload."""
+    raw: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    original_size: Tuple[int, int]
+    encode_ms: float
+
+    @property
+    def data(self) -> str:
+        """Base64 encoded payload."""
+        return base64.b64encode(self.raw).decode('utf-8')
+
+    @property
+    def data_url(self) -> str:
+        """``data:`` URL for APIs that take images inline as URLs."""
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+_cache: "OrderedDict[tuple, EncodedImage]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of a PIL image (pixels, mode and size)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{image.mode}:{image.size}".encode())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+def target_size(size: Tuple[int, int], provider: str) -> Tuple[int, int]:
+    """Largest size the provider will actually use for an image.
+
+    Args:
+        size: Original (width, height)
+        provider: "openai" or "gemini"
+
+    Returns:
+        Target (width, height), never larger than the original
+    """
+    limits = PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS["openai"])
+    width, height = size
+    scale = 1.0
+
+    max_side = config.get('image_payload.max_side') or limits["max_side"]
+    if max_side and max(width, height) * scale > max_side:
+        scale = max_side / max(width, height)
+
+    short_side = limits["short_side"]
+    if short_side and min(width, height) * scale > short_side:
+        scale = short_side / min(width, height)
+
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """Flatten alpha onto white so JPEG can encode the image."""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA', 'P'):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def prepare_image(
+    image: Image.Image,
+    provider: str = "openai",
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None
+) -> EncodedImage:
+    """Downsize and encode an image for upload, reusing cached payloads.
+
+    Args:
+        image: PIL Image
+        provider: "openai" or "gemini"
+        image_format: "JPEG" or "WEBP" (defaults to image_payload.format)
+        quality: Encoder quality 1-100 (defaults to image_payload.quality)
+
+    Returns:
+        EncodedImage payload
+    """
+    image_format = (image_format or config.get('image_payload.format', 'JPEG')).upper()
+    quality = quality or config.get('image_payload.quality', 85)
+    key = (image_digest(image), provider, image_format, quality)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            logger.debug(f"Payload cache hit for {provider} ({len(cached.raw) / 1024:.0f} KB)")
+            return cached
+
+    start = time.perf_counter()
+    size = target_size(image.size, provider)
+    resized = image if size == image.size else image.resize(size, Image.Resampling.LANCZOS)
+    if image_format == 'JPEG':
+        resized = _to_rgb(resized)
+
+    buffered = BytesIO()
+    save_kwargs = {"quality": quality}
+    if image_format == 'JPEG':
+        save_kwargs.update(optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        save_kwargs.update(method=4)
+    resized.save(buffered, format=image_format, **save_kwargs)
+
+    payload = EncodedImage(
+        raw=buffered.getvalue(),
+        mime_type=MIME_TYPES[image_format],
+        size=size,
+        original_size=image.size,
+        encode_ms=(time.perf_counter() - start) * 1000
+    )
+    logger.info(
+        f"Prepared {provider} payload: {image.size[0]}x{image.size[1]} -> "
+        f"{size[0]}x{size[1]} {image_format} q{quality}, "
+        f"{len(payload.raw) / 1024:.0f} KB in {payload.encode_ms:.0f} ms"
+    )
+
+    with _cache_lock:
+        _cache[key] = payload
+        while len(_cache) > config.get('image_payload.cache_size', 64):
+            _cache.popitem(last=False)
+
+    return payload
+
+
+def clear_cache() -> None:
+    """Drop all cached payloads."""
+    with _cache_lock:
+        _cache.clear()
@@ -1,18 +1,26 @@
 """Image processing utilities."""
+import threading
 import numpy as np
 from PIL import Image
 from typing import Optional, Tuple
-from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
 from tensorflow.keras.preprocessing.image import img_to_array, load_img
-from tensorflow.keras.models import Model
+from utils.backbones import get_backbone
+from utils.config import config
+from utils.feature_pipeline import decode_image_into
 from utils.logger import logger
 
 
 class FeatureExtractor:
-    """Singleton class for efficient feature extraction."""
+    """Singleton class for efficient feature extraction.
+    
+    The CNN is the backbone selected by ``model.backbone`` in config.yaml
+    (VGG16 fc2 by default, see utils/backbones.py).
+    """
     
     _instance = None
     _model = None
+    backbone = None
+    _buffers = threading.local()
     
     def __new__(cls):
         if cls._instance is None:
@@ -20,15 +28,21 @@ class FeatureExtractor:
         return cls._instance
     
     def __init__(self):
-        """Initialize feature extractor with VGG16."""
+        """Initialize feature extractor with the configured backbone."""
         if self._model is None:
-            logger.info("Loading VGG16 model for feature extraction...")
-            base_model = VGG16()
-            self._model = Model(
-                inputs=base_model.inputs,
-                outputs=base_model.layers[-2].output
-            )
-            logger.info("VGG16 model loaded successfully")
+            backbone = get_backbone()
+            logger.info(f"Loading {backbone.name} model for feature extraction...")
+            self.backbone = backbone
+            self._model = backbone.build()
+            logger.info(f"{backbone.name} model loaded successfully ({backbone.feature_dim}-d features)")
+    
+    def _buffer(self, target_size: Tuple[int, int]) -> np.ndarray:
+        """Per-thread preallocated (1, H, W, 3) input buffer."""
+        buffer = getattr(self._buffers, 'array', None)
+        if buffer is None or buffer.shape[1:3] != tuple(target_size):
+            buffer = np.empty((1, *target_size, 3), dtype=np.float32)
+            self._buffers.array = buffer
+        return buffer
     
     def extract_from_path(
         self,
@@ -45,10 +59,15 @@ class FeatureExtractor:
             Feature vector
         """
         try:
-            image = load_img(image_path, target_size=target_size)
-            image = img_to_array(image)
-            image = image.reshape((1, *image.shape))
-            image = preprocess_input(image)
+            if config.get('preprocessing.fast_decode', False):
+                # JPEG draft decode into a reused buffer, mean subtracted in place
+                image = self._buffer(target_size)
+                decode_image_into(image_path, image[0], mode=self.backbone.preprocess_mode)
+            else:
+                image = load_img(image_path, target_size=target_size)
+                image = img_to_array(image)
+                image = image.reshape((1, *image.shape))
+                image = self.backbone.preprocess_input(image)
             features = self._model.predict(image, verbose=0)
             return features
         except Exception as e:
@@ -73,7 +92,7 @@ class FeatureExtractor:
             image = image.resize(target_size)
             image = img_to_array(image)
             image = image.reshape((1, *image.shape))
-            image = preprocess_input(image)
+            image = self.backbone.preprocess_input(image)
             features = self._model.predict(image, verbose=0)
             return features
         except Exception as e:
@@ -0,0 +1,261 @@
+"""tf.data input pipeline for caption training.
+
+``build_dataset`` turns extracted image features and tokenised captions into
+a ``tf.data.Dataset`` of ``((image_features, prefixes), next_words)`` batches.
+Training triples are indexed once with ``CaptionSequences``. The per-triple
+records (feature row, prefix, target) are cached, shuffled through a
+bounded buffer and batched. Image features are then gathered for a whole
+batch in a parallel map, and batches are prefetched so the model never
+waits on input. Features from a FeatureStore are read from the memory-mapped
+store batch by batch, so training is not limited to features that fit in
+RAM; a plain features dictionary is held in memory as one tensor.
+
+``build_sequence_dataset`` is the equivalent for the teacher-forcing
+sequence model: one record per whole caption, with per-token sample
+weights that zero out padding.
+
+Both pipelines can bucket samples by length (``training.bucket_boundaries``):
+a batch then only holds samples from one length bucket and its text input
+is trimmed to that bucket's width, so short prefixes and captions no longer
+run the LSTM over ``max_length`` mostly-padded positions.
+``padding_waste`` measures the padded fraction of a dataset's text input.
+
+Unlike the Python generator it replaces, none of this runs under the GIL:
+tf.data assembles the next batches on its own threads while the current
+step trains.
+"""
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+
+from utils.caption_sequences import CaptionSequences
+from utils.config import config
+from utils.feature_store import FeatureStore
+
+
+def feature_matrix(photos: Mapping, image_ids: Sequence[str]) -> np.ndarray:
+    """Stack features for image ids into one (n, feature_dim) float32 matrix."""
+    if isinstance(photos, FeatureStore):
+        return photos.rows(image_ids)
+    return np.concatenate([np.asarray(photos[image_id], dtype=np.float32).reshape(1, -1) for image_id in image_ids])
+
+
+def feature_gather(photos: Mapping, image_ids: Sequence[str]) -> Callable[[tf.Tensor], tf.Tensor]:
+    """Function mapping a batch of rows of ``image_ids`` to their features.
+
+    Args:
+        photos: FeatureStore or features dictionary
+        image_ids: Image id of each row
+
+    Returns:
+        Function from an int tensor of rows to a (batch, feature_dim)
+        float32 tensor
+    """
+    if not isinstance(photos, FeatureStore):
+        features = tf.constant(feature_matrix(photos, image_ids))
+        return lambda rows: tf.gather(features, rows)
+
+    store_rows = photos.row_index(image_ids)
+    feature_dim = photos.gather(store_rows[:1]).shape[1]
+
+    def gather(rows: np.ndarray) -> np.ndarray:
+        return np.asarray(photos.gather(store_rows[rows]), dtype=np.float32)
+
+    return lambda rows: tf.ensure_shape(tf.numpy_function(gather, [rows], tf.float32), [None, feature_dim])
+
+
+def build_dataset(
+    descriptions: Dict[str, List[str]],
+    photos: Mapping,
+    tokenizer,
+    max_length: int,
+    batch_size: Optional[int] = None,
+    shuffle: bool = True,
+    shuffle_buffer: Optional[int] = None,
+    cache: Optional[Union[bool, str]] = None,
+    bucket_boundaries: Optional[Sequence[int]] = None,
+    repeat: bool = False,
+    seed: Optional[int] = None,
+    skip: int = 0
+) -> tf.data.Dataset:
+    """Build the training (or validation) dataset.
+
+    Args:
+        descriptions: Image id -> captions
+        photos: Image id -> (1, feature_dim) features
+        tokenizer: Fitted tokenizer
+        max_length: Model input sequence length
+        batch_size: Triples per batch (default: training.batch_size)
+        shuffle: Shuffle triples every epoch (off for validation)
+        shuffle_buffer: Shuffle buffer size in triples
+            (default: training.shuffle_buffer)
+        cache: Cache the indexed triples: True for memory, a path for a file
+            cache (default: training.cache)
+        bucket_boundaries: Prefix-length bucket widths; empty for fixed
+            ``max_length`` batches (default: training.bucket_boundaries)
+        repeat: Repeat indefinitely in full batches only, for loops that
+            count steps (utils/distributed.py)
+        seed: Shuffle seed; with ``repeat`` the batches are then the same
+            stream on every run (utils/training_checkpoint.py)
+        skip: Batches of that stream to skip, to resume mid-epoch
+
+    Returns:
+        Dataset of ((image_features, prefixes), next_words) batches;
+        prefixes stay left-padded, trimmed to their bucket's width
+    """
+    sequences = _sequences(descriptions, photos, tokenizer, max_length)
+    rows, prefixes, targets = sequences.triples(np.arange(len(sequences.image_ids)))
+    features = feature_gather(photos, sequences.image_ids)
+
+    return _batched(
+        (rows.astype(np.int32), prefixes, targets),
+        (prefixes != 0).sum(axis=1),
+        lambda batch_rows, batch_prefixes, batch_targets, width: (
+            (features(batch_rows), batch_prefixes[:, max_length - width:]), batch_targets
+        ),
+        max_length, batch_size, shuffle, shuffle_buffer, cache, bucket_boundaries, repeat, seed, skip
+    )
+
+
+def build_sequence_dataset(
+    descriptions: Dict[str, List[str]],
+    photos: Mapping,
+    tokenizer,
+    max_length: int,
+    batch_size: Optional[int] = None,
+    shuffle: bool = True,
+    shuffle_buffer: Optional[int] = None,
+    cache: Optional[Union[bool, str]] = None,
+    bucket_boundaries: Optional[Sequence[int]] = None,
+    repeat: bool = False,
+    seed: Optional[int] = None,
+    skip: int = 0
+) -> tf.data.Dataset:
+    """Build the dataset for the teacher-forcing sequence model.
+
+    Args:
+        descriptions: Image id -> captions
+        photos: Image id -> (1, feature_dim) features
+        tokenizer: Fitted tokenizer
+        max_length: Model input sequence length
+        batch_size: Captions per batch (default: training.batch_size)
+        shuffle: Shuffle captions every epoch (off for validation)
+        shuffle_buffer: Shuffle buffer size in captions
+            (default: training.shuffle_buffer)
+        cache: As for ``build_dataset`` (default: training.cache)
+        bucket_boundaries: Caption-length bucket widths, as for
+            ``build_dataset`` (default: training.bucket_boundaries)
+        repeat: As for ``build_dataset``
+        seed: As for ``build_dataset``
+        skip: As for ``build_dataset``
+
+    Returns:
+        Dataset of ((image_features, inputs), targets, sample_weights)
+        batches, inputs and targets shaped (batch, bucket width)
+    """
+    sequences = _sequences(descriptions, photos, tokenizer, max_length)
+    rows, inputs, targets = sequences.teacher_forcing()
+    features = feature_gather(photos, sequences.image_ids)
+
+    return _batched(
+        (rows, inputs, targets),
+        (inputs != 0).sum(axis=1),
+        lambda batch_rows, batch_inputs, batch_targets, width: (
+            (features(batch_rows), batch_inputs[:, :width]),
+            batch_targets[:, :width],
+            tf.cast(batch_targets[:, :width] != 0, tf.float32)
+        ),
+        max_length, batch_size, shuffle, shuffle_buffer, cache, bucket_boundaries, repeat, seed, skip
+    )
+
+
+def bucket_widths(boundaries: Sequence[int], max_length: int) -> List[int]:
+    """Sorted bucket widths: the boundaries below ``max_length``, then ``max_length``."""
+    return sorted({int(b) for b in boundaries if 0 < b < max_length}) + [max_length]
+
+
+def padding_waste(dataset: tf.data.Dataset) -> Tuple[int, int]:
+    """Count padded and total text-input positions over one pass of a dataset.
+
+    Args:
+        dataset: Dataset from ``build_dataset`` or ``build_sequence_dataset``
+
+    Returns:
+        Tuple of (padding positions, total positions)
+    """
+    padded = total = 0
+    for element in dataset:
+        text = element[0][1].numpy()
+        padded += int((text == 0).sum())
+        total += text.size
+    return padded, total
+
+
+def _sequences(descriptions, photos, tokenizer, max_length: int) -> CaptionSequences:
+    """Index the captions of the images that have features."""
+    descriptions = {image_id: captions for image_id, captions in descriptions.items() if image_id in photos}
+    return CaptionSequences(tokenizer, descriptions, max_length)
+
+
+def _batched(
+    records: tuple,
+    lengths: np.ndarray,
+    to_batch,
+    max_length: int,
+    batch_size: Optional[int],
+    shuffle: bool,
+    shuffle_buffer: Optional[int],
+    cache: Optional[Union[bool, str]],
+    bucket_boundaries: Optional[Sequence[int]],
+    repeat: bool = False,
+    seed: Optional[int] = None,
+    skip: int = 0
+) -> tf.data.Dataset:
+    """Cache, shuffle and batch per-sample records, then map batches to model input.
+
+    ``to_batch`` receives the batched records and the text width to trim to.
+    With buckets, samples are grouped by the smallest width holding their
+    length, and each batch comes from a single group. ``skip`` drops whole
+    batches before they are mapped, so resuming does not gather their
+    features.
+    """
+    batch_size = batch_size or config.get('training.batch_size', 32)
+    shuffle_buffer = shuffle_buffer or config.get('training.shuffle_buffer', 10000)
+    cache = config.get('training.cache', True) if cache is None else cache
+    if bucket_boundaries is None:
+        bucket_boundaries = config.get('training.bucket_boundaries') or []
+    widths = bucket_widths(bucket_boundaries, max_length)
+
+    buckets = np.searchsorted(widths, np.minimum(lengths, max_length)).astype(np.int64)
+    dataset = tf.data.Dataset.from_tensor_slices(records + (buckets,))
+    if cache:
+        dataset = dataset.cache() if cache is True else dataset.cache(str(cache))
+    if shuffle:
+        dataset = dataset.shuffle(min(shuffle_buffer, len(buckets)) or 1, seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        dataset = dataset.repeat()
+
+    # Parallel batches may come out of order unless the stream must be reproducible
+    deterministic = not shuffle or seed is not None
+
+    if len(widths) == 1:
+        dataset = dataset.batch(batch_size, drop_remainder=repeat).skip(skip)
+        dataset = dataset.map(
+            lambda *batch: to_batch(*batch[:-1], max_length),
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=deterministic
+        )
+    else:
+        width_table = tf.constant(widths, dtype=tf.int32)
+        dataset = dataset.group_by_window(
+            key_func=lambda *record: record[-1],
+            reduce_func=lambda key, window: window.batch(batch_size),
+            window_size=batch_size
+        ).skip(skip)
+        dataset = dataset.map(
+            lambda *batch: to_batch(*batch[:-1], width_table[batch[-1][0]]),
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=deterministic
+        )
+    return dataset.prefetch(tf.data.AUTOTUNE)
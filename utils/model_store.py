@@ -0,0 +1,225 @@
+"""Model store: cache location, offline bundles and startup warmup.
+
+The Hugging Face cache location is resolved once, before ``transformers`` is
+imported, in this order:
+
+1. ``HF_HOME`` from the environment
+2. ``model_store.cache_dir`` in config.yaml
+3. ``~/.cache/huggingface``
+"""
+import os
+import tarfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.config import config
+from utils.logger import logger
+
+
+@dataclass
+class ModelBundle:
+    """A Hugging Face repository and the files a captioner needs from it."""
+    repo_id: str
+    required_files: List[str] = field(default_factory=lambda: ["config.json"])
+    weight_files: List[str] = field(
+        default_factory=lambda: ["model.safetensors", "pytorch_model.bin"]
+    )
+
+
+BUNDLES: Dict[str, ModelBundle] = {
+    "blip": ModelBundle(
+        repo_id="Salesforce/blip-image-captioning-base",
+        required_files=["config.json", "preprocessor_config.json", "tokenizer_config.json"]
+    ),
+    "blip-large": ModelBundle(
+        repo_id="Salesforce/blip-image-captioning-large",
+        required_files=["config.json", "preprocessor_config.json", "tokenizer_config.json"]
+    ),
+    "vit-gpt2": ModelBundle(
+        repo_id="nlpconnect/vit-gpt2-image-captioning",
+        required_files=["config.json", "preprocessor_config.json", "tokenizer_config.json"]
+    ),
+}
+
+_configured_dir: Optional[Path] = None
+
+
+def resolve_cache_dir() -> Path:
+    """Resolve the Hugging Face cache directory.
+
+    Returns:
+        Cache root (the directory used as HF_HOME)
+    """
+    env_dir = os.environ.get('HF_HOME')
+    if env_dir:
+        return Path(env_dir).expanduser()
+
+    config_dir = config.get('model_store.cache_dir')
+    if config_dir:
+        return Path(config_dir).expanduser()
+
+    return Path.home() / '.cache' / 'huggingface'
+
+
+def is_offline() -> bool:
+    """Whether model loading must not touch the network."""
+    env_flag = os.environ.get('HF_HUB_OFFLINE', '').lower()
+    if env_flag in ('1', 'true', 'yes'):
+        return True
+    return bool(config.get('model_store.offline', False))
+
+
+def configure_cache() -> Path:
+    """Point the Hugging Face libraries at the resolved cache directory.
+
+    Must run before ``transformers`` is imported; later calls are no-ops.
+
+    Returns:
+        Cache root in use
+    """
+    global _configured_dir
+
+    if _configured_dir is not None:
+        return _configured_dir
+
+    cache_dir = resolve_cache_dir()
+    os.environ['HF_HOME'] = str(cache_dir)
+    os.environ.setdefault('TRANSFORMERS_CACHE', str(cache_dir / 'hub'))
+    os.environ.setdefault('HF_DATASETS_CACHE', str(cache_dir / 'datasets'))
+
+    if is_offline():
+        os.environ['HF_HUB_OFFLINE'] = '1'
+        os.environ['TRANSFORMERS_OFFLINE'] = '1'
+
+    _configured_dir = cache_dir
+    logger.info(f"Model cache: {cache_dir}{' (offline)' if is_offline() else ''}")
+    return cache_dir
+
+
+class ModelStore:
+    """Download, verify and bundle the models used by the captioners."""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """Initialize model store.
+
+        Args:
+            cache_dir: Cache root; defaults to the configured HF_HOME
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else configure_cache()
+        self.hub_dir = self.cache_dir / 'hub'
+
+    def _bundle(self, name: str) -> ModelBundle:
+        """Look up a bundle by short name or repository id."""
+        if name in BUNDLES:
+            return BUNDLES[name]
+        for bundle in BUNDLES.values():
+            if bundle.repo_id == name:
+                return bundle
+        return ModelBundle(repo_id=name)
+
+    def preload(self, names: List[str]) -> Dict[str, Path]:
+        """Download bundles into the cache (requires network access).
+
+        Args:
+            names: Bundle names or repository ids
+
+        Returns:
+            Mapping of name to local snapshot directory
+        """
+        from huggingface_hub import snapshot_download
+
+        snapshots = {}
+        for name in names:
+            bundle = self._bundle(name)
+            logger.info(f"Preloading {bundle.repo_id} into {self.hub_dir}...")
+            snapshots[name] = Path(snapshot_download(bundle.repo_id, cache_dir=str(self.hub_dir)))
+        return snapshots
+
+    def verify(self, name: str) -> Dict[str, object]:
+        """Check a bundle is fully present in the cache without network access.
+
+        Args:
+            name: Bundle name or repository id
+
+        Returns:
+            Dictionary with ``ok``, ``path`` and ``missing`` files
+        """
+        bundle = self._bundle(name)
+
+        try:
+            from huggingface_hub import snapshot_download
+            snapshot = Path(snapshot_download(
+                bundle.repo_id, cache_dir=str(self.hub_dir), local_files_only=True
+            ))
+        except Exception:
+            return {"ok": False, "path": None, "missing": ["<snapshot>"]}
+
+        missing = [f for f in bundle.required_files if not (snapshot / f).exists()]
+        if not any((snapshot / f).exists() for f in bundle.weight_files):
+            missing.append(" | ".join(bundle.weight_files))
+
+        return {"ok": not missing, "path": str(snapshot), "missing": missing}
+
+    def _repo_dir(self, name: str) -> Path:
+        """Cache directory of a repository (models--org--name)."""
+        return self.hub_dir / ('models--' + self._bundle(name).repo_id.replace('/', '--'))
+
+    def export_bundle(self, names: List[str], archive_path: str) -> Path:
+        """Pack cached bundles into a tar archive for offline hosts.
+
+        Args:
+            names: Bundle names or repository ids
+            archive_path: Output .tar / .tar.gz path
+
+        Returns:
+            Path to the archive
+        """
+        archive = Path(archive_path)
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        mode = 'w:gz' if archive.suffix == '.gz' else 'w'
+
+        with tarfile.open(archive, mode) as tar:
+            for name in names:
+                repo_dir = self._repo_dir(name)
+                if not repo_dir.exists():
+                    raise FileNotFoundError(f"{name} is not cached in {self.hub_dir}; preload it first")
+                tar.add(repo_dir, arcname=f"hub/{repo_dir.name}")
+
+        logger.info(f"Model bundle written to {archive}")
+        return archive
+
+    def install_bundle(self, archive_path: str) -> None:
+        """Unpack a bundle created by :meth:`export_bundle` into the cache.
+
+        Args:
+            archive_path: Path to the bundle archive
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(archive_path, 'r:*') as tar:
+            for member in tar.getmembers():
+                if not member.name.startswith('hub/') or '..' in Path(member.name).parts:
+                    raise ValueError(f"Unexpected path in model bundle: {member.name}")
+            tar.extractall(self.cache_dir)
+        logger.info(f"Model bundle {archive_path} installed into {self.cache_dir}")
+
+
+def warmup(captioner, image_size: int = 384) -> float:
+    """Load a captioner and run one inference so requests never pay the cold start.
+
+    Args:
+        captioner: Object with ``generate_caption(image, ...)``
+        image_size: Side length of the dummy warmup image
+
+    Returns:
+        Warmup time in seconds
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    dummy = Image.new('RGB', (image_size, image_size), color=(127, 127, 127))
+    captioner.generate_caption(dummy, max_length=20, num_beams=1)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Warmed up {type(captioner).__name__} in {elapsed:.2f}s")
+    return elapsed
@@ -3,6 +3,7 @@ import numpy as np
 from typing import Optional, List, Tuple
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.preprocessing.text import Tokenizer
+from utils.caption_sequences import CaptionSequences
 from utils.logger import logger
 
 
@@ -44,7 +45,7 @@ def generate_caption_greedy(
     
     for _ in range(max_length):
         sequence = tokenizer.texts_to_sequences([in_text])[0]
-        sequence = pad_sequences([sequence], maxlen=max_length)
+        sequence = pad_sequences([sequence], maxlen=_prefix_width(model, [sequence], max_length))
         yhat = model.predict([photo, sequence], verbose=0)
         yhat_idx = np.argmax(yhat)
         word = word_for_id(yhat_idx, tokenizer)
@@ -106,7 +107,7 @@ def generate_caption_beam_search(
         # Batch predict for all active sequences
         if active_sequences:
             # Pad all sequences at once
-            padded = pad_sequences(active_sequences, maxlen=max_length)
+            padded = pad_sequences(active_sequences, maxlen=_prefix_width(model, active_sequences, max_length))
             
             # Batch predict - much faster than individual predictions
             photo_batch = np.repeat(photo, len(active_sequences), axis=0)
@@ -147,6 +148,231 @@ def generate_caption_beam_search(
     return ' '.join(caption_words)
 
 
+def _prefix_width(model, sequences: List[List[int]], max_length: int) -> int:
+    """Columns to pad decoding prefixes to.
+    
+    Models with a variable-length text input only need the longest current
+    prefix, so early steps run the LSTM over a few positions instead of
+    ``max_length``. Models saved with a fixed input length keep it.
+    """
+    try:
+        fixed = model.inputs[1].shape[1]
+    except (AttributeError, IndexError, TypeError):
+        fixed = None
+    if fixed:
+        return fixed
+    return min(max(len(seq) for seq in sequences), max_length)
+
+
+def _left_pad(sequences: List[List[int]], max_length: int) -> np.ndarray:
+    """Pad/truncate token sequences on the left, like pad_sequences."""
+    padded = np.zeros((len(sequences), max_length), dtype=np.int32)
+    for i, seq in enumerate(sequences):
+        seq = seq[-max_length:]
+        padded[i, max_length - len(seq):] = seq
+    return padded
+
+
+def generate_captions_greedy_batch(
+    model,
+    tokenizer: Tokenizer,
+    photos: np.ndarray,
+    max_length: int
+) -> List[str]:
+    """Greedy-decode captions for many images with one forward pass per step.
+    
+    Args:
+        model: Trained caption model
+        tokenizer: Fitted tokenizer
+        photos: Image features, shape (n, feature_dim)
+        max_length: Maximum caption length
+        
+    Returns:
+        Caption per image, same as generate_caption_greedy
+    """
+    index_word = {index: word for word, index in tokenizer.word_index.items()}
+    start_idx = tokenizer.word_index.get('startseq', 0)
+    sequences = [[start_idx] for _ in range(len(photos))]
+    active = list(range(len(photos)))
+    
+    for _ in range(max_length):
+        if not active:
+            break
+        
+        prefixes = [sequences[i] for i in active]
+        padded = _left_pad(prefixes, _prefix_width(model, prefixes, max_length))
+        preds = model.predict([photos[active], padded], verbose=0)
+        
+        still_active = []
+        for row, i in enumerate(active):
+            yhat_idx = int(np.argmax(preds[row]))
+            word = index_word.get(yhat_idx)
+            if word is None or word == 'endseq':
+                continue
+            sequences[i].append(yhat_idx)
+            still_active.append(i)
+        active = still_active
+    
+    return [' '.join(index_word[idx] for idx in seq[1:]) for seq in sequences]
+
+
+def generate_captions_beam_search_batch(
+    model,
+    tokenizer: Tokenizer,
+    photos: np.ndarray,
+    max_length: int,
+    beam_width: int = 3
+) -> List[str]:
+    """Beam search for many images, scoring all live beams in one forward pass per step.
+    
+    Args:
+        model: Trained caption model
+        tokenizer: Fitted tokenizer
+        photos: Image features, shape (n, feature_dim)
+        max_length: Maximum caption length
+        beam_width: Number of beams to keep per image
+        
+    Returns:
+        Caption per image, same as generate_caption_beam_search
+    """
+    start_seq = [tokenizer.word_index.get('startseq', 0)]
+    endseq_idx = tokenizer.word_index.get('endseq', 0)
+    index_word = {index: word for word, index in tokenizer.word_index.items()}
+    
+    # Per image: list of [sequence, score, finished]
+    beams = [[[start_seq, 0.0, False]] for _ in range(len(photos))]
+    done = [False] * len(photos)
+    
+    for _ in range(max_length):
+        # Flatten the live beams of every unfinished image into one batch
+        owners, live = [], []
+        for i, sequences in enumerate(beams):
+            if done[i]:
+                continue
+            for seq, score, finished in sequences:
+                if not (finished or seq[-1] == endseq_idx):
+                    owners.append(i)
+                    live.append((seq, score))
+        
+        if not live:
+            break
+        
+        prefixes = [seq for seq, _ in live]
+        padded = _left_pad(prefixes, _prefix_width(model, prefixes, max_length))
+        preds = model.predict([photos[owners], padded], verbose=0)
+        
+        candidates = {i: [] for i in set(owners)}
+        for i in candidates:
+            candidates[i] = [
+                [seq, score, True] for seq, score, finished in beams[i]
+                if finished or seq[-1] == endseq_idx
+            ]
+        for row, (i, (seq, score)) in enumerate(zip(owners, live)):
+            pred = preds[row]
+            for idx in np.argsort(pred)[-beam_width:]:
+                candidates[i].append([
+                    seq + [int(idx)],
+                    score - np.log(pred[idx] + 1e-10),
+                    idx == endseq_idx
+                ])
+        
+        for i, image_candidates in candidates.items():
+            beams[i] = sorted(image_candidates, key=lambda x: x[1])[:beam_width]
+            done[i] = all(finished for _, _, finished in beams[i])
+    
+    captions = []
+    for sequences in beams:
+        words = [index_word.get(idx) for idx in sequences[0][0]]
+        captions.append(' '.join(w for w in words if w and w not in ('startseq', 'endseq')))
+    return captions
+
+
+def generate_captions_incremental(
+    decoder,
+    tokenizer: Tokenizer,
+    photos: np.ndarray,
+    max_length: int,
+    beam_width: int = 1,
+    shortlist=None
+) -> List[str]:
+    """Greedy or beam search decoding with a sequence model's single-step decoder.
+    
+    Each step feeds only the newest token and the carried LSTM state of
+    every live beam of every image, in one batch. Beams are reordered by
+    gathering their states, so no prefix is ever re-run.
+    
+    With a shortlist, each step scores only the candidate words of each
+    image's shortlist instead of the whole vocabulary.
+    
+    Args:
+        decoder: ``model.IncrementalDecoder`` of a trained sequence model
+        tokenizer: Fitted tokenizer
+        photos: Image features, shape (n, feature_dim)
+        max_length: Maximum caption length
+        beam_width: Number of beams to keep per image (1 = greedy)
+        shortlist: Optional ``utils.shortlist.Shortlist`` fitted on the
+            model's training features
+        
+    Returns:
+        Caption per image, without start and end tokens
+    """
+    start_idx = tokenizer.word_index.get('startseq', 0)
+    endseq_idx = tokenizer.word_index.get('endseq', 0)
+    index_word = {index: word for word, index in tokenizer.word_index.items()}
+    n, k = len(photos), beam_width
+    
+    image = np.repeat(decoder.encode(photos), k, axis=0)
+    h, c = decoder.initial_state(n * k)
+    tokens = np.full(n * k, start_idx, dtype=np.int32)
+    
+    # Only the first beam is live until the first expansion
+    scores = np.full((n, k), np.inf)
+    scores[:, 0] = 0.0
+    finished = np.zeros((n, k), dtype=bool)
+    history = np.zeros((n, k, 0), dtype=np.int32)
+    rows = np.arange(n)[:, np.newaxis]
+    
+    # Column j of a step's probabilities is word words[i, j] of image i
+    clusters = shortlist.assign(photos) if shortlist is not None else None
+    words = shortlist.words[clusters] if shortlist is not None else None
+    
+    for _ in range(max_length):
+        if finished.all():
+            break
+        
+        if shortlist is None:
+            probs, h, c = decoder.step(image, tokens, h, c)
+        else:
+            hidden, h, c = decoder.step_hidden(image, tokens, h, c)
+            probs = shortlist.probabilities(hidden, np.repeat(clusters, k), *decoder.output_weights)
+        cost = -np.log(probs.reshape(n, k, -1) + 1e-10)
+        # Padding (index 0) is never generated; finished beams extend with it for free
+        cost[..., 0] = np.inf
+        cost[finished] = np.inf
+        cost[finished, 0] = 0.0
+        
+        total = (scores[..., np.newaxis] + cost).reshape(n, -1)
+        best = np.argsort(total, axis=1, kind='stable')[:, :k]
+        beam, word = np.divmod(best, cost.shape[-1])
+        if words is not None:
+            word = np.take_along_axis(words, word, axis=1)
+        
+        scores = np.take_along_axis(total, best, axis=1)
+        finished = finished[rows, beam] | (word == endseq_idx)
+        history = np.concatenate([history[rows, beam], word[..., np.newaxis]], axis=2)
+        
+        order = (rows * k + beam).ravel()
+        h, c = h[order], c[order]
+        tokens = word.ravel().astype(np.int32)
+    
+    best_beam = np.argmin(scores, axis=1)
+    captions = []
+    for i in range(n):
+        words = [index_word.get(int(idx)) for idx in history[i, best_beam[i]]]
+        captions.append(' '.join(w for w in words if w and w not in ('startseq', 'endseq')))
+    return captions
+
+
 def create_sequences(
     tokenizer: Tokenizer,
     max_length: int,
@@ -161,29 +387,13 @@ def create_sequences(
         max_length: Maximum sequence length
         descriptions: Dictionary of descriptions
         photos: Dictionary of photo features
-        vocab_size: Vocabulary size
+        vocab_size: Vocabulary size (unused; kept for call compatibility)
         
     Returns:
-        Tuple of (image_features, input_sequences, output_words)
+        Tuple of (image_features, input_sequences, output_words), the output
+        words as int32 indices for sparse categorical crossentropy
     """
-    from tensorflow.keras.utils import to_categorical
-    
-    X1, X2, y = [], [], []
-    
-    for key, desc_list in descriptions.items():
-        for desc in desc_list:
-            seq = tokenizer.texts_to_sequences([desc])[0]
-            
-            for i in range(1, len(seq)):
-                in_seq, out_seq = seq[:i], seq[i]
-                in_seq = pad_sequences([in_seq], maxlen=max_length)[0]
-                out_seq = to_categorical([out_seq], num_classes=vocab_size)[0]
-                
-                X1.append(photos[key][0])
-                X2.append(in_seq)
-                y.append(out_seq)
-    
-    return np.array(X1), np.array(X2), np.array(y)
+    return CaptionSequences(tokenizer, descriptions, max_length).arrays(photos)
 
 
 class CaptionGenerator:
@@ -195,7 +405,10 @@ class CaptionGenerator:
         tokenizer: Tokenizer,
         max_length: int,
         beam_width: int = 3,
-        use_beam_search: bool = True
+        use_beam_search: bool = True,
+        feature_codec=None,
+        precision: Optional[str] = None,
+        shortlist=None
     ):
         """Initialize caption generator.
         
@@ -205,12 +418,59 @@ class CaptionGenerator:
             max_length: Maximum caption length
             beam_width: Beam width for beam search
             use_beam_search: Whether to use beam search
+            feature_codec: Codec projecting raw CNN features into the model's
+                input space; loaded from the feature store when the model was
+                trained on reduced (e.g. PCA) features and none is given
+            precision: Dtype policy to decode in, e.g. 'mixed_bfloat16'
+                (default: model.precision; float32 keeps the model as loaded)
+            shortlist: Per-image candidate words for sequence-model decoding
+                (``utils.shortlist``); loaded from paths.shortlist_file when
+                inference.shortlist is set and none is given
         """
+        from utils.config import config
+        if precision is None:
+            precision = config.get('model.precision', 'float32')
+        # Mixed policies rebuild the model; float32 decodes it as it was saved
+        self.precision = None if precision == 'float32' else precision
+        if self.precision:
+            from model import with_precision
+            model = with_precision(model, self.precision)
+        
         self.model = model
         self.tokenizer = tokenizer
         self.max_length = max_length
         self.beam_width = beam_width
         self.use_beam_search = use_beam_search
+        self.feature_codec = feature_codec
+        if shortlist is None and config.get('inference.shortlist', False):
+            from utils.shortlist import load_shortlist
+            shortlist = load_shortlist()
+        self.shortlist = shortlist
+        self._decoder = None
+    
+    @property
+    def decoder(self):
+        """Single-step decoder when the model is a teacher-forcing sequence model, else None."""
+        if self._decoder is None and getattr(self.model, 'name', None) == 'sequence_caption_model':
+            from model import IncrementalDecoder
+            self._decoder = IncrementalDecoder(self.model, self.precision)
+        return self._decoder
+    
+    def _model_features(self, photo_features: np.ndarray) -> np.ndarray:
+        """Project raw features when the model expects a reduced dimension."""
+        try:
+            expected = self.model.inputs[0].shape[-1]
+        except (AttributeError, IndexError, TypeError):
+            return photo_features
+        
+        if not isinstance(expected, int) or photo_features.shape[-1] == expected:
+            return photo_features
+        
+        if self.feature_codec is None:
+            from utils.config import config
+            from utils.feature_store import load_codec
+            self.feature_codec = load_codec(config.get('paths.feature_store', 'features_store'))
+        return self.feature_codec.transform(photo_features)
     
     def generate(self, photo_features: np.ndarray) -> str:
         """Generate caption for image features.
@@ -222,6 +482,11 @@ class CaptionGenerator:
             Generated caption
         """
         try:
+            photo_features = self._model_features(photo_features)
+            
+            if self.decoder is not None:
+                return self.generate_batch(photo_features)[0]
+            
             if self.use_beam_search:
                 caption = generate_caption_beam_search(
                     self.model,
@@ -245,3 +510,47 @@ class CaptionGenerator:
         except Exception as e:
             logger.error(f"Error generating caption: {e}")
             return "Error generating caption"
+    
+    def generate_batch(self, photo_features: np.ndarray) -> List[str]:
+        """Generate captions for a batch of image features.
+        
+        Args:
+            photo_features: Extracted image features, shape (n, feature_dim)
+            
+        Returns:
+            Caption per image
+        """
+        try:
+            photo_features = self._model_features(np.asarray(photo_features))
+            
+            if self.decoder is not None:
+                return generate_captions_incremental(
+                    self.decoder,
+                    self.tokenizer,
+                    photo_features,
+                    self.max_length,
+                    self.beam_width if self.use_beam_search else 1,
+                    self.shortlist
+                )
+            
+            if self.use_beam_search:
+                captions = generate_captions_beam_search_batch(
+                    self.model,
+                    self.tokenizer,
+                    photo_features,
+                    self.max_length,
+                    self.beam_width
+                )
+            else:
+                captions = generate_captions_greedy_batch(
+                    self.model,
+                    self.tokenizer,
+                    photo_features,
+                    self.max_length
+                )
+            
+            return [c.replace('startseq', '').replace('endseq', '').strip() for c in captions]
+            
+        except Exception as e:
+            logger.error(f"Error generating captions: {e}")
+            return ["Error generating caption"] * len(photo_features)
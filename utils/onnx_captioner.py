@@ -0,0 +1,326 @@
+"""ONNX Runtime inference for exported BLIP and ViT-GPT2 caption models.
+
+Models are exported by ``scripts/export_onnx.py`` into a directory holding
+three graphs (encoder, decoder, decoder-with-past), the preprocessor and
+tokenizer files, and an ``onnx_config.json`` describing the special tokens.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from utils.logger import logger
+
+ENCODER_FILE = "encoder_model.onnx"
+DECODER_FILE = "decoder_model.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past_model.onnx"
+CONFIG_FILE = "onnx_config.json"
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    """Numerically stable log-softmax over the last axis."""
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def _banned_ngram_tokens(sequence: List[int], ngram_size: int) -> List[int]:
+    """Return tokens that would repeat an n-gram already in the sequence."""
+    if ngram_size <= 0 or len(sequence) + 1 < ngram_size:
+        return []
+
+    prefix = tuple(sequence[len(sequence) - ngram_size + 1:])
+    banned = []
+    for i in range(len(sequence) - ngram_size + 1):
+        if tuple(sequence[i:i + ngram_size - 1]) == prefix:
+            banned.append(sequence[i + ngram_size - 1])
+    return banned
+
+
+class OnnxCaptionModel:
+    """Encoder-decoder caption model running on ONNX Runtime (CPU)."""
+
+    def __init__(self, model_dir: str, num_threads: Optional[int] = None):
+        """Load the exported graphs.
+
+        Args:
+            model_dir: Directory produced by scripts/export_onnx.py
+            num_threads: Intra-op thread count (None = onnxruntime default)
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError(
+                "onnxruntime not installed. Run: pip install onnxruntime"
+            )
+
+        self.model_dir = Path(model_dir)
+        config_path = self.model_dir / CONFIG_FILE
+        if not config_path.exists():
+            raise FileNotFoundError(
+                f"ONNX export not found in {self.model_dir}. "
+                f"Run: python scripts/export_onnx.py --output {self.model_dir}"
+            )
+
+        with open(config_path, 'r') as f:
+            self.config = json.load(f)
+
+        self.num_layers = self.config["num_layers"]
+        self.decoder_start_token_id = self.config["decoder_start_token_id"]
+        self.eos_token_id = self.config["eos_token_id"]
+        self.pad_token_id = self.config.get("pad_token_id", self.eos_token_id)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        providers = ["CPUExecutionProvider"]
+        logger.info(f"Loading ONNX caption model from {self.model_dir}...")
+        self.encoder = ort.InferenceSession(
+            str(self.model_dir / ENCODER_FILE), options, providers=providers
+        )
+        self.decoder = ort.InferenceSession(
+            str(self.model_dir / DECODER_FILE), options, providers=providers
+        )
+        self.decoder_with_past = ort.InferenceSession(
+            str(self.model_dir / DECODER_WITH_PAST_FILE), options, providers=providers
+        )
+        self._past_names = [
+            f"past_key_values.{i}.{kind}"
+            for i in range(self.num_layers) for kind in ("key", "value")
+        ]
+        logger.info("ONNX caption model loaded successfully")
+
+    def encode(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Run the vision encoder.
+
+        Args:
+            pixel_values: Preprocessed images of shape (batch, 3, H, W)
+
+        Returns:
+            Encoder hidden states of shape (batch, tokens, hidden)
+        """
+        return self.encoder.run(
+            None, {"pixel_values": pixel_values.astype(np.float32)}
+        )[0]
+
+    def _decode_step(
+        self,
+        input_ids: np.ndarray,
+        encoder_hidden_states: np.ndarray,
+        past: Optional[List[np.ndarray]]
+    ):
+        """Run one decoder step and return (next-token logits, presents)."""
+        feeds = {
+            "input_ids": input_ids.astype(np.int64),
+            "encoder_hidden_states": encoder_hidden_states,
+        }
+        if past is None:
+            outputs = self.decoder.run(None, feeds)
+        else:
+            feeds.update(zip(self._past_names, past))
+            outputs = self.decoder_with_past.run(None, feeds)
+        return outputs[0][:, -1, :], outputs[1:]
+
+    def _process_logits(
+        self,
+        logits: np.ndarray,
+        sequences: List[List[int]],
+        min_length: int,
+        repetition_penalty: float,
+        no_repeat_ngram_size: int
+    ) -> np.ndarray:
+        """Apply the same logits processors transformers' generate() uses."""
+        logits = logits.astype(np.float32, copy=True)
+
+        for row, seq in enumerate(sequences):
+            if repetition_penalty != 1.0:
+                seen = np.unique(seq)
+                values = logits[row, seen]
+                logits[row, seen] = np.where(
+                    values < 0, values * repetition_penalty, values / repetition_penalty
+                )
+            for token in _banned_ngram_tokens(seq, no_repeat_ngram_size):
+                logits[row, token] = -np.inf
+
+        if len(sequences[0]) < min_length:
+            logits[:, self.eos_token_id] = -np.inf
+
+        return logits
+
+    def generate(
+        self,
+        pixel_values: np.ndarray,
+        max_length: int = 50,
+        min_length: int = 0,
+        num_beams: int = 1,
+        length_penalty: float = 1.0,
+        no_repeat_ngram_size: int = 0,
+        repetition_penalty: float = 1.0,
+        early_stopping: bool = True,
+        do_sample: bool = False,
+        top_k: int = 50,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        **kwargs
+    ) -> List[List[int]]:
+        """Generate token ids for a batch of images.
+
+        Accepts the subset of ``transformers`` generate() arguments used by
+        the captioners in this package; unknown arguments are ignored.
+
+        Args:
+            pixel_values: Preprocessed images of shape (batch, 3, H, W)
+            max_length: Maximum number of tokens including the start token
+            min_length: Minimum number of tokens before EOS is allowed
+            num_beams: Beam width (1 = greedy or sampling)
+            length_penalty: Exponent applied to the length in beam scoring
+            no_repeat_ngram_size: Forbid repeating n-grams of this size
+            repetition_penalty: Penalty for tokens already generated
+            early_stopping: Stop a beam search once enough hypotheses finish
+            do_sample: Sample instead of greedy decoding (num_beams == 1)
+            top_k: Top-k filtering for sampling
+            top_p: Nucleus filtering for sampling
+            temperature: Sampling temperature
+
+        Returns:
+            One list of token ids per image
+        """
+        encoder_states = self.encode(pixel_values)
+        results = []
+
+        for i in range(encoder_states.shape[0]):
+            states = encoder_states[i:i + 1]
+            processors = dict(
+                min_length=min_length,
+                repetition_penalty=repetition_penalty,
+                no_repeat_ngram_size=no_repeat_ngram_size
+            )
+            if num_beams > 1:
+                tokens = self._beam_search(
+                    states, max_length, num_beams, length_penalty, early_stopping, processors
+                )
+            else:
+                tokens = self._greedy_or_sample(
+                    states, max_length, do_sample, top_k, top_p, temperature, processors
+                )
+            results.append(tokens)
+
+        return results
+
+    def _greedy_or_sample(
+        self,
+        states: np.ndarray,
+        max_length: int,
+        do_sample: bool,
+        top_k: int,
+        top_p: float,
+        temperature: float,
+        processors: Dict
+    ) -> List[int]:
+        """Single-sequence decoding with the KV cache."""
+        sequence = [self.decoder_start_token_id]
+        past = None
+
+        while len(sequence) < max_length:
+            logits, past = self._decode_step(np.array([[sequence[-1]]]), states, past)
+            logits = self._process_logits(logits, [sequence], **processors)[0]
+
+            if do_sample:
+                logits = logits / max(temperature, 1e-5)
+                if 0 < top_k < logits.shape[-1]:
+                    kth = np.partition(logits, -top_k)[-top_k]
+                    logits[logits < kth] = -np.inf
+                probs = np.exp(_log_softmax(logits))
+                if top_p < 1.0:
+                    order = np.argsort(-probs)
+                    cumulative = np.cumsum(probs[order])
+                    cutoff = np.searchsorted(cumulative, top_p) + 1
+                    mask = np.zeros_like(probs, dtype=bool)
+                    mask[order[:cutoff]] = True
+                    probs = np.where(mask, probs, 0.0)
+                    probs /= probs.sum()
+                token = int(np.random.choice(len(probs), p=probs))
+            else:
+                token = int(np.argmax(logits))
+
+            sequence.append(token)
+            if token == self.eos_token_id:
+                break
+
+        return sequence
+
+    def _beam_search(
+        self,
+        states: np.ndarray,
+        max_length: int,
+        num_beams: int,
+        length_penalty: float,
+        early_stopping: bool,
+        processors: Dict
+    ) -> List[int]:
+        """Beam search with per-step reordering of the KV cache."""
+        states = np.repeat(states, num_beams, axis=0)
+        sequences = [[self.decoder_start_token_id] for _ in range(num_beams)]
+        # Only the first beam is live at step 0 so duplicates are not expanded
+        beam_scores = np.full(num_beams, -1e9, dtype=np.float32)
+        beam_scores[0] = 0.0
+        finished = []
+        past = None
+
+        while len(sequences[0]) < max_length:
+            last_tokens = np.array([[seq[-1]] for seq in sequences])
+            logits, past = self._decode_step(last_tokens, states, past)
+            logits = self._process_logits(logits, sequences, **processors)
+            scores = _log_softmax(logits) + beam_scores[:, None]
+
+            vocab_size = scores.shape[-1]
+            flat = scores.reshape(-1)
+            k = min(2 * num_beams, flat.size)
+            top = np.argpartition(-flat, k - 1)[:k]
+            top = top[np.argsort(-flat[top])]
+
+            next_sequences, next_scores, beam_indices = [], [], []
+            for rank, idx in enumerate(top):
+                beam, token = divmod(int(idx), vocab_size)
+                score = float(flat[idx])
+                if not np.isfinite(score):
+                    continue
+                if token == self.eos_token_id:
+                    if rank < num_beams:
+                        length = len(sequences[beam])
+                        finished.append((score / (length ** length_penalty), sequences[beam] + [token]))
+                    continue
+                next_sequences.append(sequences[beam] + [token])
+                next_scores.append(score)
+                beam_indices.append(beam)
+                if len(next_sequences) == num_beams:
+                    break
+
+            if not next_sequences:
+                break
+            if early_stopping and len(finished) >= num_beams:
+                break
+            if len(finished) >= num_beams:
+                best_live = max(next_scores) / (len(next_sequences[0]) ** length_penalty)
+                if best_live <= max(score for score, _ in finished):
+                    break
+
+            # Pad the beam set when EOS candidates consumed slots
+            while len(next_sequences) < num_beams:
+                next_sequences.append(next_sequences[-1])
+                next_scores.append(-1e9)
+                beam_indices.append(beam_indices[-1])
+
+            order = np.array(beam_indices)
+            past = [tensor[order] for tensor in past]
+            sequences = next_sequences
+            beam_scores = np.array(next_scores, dtype=np.float32)
+
+        if not finished:
+            finished = [
+                (score / (len(seq) ** length_penalty), seq)
+                for score, seq in zip(beam_scores, sequences)
+            ]
+
+        return max(finished, key=lambda item: item[0])[1]
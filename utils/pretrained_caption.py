@@ -1,6 +1,12 @@
 """Fast image captioning using lightweight model."""
+from utils.logger import logger
+from utils.model_store import configure_cache
+configure_cache()
+
 from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
+from transformers.modeling_outputs import BaseModelOutput
 from PIL import Image
+import time
 import torch
 
 class PretrainedCaptioner:
@@ -10,6 +16,7 @@ class PretrainedCaptioner:
     _processor = None
     _model = None
     _tokenizer = None
+    last_timings = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -37,6 +44,92 @@ class PretrainedCaptioner:
                 print(f"Error loading model: {e}")
                 raise
     
+    def _device(self):
+        """Device the model lives on."""
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    
+    def _encode(self, images, timings):
+        """Run the ViT processor and encoder once for a batch of images.
+        
+        Args:
+            images: List of PIL Images
+            timings: Dict that receives the preprocess/encode stage times
+            
+        Returns:
+            Encoder outputs that generate() can decode without re-encoding
+        """
+        start = time.perf_counter()
+        images = [image.convert("RGB") if image.mode != "RGB" else image for image in images]
+        pixel_values = self._processor(images=images, return_tensors="pt").pixel_values
+        pixel_values = pixel_values.to(self._device())
+        timings["preprocess"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        with torch.no_grad():
+            encoder_outputs = self._model.encoder(pixel_values=pixel_values, return_dict=True)
+        timings["encode"] = time.perf_counter() - start
+        
+        return BaseModelOutput(last_hidden_state=encoder_outputs.last_hidden_state)
+    
+    def _decode(self, encoder_outputs, timings, **generate_kwargs):
+        """Decode token sequences from shared encoder states.
+        
+        Returns:
+            List of decoded caption strings
+        """
+        start = time.perf_counter()
+        with torch.no_grad():
+            output_ids = self._model.generate(
+                encoder_outputs=encoder_outputs,
+                **generate_kwargs
+            )
+        timings["decode"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        captions = [
+            caption.strip()
+            for caption in self._tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+        ]
+        timings["postprocess"] = time.perf_counter() - start
+        return captions
+    
+    def _report(self, timings, num_images):
+        """Store per-stage timings of the last call and log them at debug level."""
+        timings["total"] = sum(timings.values())
+        timings["images"] = num_images
+        self.last_timings = timings
+        stages = ", ".join(
+            f"{stage}={timings[stage] * 1000:.0f}ms"
+            for stage in ("preprocess", "encode", "decode", "postprocess")
+            if stage in timings
+        )
+        logger.debug(f"Captioned {num_images} image(s) in {timings['total']:.2f}s ({stages})")
+    
+    def generate_captions(self, images, max_length=50, num_beams=3, return_timings=False):
+        """Generate one caption per image in a single batched pass.
+        
+        Args:
+            images: List of PIL Images
+            max_length: Maximum caption length
+            num_beams: Number of beams for beam search
+            return_timings: Also return the per-stage timings
+            
+        Returns:
+            List of captions (and a timings dict if return_timings)
+        """
+        timings = {}
+        encoder_outputs = self._encode(list(images), timings)
+        captions = self._decode(
+            encoder_outputs,
+            timings,
+            max_length=max_length,
+            num_beams=num_beams,
+            early_stopping=True
+        )
+        self._report(timings, len(captions))
+        
+        return (captions, timings) if return_timings else captions
+    
     def generate_caption(self, image, max_length=50, num_beams=3):
         """Generate caption for an image.
         
@@ -49,68 +142,61 @@ class PretrainedCaptioner:
             Generated caption string
         """
         try:
-            # Prepare image
-            pixel_values = self._processor(images=image, return_tensors="pt").pixel_values
-            
-            # Move to GPU if available
-            if torch.cuda.is_available():
-                pixel_values = pixel_values.to("cuda")
-            
-            # Generate caption
-            with torch.no_grad():
-                output_ids = self._model.generate(
-                    pixel_values,
-                    max_length=max_length,
-                    num_beams=num_beams,
-                    early_stopping=True
-                )
-            
-            # Decode caption
-            caption = self._tokenizer.decode(output_ids[0], skip_special_tokens=True)
-            
-            return caption
+            return self.generate_captions([image], max_length=max_length, num_beams=num_beams)[0]
         except Exception as e:
             print(f"Error generating caption: {e}")
             return "Error generating caption"
     
-    def generate_multiple_captions(self, image, num_captions=3, max_length=50):
-        """Generate multiple diverse captions.
+    def generate_multiple_captions(
+        self,
+        images,
+        num_captions=3,
+        max_length=50,
+        temperature=0.7,
+        return_timings=False
+    ):
+        """Generate multiple diverse captions per image.
+        
+        Each image is encoded once; all variants are sampled in one decoder
+        batch from the shared encoder states.
         
         Args:
-            image: PIL Image
-            num_captions: Number of captions to generate
+            images: PIL Image or list of PIL Images
+            num_captions: Number of captions to generate per image
             max_length: Maximum caption length
+            temperature: Sampling temperature
+            return_timings: Also return the per-stage timings
             
         Returns:
-            List of generated captions
+            List of captions for a single image, or one list per image
+            (and a timings dict if return_timings)
         """
+        single = isinstance(images, Image.Image)
+        batch = [images] if single else list(images)
+        
+        timings = {}
         try:
-            # Prepare image
-            pixel_values = self._processor(images=image, return_tensors="pt").pixel_values
-            
-            # Move to GPU if available
-            if torch.cuda.is_available():
-                pixel_values = pixel_values.to("cuda")
+            encoder_outputs = self._encode(batch, timings)
+            flat = self._decode(
+                encoder_outputs,
+                timings,
+                max_length=max_length,
+                num_beams=1,
+                do_sample=True,
+                top_k=50,
+                temperature=temperature,
+                num_return_sequences=num_captions
+            )
+            self._report(timings, len(batch))
             
-            # Generate multiple captions
-            with torch.no_grad():
-                output_ids = self._model.generate(
-                    pixel_values,
-                    max_length=max_length,
-                    num_beams=num_captions * 2,
-                    num_return_sequences=num_captions,
-                    early_stopping=True,
-                    do_sample=True,
-                    temperature=0.7
-                )
-            
-            # Decode captions
-            captions = [
-                self._tokenizer.decode(output_id, skip_special_tokens=True)
-                for output_id in output_ids
+            grouped = [
+                flat[i * num_captions:(i + 1) * num_captions]
+                for i in range(len(batch))
             ]
-            
-            return captions
+            captions = grouped[0] if single else grouped
+            return (captions, timings) if return_timings else captions
         except Exception as e:
             print(f"Error generating captions: {e}")
-            return ["Error generating caption"]
+            error = ["Error generating caption"]
+            captions = error if single else [list(error) for _ in batch]
+            return (captions, timings) if return_timings else captions
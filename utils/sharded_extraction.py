@@ -0,0 +1,246 @@
+"""Multi-process sharded feature extraction.
+
+One TensorFlow process running the CNN backbone stops scaling well long before a
+many-core box runs out of cores. ``ShardedExtractor`` splits the image list
+into N shards and runs N worker processes instead. Each worker has its own
+model, an intra-op thread budget of ``cores // N`` and, on Linux, its own
+set of cores. Every shard is written to disk as it finishes and the shards
+are merged into one features mapping.
+
+It has the same ``extract(items)`` interface as ``FeaturePipeline``, so it
+can be passed to ``update_feature_store``.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import logger
+
+
+def default_model():
+    """Feature model of the configured backbone, built inside the worker process."""
+    from utils.image_utils import FeatureExtractor
+    return FeatureExtractor()._model
+
+
+def shard_items(items: List[Tuple[str, str]], num_shards: int) -> List[List[Tuple[str, str]]]:
+    """Split items round-robin so every shard gets a similar mix of image sizes."""
+    return [items[i::num_shards] for i in range(num_shards) if items[i::num_shards]]
+
+
+def _available_cores() -> List[int]:
+    """CPU ids this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _extract_shard(
+    shard_index: int,
+    items: List[Tuple[str, str]],
+    output_path: str,
+    threads: int,
+    cores: Optional[List[int]],
+    model_factory: Callable,
+    batch_size: int,
+    decode_workers: int,
+    target_size: Tuple[int, int],
+    fast_decode: bool,
+    backbone: Optional[str]
+) -> Dict[str, float]:
+    """Worker process: extract one shard and save it as .npz."""
+    # Thread budgets must be set before TensorFlow initialises its runtime
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from utils.backbones import get_backbone
+    from utils.config import config
+    from utils.feature_pipeline import FeaturePipeline
+
+    # A spawned worker re-reads config.yaml; keep the parent's backbone choice
+    if backbone:
+        config.set('model.backbone', backbone)
+
+    start = time.perf_counter()
+    pipeline = FeaturePipeline(
+        model=model_factory(),
+        batch_size=batch_size,
+        num_workers=decode_workers,
+        target_size=target_size,
+        fast_decode=fast_decode,
+        backbone=get_backbone()
+    )
+    load_seconds = time.perf_counter() - start
+    features = pipeline.extract(items, progress=False)
+
+    ids = list(features)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            ids=np.array(ids),
+            features=np.concatenate([features[i] for i in ids]) if ids else np.zeros((0, 0), np.float32)
+        )
+    os.replace(tmp_path, output_path)
+
+    return {"shard": shard_index, "model_load_seconds": load_seconds, **pipeline.stats}
+
+
+class ShardedExtractor:
+    """Run feature extraction in N worker processes and merge the shards."""
+
+    def __init__(
+        self,
+        num_processes: int = 2,
+        threads_per_process: Optional[int] = None,
+        pin_cores: bool = True,
+        model_factory: Callable = default_model,
+        batch_size: int = 32,
+        decode_workers: int = 2,
+        target_size: Tuple[int, int] = (224, 224),
+        fast_decode: bool = False,
+        shard_dir: Optional[str] = None,
+        backbone: Optional[str] = None
+    ):
+        """Initialize sharded extractor.
+
+        Args:
+            num_processes: Worker processes (one shard each)
+            threads_per_process: Intra-op threads per worker
+                (defaults to available cores // num_processes)
+            pin_cores: Give each worker its own CPU cores (Linux only)
+            model_factory: Picklable function building the feature model
+                inside a worker
+            batch_size: Images per forward pass in each worker
+            decode_workers: Decode threads in each worker
+            target_size: Model input size
+            fast_decode: Use the JPEG draft decode path in each worker
+            shard_dir: Where shard files are written (default: temp directory)
+            backbone: Backbone name used by the workers (default: model.backbone)
+        """
+        self.num_processes = max(1, num_processes)
+        cores = _available_cores()
+        self.threads_per_process = threads_per_process or max(1, len(cores) // self.num_processes)
+        self.core_sets = None
+        if pin_cores and len(cores) >= self.num_processes:
+            per_worker = len(cores) // self.num_processes
+            self.core_sets = [
+                cores[i * per_worker:(i + 1) * per_worker] for i in range(self.num_processes)
+            ]
+        self.model_factory = model_factory
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.target_size = target_size
+        self.fast_decode = fast_decode
+        self.shard_dir = shard_dir
+        self.backbone = backbone
+        self.stats = {}
+
+    def extract(self, items: List[Tuple[str, str]], progress: bool = True) -> Dict[str, np.ndarray]:
+        """Extract features for (image_id, path) items across worker processes.
+
+        Args:
+            items: Iterable of (image_id, path)
+            progress: Log each shard as it finishes
+
+        Returns:
+            Dictionary mapping image ID to a (1, feature_dim) float32 array
+        """
+        items = list(items)
+        shards = shard_items(items, self.num_processes)
+        start = time.perf_counter()
+
+        with TemporaryDirectory(dir=self.shard_dir) as tmp:
+            outputs = [str(Path(tmp) / f'shard_{i:03d}.npz') for i in range(len(shards))]
+            shard_stats = []
+
+            # spawn, not fork: each worker needs a fresh TensorFlow runtime
+            with ProcessPoolExecutor(max_workers=len(shards), mp_context=get_context('spawn')) as pool:
+                futures = [
+                    pool.submit(
+                        _extract_shard, i, shard, outputs[i], self.threads_per_process,
+                        self.core_sets[i] if self.core_sets else None, self.model_factory,
+                        self.batch_size, self.decode_workers, self.target_size, self.fast_decode,
+                        self.backbone
+                    )
+                    for i, shard in enumerate(shards)
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    shard_stats.append(result)
+                    if progress:
+                        logger.info(
+                            f"Shard {result['shard']}: {result['images']} images at "
+                            f"{result['images_per_second']:.1f} images/s"
+                        )
+
+            features = {}
+            for output in outputs:
+                with np.load(output) as shard:
+                    for image_id, row in zip(shard['ids'], shard['features']):
+                        features[str(image_id)] = row[np.newaxis]
+
+        elapsed = time.perf_counter() - start
+        # Shards extract in parallel: the slowest one bounds extraction time,
+        # which excludes process spawn and model loading
+        extraction = max((shard["seconds"] for shard in shard_stats), default=0.0)
+        self.stats = {
+            "images": len(features),
+            "failed": len(items) - len(features),
+            "seconds": elapsed,
+            "images_per_second": len(features) / elapsed if elapsed > 0 else 0.0,
+            "extraction_seconds": extraction,
+            "extraction_images_per_second": len(features) / extraction if extraction > 0 else 0.0,
+            "model_load_seconds": max((shard["model_load_seconds"] for shard in shard_stats), default=0.0),
+            "processes": len(shards),
+            "threads_per_process": self.threads_per_process,
+            "shards": sorted(shard_stats, key=lambda s: s["shard"]),
+        }
+        logger.info(
+            f"Extracted {len(features)} images with {len(shards)} processes x "
+            f"{self.threads_per_process} threads in {elapsed:.1f}s "
+            f"({self.stats['images_per_second']:.1f} images/s; "
+            f"{self.stats['extraction_images_per_second']:.1f} images/s excluding model loading)"
+        )
+        return features
+
+
+def scaling_report(results: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """Add speedup and parallel efficiency relative to the smallest worker count.
+
+    Wall-clock throughput includes process spawn and model loading, which
+    weigh more as the process count grows. When rows also carry
+    ``extraction_images_per_second``, extraction-only speedup and efficiency
+    are reported alongside.
+
+    Args:
+        results: Rows with ``processes`` and ``images_per_second`` (and
+            optionally ``extraction_images_per_second``)
+
+    Returns:
+        Rows with ``speedup`` and ``efficiency`` (and ``extraction_speedup``
+        and ``extraction_efficiency``) added
+    """
+    results = sorted(results, key=lambda r: r["processes"])
+    base = results[0]
+    prefixes = [""] + (["extraction_"] if all("extraction_images_per_second" in r for r in results) else [])
+    for prefix in prefixes:
+        throughput = f"{prefix}images_per_second"
+        per_process = base[throughput] / base["processes"]
+        for row in results:
+            row[f"{prefix}speedup"] = row[throughput] / base[throughput]
+            row[f"{prefix}efficiency"] = row[throughput] / (per_process * row["processes"])
+    return results
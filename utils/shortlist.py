@@ -0,0 +1,201 @@
+"""Per-image candidate vocabularies for shortlist decoding.
+
+With a 10k-word vocabulary most of a decoding step is the output layer:
+every step projects the LSTM output onto every word and normalizes over
+all of them. Only a few hundred of those words are plausible for any one
+image, though.
+
+``Shortlist.fit`` clusters the training image features (k-means) and counts
+which words the captions of each cluster use. An image's shortlist is the
+M words of its nearest cluster: the corpus-wide most frequent words (so
+function words and ``endseq`` are always there), then the cluster's own
+words by co-occurrence count, then, if the cluster's vocabulary is
+exhausted, the globally most frequent remaining words. At decode time only
+these M logits are computed and normalized (``probabilities``), so the
+softmax is over the shortlist and not the vocabulary.
+
+Column 0 of every shortlist is the padding index, which is never
+generated. It keeps the beam search's "finished beams extend with
+padding" convention (``generate_captions_incremental``) unchanged.
+"""
+import os
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+
+from utils.config import config
+from utils.logger import logger
+
+
+class Shortlist:
+    """Nearest-cluster candidate words for image features."""
+
+    def __init__(self, centroids: np.ndarray, words: np.ndarray):
+        """Wrap fitted arrays.
+
+        Args:
+            centroids: Cluster centres, shape (clusters, feature_dim)
+            words: Candidate word ids per cluster, shape (clusters, size);
+                column 0 is the padding index
+        """
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.words = np.asarray(words, dtype=np.int32)
+        self._kernel = None
+        self._slices: Dict[int, tuple] = {}
+
+    @property
+    def size(self) -> int:
+        """Candidate words per image, including the padding column."""
+        return self.words.shape[1]
+
+    @classmethod
+    def fit(
+        cls,
+        descriptions: Mapping[str, List[str]],
+        photos: Mapping,
+        tokenizer,
+        size: int = 500,
+        clusters: int = 64,
+        common: int = 50,
+        iterations: int = 10,
+        seed: int = 0
+    ) -> 'Shortlist':
+        """Cluster training images and rank each cluster's words.
+
+        Args:
+            descriptions: Image id -> captions (with start/end tokens)
+            photos: Image id -> features, shape (1, feature_dim), as the
+                caption model sees them
+            tokenizer: Fitted tokenizer (ids ordered by frequency)
+            size: Candidate words per image, including the padding column
+            clusters: Number of k-means clusters
+            common: Most frequent words every shortlist contains
+            iterations: k-means iterations
+            seed: Random seed for the initial centroids
+
+        Returns:
+            Fitted shortlist
+        """
+        ids = [image_id for image_id in descriptions if image_id in photos]
+        features = np.concatenate([np.asarray(photos[image_id], dtype=np.float32) for image_id in ids])
+        centroids = _kmeans(features, min(clusters, len(ids)), iterations, seed)
+        assigned = _nearest(features, centroids)
+
+        vocab_size = len(tokenizer.word_index) + 1
+        counts = np.zeros((len(centroids), vocab_size), dtype=np.float64)
+        for cluster, image_id in zip(assigned, ids):
+            for sequence in tokenizer.texts_to_sequences(descriptions[image_id]):
+                np.add.at(counts[cluster], sequence, 1)
+
+        # Ties (notably words a cluster never uses) go to the globally frequent word
+        totals = counts.sum(axis=0)
+        scores = counts + totals / (totals.max() + 1)
+        scores[:, np.argsort(-totals, kind='stable')[:common]] = np.inf
+        scores[:, 0] = -np.inf
+        start_idx = tokenizer.word_index.get('startseq')
+        if start_idx is not None:
+            scores[:, start_idx] = -np.inf
+
+        # Every word but padding and startseq, plus the padding column
+        size = min(size, vocab_size - (start_idx is not None))
+        ranked = np.argsort(-scores, axis=1, kind='stable')[:, :size - 1]
+        words = np.concatenate([np.zeros((len(centroids), 1), dtype=np.int32), ranked], axis=1)
+        logger.info(f"Shortlist: {size} of {vocab_size} words per image, {len(centroids)} clusters")
+        return cls(centroids, words)
+
+    def assign(self, features: np.ndarray) -> np.ndarray:
+        """Nearest cluster per image, shape (n,)."""
+        return _nearest(np.asarray(features, dtype=np.float32).reshape(-1, self.centroids.shape[1]), self.centroids)
+
+    def candidates(self, features: np.ndarray) -> np.ndarray:
+        """Candidate word ids per image, shape (n, size)."""
+        return self.words[self.assign(features)]
+
+    def coverage(self, descriptions: Mapping[str, List[str]], photos: Mapping, tokenizer) -> float:
+        """Share of reference caption tokens in their image's shortlist.
+
+        Generated words are limited to the shortlist, so this bounds how much
+        of the reference captions decoding can reproduce.
+        """
+        start_idx = tokenizer.word_index.get('startseq')
+        covered = total = 0
+        for image_id, captions in descriptions.items():
+            if image_id not in photos:
+                continue
+            allowed = set(self.candidates(photos[image_id])[0].tolist())
+            for sequence in tokenizer.texts_to_sequences(captions):
+                tokens = [idx for idx in sequence if idx != start_idx]
+                covered += sum(idx in allowed for idx in tokens)
+                total += len(tokens)
+        return covered / max(total, 1)
+
+    def probabilities(
+        self,
+        hidden: np.ndarray,
+        clusters: np.ndarray,
+        kernel: np.ndarray,
+        bias: np.ndarray
+    ) -> np.ndarray:
+        """Softmax over each row's candidate words only.
+
+        Args:
+            hidden: Output layer inputs, shape (n, units)
+            clusters: Cluster of each row's image, shape (n,)
+            kernel: Output layer kernel, shape (units, vocab_size)
+            bias: Output layer bias, shape (vocab_size,)
+
+        Returns:
+            Probabilities over ``words[clusters]``, shape (n, size); the
+            padding column is 0
+        """
+        if kernel is not self._kernel:
+            self._kernel, self._slices = kernel, {}
+        logits = np.empty((len(hidden), self.size), dtype=np.float32)
+        for cluster in np.unique(clusters):
+            rows = np.flatnonzero(clusters == cluster)
+            if cluster not in self._slices:
+                words = self.words[cluster]
+                self._slices[cluster] = (np.ascontiguousarray(kernel[:, words]), bias[words])
+            weights, offsets = self._slices[cluster]
+            logits[rows] = hidden[rows] @ weights + offsets
+        logits[:, 0] = -np.inf
+
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write the shortlist to ``paths.shortlist_file``."""
+        path = path or config.get('paths.shortlist_file', 'shortlist.npz')
+        np.savez(path, centroids=self.centroids, words=self.words)
+        logger.info(f"Shortlist saved to {path}")
+
+
+def load_shortlist(path: Optional[str] = None) -> Optional[Shortlist]:
+    """The saved shortlist (None if it was never built)."""
+    path = path or config.get('paths.shortlist_file', 'shortlist.npz')
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        return Shortlist(saved['centroids'], saved['words'])
+
+
+def _nearest(features: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for each row."""
+    distances = (centroids ** 2).sum(axis=1) - 2 * features @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def _kmeans(features: np.ndarray, clusters: int, iterations: int, seed: int) -> np.ndarray:
+    """Lloyd's k-means centroids; empty clusters keep their previous centre."""
+    rng = np.random.default_rng(seed)
+    centroids = features[rng.choice(len(features), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assigned = _nearest(features, centroids)
+        members = np.zeros((clusters, len(features)), dtype=np.float32)
+        members[assigned, np.arange(len(features))] = 1.0
+        sums = members @ features
+        sizes = members.sum(axis=1)
+        filled = sizes > 0
+        centroids[filled] = sums[filled] / sizes[filled, np.newaxis]
+    return centroids
@@ -0,0 +1,201 @@
+"""Resumable training state in the TF checkpoint format.
+
+``get_callbacks`` exports the best model as a full ``.h5`` file, which is
+what decoding needs but is slow to write and not enough to resume from: it
+has no optimizer slots, learning rate, epoch or input position.
+``TrainingCheckpoint`` is a callback that saves the whole training state
+with ``tf.train.Checkpoint``:
+
+- model weights and BatchNormalization statistics;
+- optimizer slots, iteration count and learning rate (including
+  ``ReduceLROnPlateau`` changes);
+- the dropout seed generators;
+- the epoch, the number of batches consumed from the training input, and
+  the input's shuffle seed.
+
+It saves every ``save_steps`` batches and at the end of every epoch. Saves
+are asynchronous: variables are copied to host memory and written to disk
+on a background thread while training continues.
+
+Resuming to the exact batch needs a training input that is the same
+stream of batches on every run. ``make_training_input(seed=...)`` builds
+it: the input repeats, its shuffle is seeded, and it starts ``skip``
+batches in. ``fit_resumable`` restarts ``fit`` at the saved epoch. If the
+run stopped mid-epoch, it first finishes that epoch from the next unseen
+batch.
+"""
+import itertools
+from typing import Callable, Dict, List, Optional
+
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+from utils.logger import logger
+
+
+class TrainingCheckpoint(Callback):
+    """Periodic asynchronous checkpoints of the full training state."""
+
+    def __init__(
+        self,
+        directory: str,
+        save_steps: int = 500,
+        max_to_keep: int = 3,
+        seed: int = 0,
+        async_save: bool = True
+    ):
+        """Configure checkpointing.
+
+        Args:
+            directory: Checkpoint directory
+            save_steps: Also save every N training batches (0 = at epoch ends only)
+            max_to_keep: Checkpoints kept on disk
+            seed: Shuffle seed of the training input, saved with the state
+            async_save: Write checkpoints on a background thread
+        """
+        super().__init__()
+        self.directory = str(directory)
+        self.save_steps = save_steps
+        self.max_to_keep = max_to_keep
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.position = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.seed = tf.Variable(seed, dtype=tf.int64, trainable=False)
+        self.options = tf.train.CheckpointOptions(experimental_enable_async_checkpoint=async_save)
+        self._checkpoint = None
+        self._manager = None
+        self._tracked_model = None
+        self._saved_position = None
+        self._batches = 0
+
+    def _state(self, model) -> tf.train.Checkpoint:
+        """Checkpoint object tracking ``model``, its optimizer and the run counters."""
+        if self._tracked_model is not model:
+            # Slots must exist before a restore can fill them
+            if not model.optimizer.built:
+                model.optimizer.build(model.trainable_variables)
+            # The backing tf.Variables, in model order. Keras variables fail
+            # async saves after the first (each copy to the CPU creates a new
+            # tf.Variable), and their paths depend on earlier-built models.
+            self._checkpoint = tf.train.Checkpoint(
+                model=[v.value for v in model.variables],
+                optimizer=[v.value for v in model.optimizer.variables],
+                epoch=self.epoch,
+                position=self.position,
+                seed=self.seed
+            )
+            self._manager = tf.train.CheckpointManager(self._checkpoint, self.directory, self.max_to_keep)
+            self._tracked_model = model
+        return self._checkpoint
+
+    def restore(self, model) -> bool:
+        """Load the latest checkpoint into ``model`` and the run counters.
+
+        Args:
+            model: The model (compiled, same architecture) that will be trained
+
+        Returns:
+            True if a checkpoint was found and restored
+        """
+        self._state(model)
+        path = self._manager.latest_checkpoint
+        if path is None:
+            return False
+        self._checkpoint.restore(path).assert_existing_objects_matched()
+        logger.info(
+            f"Restored {path}: epoch {int(self.epoch) + 1}, {int(self.position)} batches consumed, "
+            f"optimizer step {int(model.optimizer.iterations)}"
+        )
+        return True
+
+    def save(self) -> Optional[str]:
+        """Start a checkpoint of the current state; returns its path (None if already saved)."""
+        position = int(self.position)
+        if position == self._saved_position:
+            return None
+        self._saved_position = position
+        return self._manager.save(checkpoint_number=position, options=self.options)
+
+    def sync(self) -> None:
+        """Wait for pending asynchronous saves."""
+        if self._checkpoint is not None:
+            self._checkpoint.sync()
+
+    def set_model(self, model):
+        super().set_model(model)
+        self._state(model)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch.assign(epoch)
+        self._batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.position.assign_add(1)
+        self._batches += 1
+        if self.save_steps and int(self.position) % self.save_steps == 0:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # An epoch cut short (stop_training mid-epoch) is resumed, not skipped
+        if self._batches >= self.params.get('steps', 0):
+            self.epoch.assign(epoch + 1)
+        self.save()
+
+    def on_train_end(self, logs=None):
+        self.sync()
+
+
+def skip_batches(data, count: int):
+    """The training input without its first ``count`` batches."""
+    if not count:
+        return data
+    if isinstance(data, tf.data.Dataset):
+        return data.skip(count)
+    return (batch for batch in itertools.islice(data, count, None))
+
+
+def fit_resumable(
+    model,
+    make_input: Callable[[int], object],
+    epochs: int,
+    steps_per_epoch: int,
+    state: TrainingCheckpoint,
+    **fit_kwargs
+) -> Dict[str, List[float]]:
+    """``model.fit`` from the epoch and batch a (restored) checkpoint is at.
+
+    Args:
+        model: Model to train, restored through ``state`` when resuming
+        make_input: Returns the repeating, seeded training input starting
+            after the given number of consumed batches
+        epochs: Total epochs of the run
+        steps_per_epoch: Batches per epoch
+        state: The run's ``TrainingCheckpoint`` (also passed in callbacks)
+        **fit_kwargs: Further ``fit`` arguments (callbacks, validation, ...)
+
+    Returns:
+        Training history over the epochs run by this call
+    """
+    epoch = int(state.epoch)
+    done = int(state.position) - epoch * steps_per_epoch
+    if not 0 <= done < steps_per_epoch:
+        # Saved under a different steps_per_epoch: continue at the next epoch boundary
+        done = 0
+
+    history: Dict[str, List[float]] = {}
+    while epoch < epochs:
+        last = epoch + 1 if done else epochs
+        if done:
+            logger.info(f"Resuming epoch {epoch + 1} at batch {done + 1} of {steps_per_epoch}")
+        result = model.fit(
+            make_input(int(state.position)),
+            initial_epoch=epoch,
+            epochs=last,
+            steps_per_epoch=steps_per_epoch - done,
+            **fit_kwargs
+        )
+        for key, values in result.history.items():
+            history.setdefault(key, []).extend(values)
+        if model.stop_training:
+            break
+        epoch, done = last, 0
+    return history
@@ -0,0 +1,190 @@
+"""Training throughput profiling.
+
+``ThroughputProfiler`` is a Keras callback that records, per epoch:
+
+- samples/s over the training steps (validation excluded);
+- step latency percentiles;
+- how much of each step was spent waiting for the next batch from the
+  input pipeline (tf.data or the Python generator) and how much computing;
+- the process's peak resident set size (Unix, or with psutil installed).
+
+It writes the records as JSON next to the checkpoints, and can run the
+TF profiler (viewable in TensorBoard's Profile tab) over a window of steps.
+
+Keras fetches the next batch inside its compiled train function, so from a
+callback a step's input wait and compute are one number. To separate them
+the profiler wraps ``model.train_function`` for the duration of ``fit``:
+the batch is pulled from the epoch's iterator in Python (that is the input
+wait) and handed to Keras's own compiled step as a one-batch iterable
+(that is the compute). With ``steps_per_execution`` > 1 this runs one step
+per call.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+from utils.logger import logger
+
+PERCENTILES = (50, 90, 99)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None if unavailable.
+
+    ``resource`` is Unix-only (Linux reports KB); elsewhere psutil is used
+    when installed (peak working set on Windows, else the current RSS).
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def step_summary(wait: Sequence[float], compute: Sequence[float], samples: Sequence[int]) -> Dict:
+    """Throughput and latency statistics for a run of training steps.
+
+    Args:
+        wait: Seconds each step waited for its batch
+        compute: Seconds each step computed
+        samples: Samples in each step's batch
+
+    Returns:
+        Dictionary of JSON-serialisable statistics (times in ms)
+    """
+    wait, compute = np.asarray(wait), np.asarray(compute)
+    latency = (wait + compute) * 1000
+    seconds = float(latency.sum()) / 1000
+    return {
+        "steps": len(latency),
+        "samples": int(np.sum(samples)),
+        "seconds": seconds,
+        "samples_per_second": float(np.sum(samples)) / seconds if seconds else 0.0,
+        "step_ms": {
+            "mean": float(latency.mean()),
+            **{f"p{q}": float(np.percentile(latency, q)) for q in PERCENTILES},
+            "max": float(latency.max()),
+        },
+        "input_wait_ms": float(wait.mean() * 1000),
+        "compute_ms": float(compute.mean() * 1000),
+        "input_wait_fraction": float(wait.sum()) / seconds if seconds else 0.0,
+    }
+
+
+class ThroughputProfiler(Callback):
+    """Records samples/s, step latency, input wait and peak RSS per epoch."""
+
+    def __init__(
+        self,
+        output_path: str,
+        profile_steps: Optional[Sequence[int]] = None,
+        profile_dir: str = 'logs/profile'
+    ):
+        """Configure the profiler.
+
+        Args:
+            output_path: JSON summary file, rewritten after every epoch
+            profile_steps: Optional [first, last] training steps (counted
+                from the start of ``fit``, 1-based) to trace with the TF
+                profiler
+            profile_dir: Directory for the TF profiler trace
+        """
+        super().__init__()
+        self.output_path = Path(output_path)
+        self.profile_steps = tuple(profile_steps) if profile_steps else None
+        self.profile_dir = profile_dir
+        self.epochs: List[Dict] = []
+        self._run: Dict[str, List] = {"wait": [], "compute": [], "samples": []}
+        self._epoch: Dict[str, List] = {}
+        self._step = 0
+        self._tracing = False
+        self._train_function = None
+
+    def on_train_begin(self, logs=None):
+        # Records accumulate over fit calls (a resumed epoch, then the rest of the run)
+        self._step = 0
+        self._train_function = self.model.train_function
+        self.model.train_function = self._timed_train_function
+
+    def _timed_train_function(self, iterator):
+        """Fetch one batch (input wait), then run Keras's compiled step on it (compute)."""
+        self._maybe_start_trace()
+        start = time.perf_counter()
+        data = next(iterator)
+        fetched = time.perf_counter()
+        logs = self._train_function([data])
+        # Outputs are computed eagerly, so the step has finished here
+        done = time.perf_counter()
+
+        self._step += 1
+        samples = int(tf.nest.flatten(data)[0].shape[0])
+        # The first step traces the train function; it is not a throughput sample
+        if self._step > 1:
+            for key, value in (("wait", fetched - start), ("compute", done - fetched), ("samples", samples)):
+                self._epoch[key].append(value)
+                self._run[key].append(value)
+        self._maybe_stop_trace()
+        return logs
+
+    def _maybe_start_trace(self):
+        if self.profile_steps and not self._tracing and self._step + 1 == self.profile_steps[0]:
+            tf.profiler.experimental.start(self.profile_dir)
+            self._tracing = True
+
+    def _maybe_stop_trace(self):
+        if self._tracing and self._step >= self.profile_steps[1]:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+            logger.info(f"TF profiler trace of steps {self.profile_steps[0]}-{self.profile_steps[1]} in {self.profile_dir}")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = {"wait": [], "compute": [], "samples": []}
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self._epoch["samples"]:
+            return
+        record = {
+            "epoch": epoch + 1,
+            **step_summary(self._epoch["wait"], self._epoch["compute"], self._epoch["samples"]),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.epochs.append(record)
+        rss = record['peak_rss_mb']
+        logger.info(
+            f"Epoch {epoch + 1}: {record['samples_per_second']:.0f} samples/s, "
+            f"step p50 {record['step_ms']['p50']:.1f} ms / p99 {record['step_ms']['p99']:.1f} ms, "
+            f"input wait {record['input_wait_fraction']:.0%}"
+            + (f", peak RSS {rss:.0f} MB" if rss is not None else "")
+        )
+        self._write()
+
+    def on_train_end(self, logs=None):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+        self.model.train_function = self._train_function
+        self._write()
+
+    def summary(self) -> Dict:
+        """Whole-run statistics and the per-epoch records."""
+        run = self._run
+        return {
+            "total": step_summary(run["wait"], run["compute"], run["samples"]) if run["samples"] else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "epochs": self.epochs,
+        }
+
+    def _write(self):
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)